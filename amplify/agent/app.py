@@ -3,13 +3,66 @@
 # =====================================
 
 from strands import Agent, tool
-from strands.models import BedrockModel
-import httpx
+from strands.models import BedrockModel, CacheConfig
+from strands.models.routing import ModelRouter, RoutingCandidate
+import asyncio
+import boto3
+import contextlib
+import functools
 import os
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from zoneinfo import ZoneInfo
+import threading
 from bedrock_agentcore.runtime import BedrockAgentCoreApp
-from atlassian import Confluence
+from config import env_bool, env_float, env_int
+from confluence_cache import CachedPage, confluence_cache
+from confluence_search import (
+    CONFLUENCE_INDEX_CRAWL_MAX_PAGES,
+    CONFLUENCE_INDEX_CRAWL_SPACES,
+    build_search_cql,
+    crawl_space,
+    open_confluence_index,
+)
+from confluence_format import outline, select_section, slice_text, storage_to_markdown
+from graph_client import (
+    BatchRequest,
+    GraphError,
+    as_pages,
+    build_url,
+    collect_formatted,
+    graph_batch,
+    graph_request,
+    iter_batch_pages,
+    iter_graph_pages,
+    page_size,
+)
+from free_slots import (
+    FREE_SLOTS_MAX_EVENTS,
+    FREE_SLOTS_MAX_SUGGESTIONS,
+    GRAPH_SCHEDULE_BATCH,
+    MAX_RANGE,
+    Availability,
+    Interval,
+    find_slots,
+    graph_datetime,
+    parse_clock,
+    parse_graph_datetime,
+    parse_local_datetime,
+    working_windows,
+)
+from graph_cache import graph_cache
+from graph_delta import GRAPH_DELTA_SYNC, delta_store
+from history import create_conversation_manager
+from model_router import AGENT_MODEL_ROUTING, FAST, ROUTE_KEY, STRONG, RouteStrategy, classify_prompt
+from time_context import AGENT_TIME_CONTEXT, WEEKDAY_JP, resolve_now, with_time_context
+from tool_context import clear_tool_context, set_tool_context, tool_context
+from tool_executor import create_tool_executor
+from resilience import RETRYABLE_STATUS, THROTTLE_STATUS, confluence_backend, graph_backend, parse_retry_after
+from session_store import SessionStore
+from streaming import StreamConverter
+from telemetry import TelemetryHooks, agent_create_span, finish_turn, start_turn
 
 # =====================================
 # 定数
@@ -18,402 +71,843 @@ from atlassian import Confluence
 # AgentCore Runtime 用の API サーバーを作成
 app = BedrockAgentCoreApp()
 
-# Microsoft Graph API のベース URL
-GRAPH_BASE = "https://graph.microsoft.com/v1.0"
-
-# セッションごとの Agent インスタンスをキャッシュ（会話履歴保持用）
+# セッションごとの Agent インスタンスを保持するストア（会話履歴保持用）
 # 同じ microVM 内で保持されるため、同じセッションIDなら履歴が継続する
-_agent_cache: dict[str, Agent] = {}
+# LRU + アイドル TTL で上限を設け、追い出したセッションはディスクに退避して次回復元する
+_session_store = SessionStore.from_env()
+# 追い出したセッションのデルタ同期スナップショットも一緒に捨てる
+_session_store.add_evict_hook(lambda session_id, agent, reason: delta_store.drop_session(session_id))
+
+# Confluence 呼び出し用のスレッドプール
+# atlassian.Confluence は同期 API しかないため、イベントループを止めないように
+# 上限付きのスレッドプールで実行する（Confluence への同時接続数の上限にもなる）
+CONFLUENCE_MAX_WORKERS = env_int("CONFLUENCE_MAX_WORKERS", 8)
+_confluence_executor = ThreadPoolExecutor(
+    max_workers=CONFLUENCE_MAX_WORKERS,
+    thread_name_prefix="confluence",
+)
+# get_confluence_page が 1 回に返す本文の最大文字数（続きは offset で取得する）
+CONFLUENCE_PAGE_MAX_CHARS = env_int("CONFLUENCE_PAGE_MAX_CHARS", 8000)
+
+# 新しいセッションでタスクリストと今日の予定を先読みするか（デフォルトは無効）
+AGENT_PREFETCH = env_bool("AGENT_PREFETCH", False)
+# 先読みの結果を最初のターンのコンテキストに入れるために待つ最大秒数
+AGENT_PREFETCH_WAIT_SEC = env_float("AGENT_PREFETCH_WAIT_SEC", 0.3)
+
+# Confluence ツール（認証情報はプロセス共通なので、初回利用時に 1 度だけ生成して使い回す）
+# None は「まだ生成していない」を表す（Confluence 無効時は空リストがキャッシュされる）
+_confluence_tools: list | None = None
+# ウォームアップのスレッドと最初のリクエストが同時に生成しないようにする
+_confluence_tools_lock = threading.Lock()
+
+# 起動時にモデルのクライアント作成（認証情報の解決）と Bedrock への接続、Confluence ツールの生成を済ませておくか
+AGENT_WARMUP = env_bool("AGENT_WARMUP", True)
 
 
 # =====================================
 # Graph API ツール
 # =====================================
-
-def create_graph_tools(access_token: str, user_timezone: str):
+#
+# ツールはモジュールのトップレベルで 1 度だけ定義し、全セッションで共有する（仕様の生成もプロセスで 1 度）
+# アクセストークン・タイムゾーン・セッションIDは引数ではなく tool_context() から読む
+# → ツールの引数にトークンを入れると、プロンプトに含まれてしまうため（tool_context.py を参照）
+
+# ---------------------------------
+# ツール0: 現在時刻と曜日の取得
+# ---------------------------------
+@tool
+async def get_current_datetime() -> str:
     """
-    Graph API を呼ぶツールを生成する
-
-    なぜ関数でラップするのか？
-    → closure でトークンを保持することで、LLM にトークンを見せない
-    → ツールの引数にトークンを入れると、プロンプトに含まれてしまう
+    現在の日時と曜日を取得します。
+    メッセージの <context> に現在日時が含まれていない場合に呼び出してください。
+    """
+    ctx = tool_context()
+    tz = ZoneInfo(ctx.user_timezone)
+    now = datetime.now(tz)
+    weekday = WEEKDAY_JP[now.weekday()]
+    return f"現在日時: {now.strftime('%Y年%m月%d日')}（{weekday}）{now.strftime('%H:%M:%S')} ({ctx.user_timezone})"
+
+
+# ---------------------------------
+# ツール1: 予定の取得
+# ---------------------------------
+@tool
+async def get_schedule(start_iso: str, end_iso: str) -> str:
+    """
+    指定期間の予定一覧を取得します。
+    start_iso: 開始日時（ISO8601形式、例: 2026-01-15T09:00:00+09:00）
+    end_iso: 終了日時（ISO8601形式、例: 2026-01-15T18:00:00+09:00）
+    """
+    ctx = tool_context()
+    # Graph API: カレンダービューを取得
+    # https://learn.microsoft.com/ja-jp/graph/api/calendar-list-calendarview
+    headers = {
+        # タイムゾーンを指定して、その時間帯で日時を返してもらう
+        "Prefer": f'outlook.timezone="{ctx.user_timezone}"',
+    }
+    params = {
+        "startDateTime": start_iso,
+        "endDateTime": end_iso,
+        # 整形に使うフィールドだけを取得し（本文・参加者などは取らない）、開始日時順に並べてもらう
+        "$select": "subject,start,end",
+        "$orderby": "start/dateTime",
+        "$top": page_size(),
+    }
+
+    def format_event(ev: dict) -> str:
+        start = ev.get("start", {}).get("dateTime", "")
+        end = ev.get("end", {}).get("dateTime", "")
+        subject = ev.get("subject", "(件名なし)")
+        # 表示形式: "- 2026-01-15T09:00〜10:00 会議タイトル"
+        return f"- {start[:16]}〜{end[11:16]} {subject}"
+
+    async def load() -> str:
+        if GRAPH_DELTA_SYNC and ctx.session_id:
+            # デルタ同期: 2 回目以降は変更分だけを取得し、ローカルのスナップショットから回答する
+            # （calendarView/delta は $select / $orderby / $top に対応していないので期間だけを渡す）
+            events = await delta_store.sync(
+                ctx.session_id,
+                ctx.access_token,
+                "/me/calendarView/delta",
+                {"startDateTime": start_iso, "endDateTime": end_iso},
+                headers=headers,
+            )
+            events.sort(key=lambda ev: ev.get("start", {}).get("dateTime", ""))
+            pages = as_pages(events)
+        else:
+            # @odata.nextLink をたどって全ページを取得し、届いたページから順に整形する
+            # 件数・文字数の上限に達したら残りのページは取得しない
+            pages = iter_graph_pages("/me/calendarView", ctx.access_token, headers=headers, params=params)
+        result, truncated = await collect_formatted(pages, format_event)
+
+        if not result:
+            return "指定期間に予定はありません。"
+
+        if truncated:
+            result.append(f"（予定が多いため {len(result)} 件で打ち切りました。期間を絞って再度取得してください）")
+        return "\n".join(result)
+
+    # 同じ引数での呼び出しは短時間キャッシュから返す
+    try:
+        return await graph_cache.get_or_load(ctx.access_token, "/me/calendarView", params, load, headers=headers)
+    except GraphError as e:
+        return f"エラー: {e}"
+
+
+# ---------------------------------
+# ツール1b: 会議の空き枠の検索
+# ---------------------------------
+@tool
+async def find_free_slots(
+    start_iso: str,
+    end_iso: str,
+    duration_minutes: int = 30,
+    attendees: list[str] | None = None,
+    work_start: str = "09:00",
+    work_end: str = "18:00",
+    buffer_minutes: int = 0,
+    include_weekends: bool = False,
+    max_results: int = 5,
+) -> str:
+    """
+    自分と参加者の全員が空いている会議の候補枠を、よい順に返します。
+    会議の日程調整では、get_schedule で予定を一覧して空き時間を探す代わりにこのツールを使ってください。
+    start_iso: 探す期間の開始日時（ISO8601形式、例: 2026-01-15T00:00:00+09:00）
+    end_iso: 探す期間の終了日時（ISO8601形式、例: 2026-01-22T00:00:00+09:00）
+    duration_minutes: 会議の長さ（分）
+    attendees: 参加者のメールアドレスのリスト（省略すると自分の予定だけで探す）
+    work_start: 候補にする時間帯の開始（HH:MM形式、省略時は 09:00）
+    work_end: 候補にする時間帯の終了（HH:MM形式、省略時は 18:00）
+    buffer_minutes: 前後の予定との間に空ける時間（分）
+    include_weekends: 土日も候補にするか
+    max_results: 返す候補の最大数
+    """
+    ctx = tool_context()
+    tz = ZoneInfo(ctx.user_timezone)
+    try:
+        start = parse_local_datetime(start_iso, tz)
+        end = parse_local_datetime(end_iso, tz)
+        day_start = parse_clock(work_start)
+        day_end = parse_clock(work_end)
+    except ValueError as e:
+        return f"エラー: {e}"
+    if duration_minutes <= 0 or buffer_minutes < 0 or max_results <= 0:
+        return "エラー: duration_minutes と max_results は 1 以上、buffer_minutes は 0 以上で指定してください"
+    if day_start >= day_end:
+        return "エラー: work_start は work_end より前の時刻を指定してください"
+    # 予定は日単位に揃えた期間で取得する（時刻を含む引数や現在時刻で期間が変わると、
+    # デルタ同期のスナップショットやキャッシュが毎回別のものになるため）
+    fetch_start = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    fetch_end = end.replace(hour=0, minute=0, second=0, microsecond=0)
+    if fetch_end < end:
+        fetch_end += timedelta(days=1)
+    if fetch_end - fetch_start > MAX_RANGE:
+        return f"エラー: 期間は {MAX_RANGE.days} 日以内で指定してください"
+    # 過ぎた時間は候補にしない（取得する期間はそのままで、候補を探す範囲だけを絞る）
+    start = max(start, datetime.now(tz).replace(second=0, microsecond=0))
+    if start >= end:
+        return "指定期間はすでに過ぎています。"
+
+    emails = list(dict.fromkeys(a.strip() for a in attendees or [] if a and a.strip()))
+    duration = timedelta(minutes=duration_minutes)
+    headers = {"Prefer": f'outlook.timezone="{ctx.user_timezone}"'}
+    # キャッシュのキー（引数がすべて同じ呼び出しだけを共有する）
+    params = {
+        "startDateTime": fetch_start.isoformat(),
+        "endDateTime": fetch_end.isoformat(),
+        "searchFrom": start.isoformat(),
+        "searchTo": end.isoformat(),
+        "attendees": ",".join(emails),
+        "duration": duration_minutes,
+        "workHours": f"{work_start}-{work_end}",
+        "buffer": buffer_minutes,
+        "weekends": include_weekends,
+        "top": max_results,
+    }
+    windows = working_windows(start, end, day_start, day_end, include_weekends)
+
+    async def load_own(availability: Availability) -> list[str]:
+        """自分の予定（開始・終了・状態だけ）"""
+        if GRAPH_DELTA_SYNC and ctx.session_id:
+            # 日単位の期間で同期する（get_schedule を同じ日単位の期間で呼んだ場合は、そのスナップショットを共有する）
+            events = await delta_store.sync(
+                ctx.session_id,
+                ctx.access_token,
+                "/me/calendarView/delta",
+                {"startDateTime": params["startDateTime"], "endDateTime": params["endDateTime"]},
+                headers=headers,
+            )
+            availability.add_events(events, tz)
+            return []
+        view_params = {
+            "startDateTime": params["startDateTime"],
+            "endDateTime": params["endDateTime"],
+            "$select": "start,end,showAs,isCancelled",
+            "$top": page_size(FREE_SLOTS_MAX_EVENTS),
+        }
+        count = 0
+        async for page in iter_graph_pages("/me/calendarView", ctx.access_token, headers=headers, params=view_params):
+            availability.add_events(page, tz)
+            count += len(page)
+            if count >= FREE_SLOTS_MAX_EVENTS:
+                return [f"自分の予定が多いため、最初の {count} 件だけで計算しました。期間を絞ると正確になります"]
+        return []
 
-    Args:
-        access_token: Microsoft Graph API のアクセストークン
-        user_timezone: ユーザーのタイムゾーン（例: Asia/Tokyo）
+    async def load_attendees(availability: Availability) -> tuple[list[str], list[Interval] | None]:
+        """
+        参加者の予定（getSchedule）。使えない場合は findMeetingTimes の提案で代える
 
-    Returns:
-        Strands tools のリスト
+        Returns:
+            (注記, findMeetingTimes の提案の区間。getSchedule で取得できた場合は None)
+        """
+        if not emails:
+            return [], None
+        # https://learn.microsoft.com/ja-jp/graph/api/calendar-getschedule
+        # availabilityView（空き状況の文字列）は使わないので、最も粗い間隔にしてレスポンスを小さくする
+        chunks = [emails[i:i + GRAPH_SCHEDULE_BATCH] for i in range(0, len(emails), GRAPH_SCHEDULE_BATCH)]
+        responses = await asyncio.gather(*[
+            graph_request(
+                "POST",
+                "/me/calendar/getSchedule",
+                ctx.access_token,
+                headers=headers,
+                json={
+                    "schedules": chunk,
+                    "startTime": graph_datetime(fetch_start, ctx.user_timezone),
+                    "endTime": graph_datetime(fetch_end, ctx.user_timezone),
+                    "availabilityViewInterval": 1440,
+                },
+            )
+            for chunk in chunks
+        ])
+        if all(res.status_code == 200 for res in responses):
+            notes = []
+            for res in responses:
+                for schedule in res.json().get("value", []):
+                    if schedule.get("error"):
+                        message = schedule["error"].get("message") or schedule["error"].get("responseCode", "")
+                        notes.append(f"{schedule.get('scheduleId')} の予定は取得できませんでした（{message}）")
+                    else:
+                        availability.add_schedule_items(schedule.get("scheduleItems", []), tz)
+            return notes, None
+
+        # getSchedule が使えない（権限がない・個人アカウントなど）場合は、参加者の空きを考慮した
+        # findMeetingTimes の提案の中から探す
+        # https://learn.microsoft.com/ja-jp/graph/api/user-findmeetingtimes
+        failed = next(res for res in responses if res.status_code != 200)
+        print(f"[FreeSlots] getSchedule failed ({failed.status_code}), falling back to findMeetingTimes")
+        res = await graph_request(
+            "POST",
+            "/me/findMeetingTimes",
+            ctx.access_token,
+            headers=headers,
+            json={
+                "attendees": [{"type": "required", "emailAddress": {"address": email}} for email in emails],
+                "timeConstraint": {
+                    # 勤務時間はこちらで指定した枠で絞るので、Graph 側の勤務時間では絞らない
+                    "activityDomain": "unrestricted",
+                    "timeSlots": [
+                        {"start": graph_datetime(s, ctx.user_timezone), "end": graph_datetime(e, ctx.user_timezone)}
+                        for s, e in windows
+                    ],
+                },
+                "meetingDuration": f"PT{duration_minutes}M",
+                "maxCandidates": FREE_SLOTS_MAX_SUGGESTIONS,
+                "isOrganizerOptional": False,
+                "minimumAttendeePercentage": 100,
+                "returnSuggestionReasons": False,
+            },
+        )
+        if res.status_code != 200:
+            print(f"[FreeSlots] findMeetingTimes failed ({res.status_code}), using own calendar only")
+            return ["参加者の予定を取得できなかったため、自分の予定だけで探しました"], None
+        suggested = []
+        for suggestion in res.json().get("meetingTimeSuggestions", []):
+            slot = suggestion.get("meetingTimeSlot", {})
+            s = parse_graph_datetime(slot.get("start"), tz)
+            e = parse_graph_datetime(slot.get("end"), tz)
+            if s is not None and e is not None and s < e:
+                suggested.append((s, e))
+        return [], suggested
+
+    async def load() -> str:
+        availability = Availability()
+        # 自分の予定と参加者の予定は並列に取得する
+        own_notes, (attendee_notes, suggested) = await asyncio.gather(
+            load_own(availability), load_attendees(availability)
+        )
+        slots = find_slots(
+            availability,
+            start,
+            end,
+            duration,
+            work_start=day_start,
+            work_end=day_end,
+            buffer=timedelta(minutes=buffer_minutes),
+            include_weekends=include_weekends,
+            within=suggested,
+            max_results=max_results,
+        )
+        notes = own_notes + attendee_notes
+        if not slots:
+            lines = ["条件に合う空き枠はありません。期間・時間帯・会議の長さを見直してください。"]
+        else:
+            who = f"自分 + 参加者 {len(emails)} 名" if emails else "自分"
+            days = "毎日" if include_weekends else "平日"
+            buffer_text = f"、前後 {buffer_minutes} 分空ける" if buffer_minutes else ""
+            lines = [f"空き枠の候補（{duration_minutes}分、{who}、{days} {work_start}〜{work_end}{buffer_text}）:"]
+            for rank, slot in enumerate(slots, start=1):
+                # 表示形式: "1. 2026-01-15T10:00〜10:30（木曜日）空き 10:00〜12:00"
+                line = (
+                    f"{rank}. {slot.start.strftime('%Y-%m-%dT%H:%M')}〜{slot.end.strftime('%H:%M')}"
+                    f"（{WEEKDAY_JP[slot.start.weekday()]}）"
+                    f"空き {slot.free_start.strftime('%H:%M')}〜{slot.free_end.strftime('%H:%M')}"
+                )
+                if slot.tentative_minutes:
+                    margin = f"（前後 {buffer_minutes} 分を含む）" if buffer_minutes else ""
+                    line += f"（仮の予定{margin}と {slot.tentative_minutes} 分重なります）"
+                lines.append(line)
+        lines.extend(f"（{note}）" for note in notes)
+        return "\n".join(lines)
+
+    # 同じ引数での呼び出しは短時間キャッシュから返す（create_meeting で無効化する）
+    try:
+        return await graph_cache.get_or_load(ctx.access_token, "/me/calendar/getSchedule", params, load, headers=headers)
+    except GraphError as e:
+        return f"エラー: {e}"
+
+
+# ---------------------------------
+# ツール2: 会議の作成
+# ---------------------------------
+@tool
+async def create_meeting(
+    subject: str,
+    start_iso: str,
+    end_iso: str,
+    attendees: list[str],
+    body: str = ""
+) -> str:
+    """
+    Outlook カレンダーに会議を作成し、参加者に招待を送ります。
+    subject: 会議のタイトル
+    start_iso: 開始日時（ISO8601形式、例: 2026-01-15T10:00:00+09:00）
+    end_iso: 終了日時（ISO8601形式、例: 2026-01-15T10:30:00+09:00）
+    attendees: 参加者のメールアドレスのリスト（例: ["a@example.com", "b@example.com"]）
+    body: 会議の説明（省略可）
     """
+    ctx = tool_context()
+    # Graph API: イベントを作成
+    # https://learn.microsoft.com/ja-jp/graph/api/calendar-post-events
+    # リクエストボディを構築
+    event_body = {
+        "subject": subject,
+        "start": {"dateTime": start_iso, "timeZone": ctx.user_timezone},
+        "end": {"dateTime": end_iso, "timeZone": ctx.user_timezone},
+        # 参加者を「必須出席者」として追加
+        "attendees": [
+            {"emailAddress": {"address": email}, "type": "required"}
+            for email in attendees
+        ],
+    }
+
+    # 説明文があれば追加
+    if body:
+        event_body["body"] = {"contentType": "text", "content": body}
+
+    # HTTP POST リクエスト
+    res = await graph_request("POST", "/me/events", ctx.access_token, json=event_body)
+    if res.status_code not in (200, 201):
+        return f"エラー: {res.status_code} - {res.text}"
+
+    # 予定一覧と空き枠のキャッシュを無効化する
+    graph_cache.invalidate(ctx.access_token, "/me/calendarView")
+    graph_cache.invalidate(ctx.access_token, "/me/calendar/getSchedule")
+
+    created = res.json()
+    return f"会議を作成しました: {created.get('subject')} ({created.get('webLink', '')})"
+
+
+# Agent に登録する Graph API ツール
+GRAPH_TOOLS = [get_current_datetime, get_schedule, find_free_slots, create_meeting]
 
-    # 曜日の日本語マッピング
-    WEEKDAY_JP = ["月曜日", "火曜日", "水曜日", "木曜日", "金曜日", "土曜日", "日曜日"]
 
-    # ---------------------------------
-    # ツール0: 現在時刻と曜日の取得
-    # ---------------------------------
-    @tool
-    def get_current_datetime() -> str:
-        """
-        現在の日時と曜日を取得します。
-        セッションの最初に必ず呼び出してください。
-        """
-        tz = ZoneInfo(user_timezone)
-        now = datetime.now(tz)
-        weekday = WEEKDAY_JP[now.weekday()]
-        return f"現在日時: {now.strftime('%Y年%m月%d日')}（{weekday}）{now.strftime('%H:%M:%S')} ({user_timezone})"
+# =====================================
+# Microsoft To Do API ツール
+# =====================================
 
-    # ---------------------------------
-    # ツール1: 予定の取得
-    # ---------------------------------
-    @tool
-    def get_schedule(start_iso: str, end_iso: str) -> str:
-        """
-        指定期間の予定一覧を取得します。
-        start_iso: 開始日時（ISO8601形式、例: 2026-01-15T09:00:00+09:00）
-        end_iso: 終了日時（ISO8601形式、例: 2026-01-15T18:00:00+09:00）
-        """
-        # Graph API: カレンダービューを取得
-        # https://learn.microsoft.com/ja-jp/graph/api/calendar-list-calendarview
-        url = f"{GRAPH_BASE}/me/calendarView"
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            # タイムゾーンを指定して、その時間帯で日時を返してもらう
-            "Prefer": f'outlook.timezone="{user_timezone}"',
+# 重要度の日本語マッピング
+IMPORTANCE_JP = {"low": "低", "normal": "通常", "high": "高"}
+
+# 取得するタスクのフィールド（format_task で使うものだけ）
+TASK_SELECT = "id,title,status,importance,dueDateTime"
+
+
+def format_task(task: dict) -> str:
+    """タスク 1 件を 1 行に整形する"""
+    title = task.get("title", "(タイトルなし)")
+    task_id = task.get("id", "")
+    status = task.get("status", "notStarted")
+    importance = task.get("importance", "normal")
+    importance_str = IMPORTANCE_JP.get(importance, importance)
+
+    # 期限日時
+    due = task.get("dueDateTime")
+    due_str = ""
+    if due:
+        due_dt = due.get("dateTime", "")[:10]  # YYYY-MM-DD 形式
+        due_str = f" 期限: {due_dt}"
+
+    # ステータスアイコン
+    status_icon = "✓" if status == "completed" else "○"
+
+    return f"{status_icon} {title} [重要度: {importance_str}]{due_str} (ID: {task_id})"
+
+
+def task_list_params(include_completed: bool) -> dict:
+    """タスク一覧取得時のクエリパラメータ"""
+    # 整形に使うフィールドだけを取得する（本文・チェックリストなどは取らない）
+    params = {
+        "$select": TASK_SELECT,
+        "$top": page_size(),
+    }
+
+    # 未完了のみ取得する場合はフィルタを追加
+    if not include_completed:
+        params["$filter"] = "status ne 'completed'"
+    return params
+
+
+def build_task_body(
+    user_timezone: str,
+    title: str,
+    due_date: str = None,
+    importance: str = "normal",
+    body: str = "",
+    reminder_datetime: str = None
+) -> dict:
+    """タスク作成用のリクエストボディを構築する（日時は user_timezone の時刻として登録する）"""
+    task_body = {
+        "title": title,
+        "importance": importance,
+    }
+
+    # 期限日時があれば追加
+    if due_date:
+        task_body["dueDateTime"] = {
+            "dateTime": due_date,
+            "timeZone": user_timezone,
         }
-        params = {"startDateTime": start_iso, "endDateTime": end_iso}
-
-        # HTTP GET リクエスト
-        with httpx.Client() as client:
-            res = client.get(url, headers=headers, params=params)
-            if res.status_code != 200:
-                return f"エラー: {res.status_code} - {res.text}"
-
-            data = res.json()
-            events = data.get("value", [])
-
-            if not events:
-                return "指定期間に予定はありません。"
-
-            # 予定を整形して返す
-            result = []
-            for ev in events:
-                start = ev.get("start", {}).get("dateTime", "")
-                end = ev.get("end", {}).get("dateTime", "")
-                subject = ev.get("subject", "(件名なし)")
-                # 表示形式: "- 2026-01-15T09:00〜10:00 会議タイトル"
-                result.append(f"- {start[:16]}〜{end[11:16]} {subject}")
-            return "\n".join(result)
 
-    # ---------------------------------
-    # ツール2: 会議の作成
-    # ---------------------------------
-    @tool
-    def create_meeting(
-        subject: str,
-        start_iso: str,
-        end_iso: str,
-        attendees: list[str],
-        body: str = ""
-    ) -> str:
-        """
-        Outlook カレンダーに会議を作成し、参加者に招待を送ります。
-        subject: 会議のタイトル
-        start_iso: 開始日時（ISO8601形式、例: 2026-01-15T10:00:00+09:00）
-        end_iso: 終了日時（ISO8601形式、例: 2026-01-15T10:30:00+09:00）
-        attendees: 参加者のメールアドレスのリスト（例: ["a@example.com", "b@example.com"]）
-        body: 会議の説明（省略可）
-        """
-        # Graph API: イベントを作成
-        # https://learn.microsoft.com/ja-jp/graph/api/calendar-post-events
-        url = f"{GRAPH_BASE}/me/events"
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json",
+    # 詳細説明があれば追加
+    if body:
+        task_body["body"] = {
+            "content": body,
+            "contentType": "text",
         }
 
-        # リクエストボディを構築
-        event_body = {
-            "subject": subject,
-            "start": {"dateTime": start_iso, "timeZone": user_timezone},
-            "end": {"dateTime": end_iso, "timeZone": user_timezone},
-            # 参加者を「必須出席者」として追加
-            "attendees": [
-                {"emailAddress": {"address": email}, "type": "required"}
-                for email in attendees
-            ],
+    # リマインダーがあれば追加
+    if reminder_datetime:
+        task_body["reminderDateTime"] = {
+            "dateTime": reminder_datetime,
+            "timeZone": user_timezone,
         }
+        task_body["isReminderOn"] = True
+    return task_body
 
-        # 説明文があれば追加
-        if body:
-            event_body["body"] = {"contentType": "text", "content": body}
 
-        # HTTP POST リクエスト
-        with httpx.Client() as client:
-            res = client.post(url, headers=headers, json=event_body)
-            if res.status_code not in (200, 201):
-                return f"エラー: {res.status_code} - {res.text}"
+# ---------------------------------
+# ツール1: タスクリスト一覧取得
+# ---------------------------------
+@tool
+async def get_task_lists() -> str:
+    """
+    Microsoft To Do のタスクリスト一覧を取得します。
+    タスクを操作する前に、まずこのツールでリストIDを確認してください。
+    """
+    ctx = tool_context()
+    # 整形に使うフィールドだけを取得する
+    params = {"$select": "id,displayName,wellknownListName"}
+
+    async def load() -> str:
+        res = await graph_request("GET", "/me/todo/lists", ctx.access_token, params=params)
+        if res.status_code != 200:
+            raise GraphError(res)
+
+        data = res.json()
+        lists = data.get("value", [])
+
+        if not lists:
+            return "タスクリストがありません。"
+
+        result = []
+        for lst in lists:
+            display_name = lst.get("displayName", "(名前なし)")
+            list_id = lst.get("id", "")
+            # デフォルトリストかどうかを表示
+            wellknown = lst.get("wellknownListName", "")
+            default_mark = " [デフォルト]" if wellknown == "defaultList" else ""
+            result.append(f"- {display_name}{default_mark} (ID: {list_id})")
+        return "タスクリスト一覧:\n" + "\n".join(result)
+
+    # 同じセッション内で何度も呼ばれるので、短時間キャッシュから返す
+    try:
+        return await graph_cache.get_or_load(ctx.access_token, "/me/todo/lists", params, load)
+    except GraphError as e:
+        return f"エラー: {e}"
 
-            created = res.json()
-            return f"会議を作成しました: {created.get('subject')} ({created.get('webLink', '')})"
 
-    # ツールのリストを返す
-    return [get_current_datetime, get_schedule, create_meeting]
+# ---------------------------------
+# ツール2: タスク一覧取得
+# ---------------------------------
+@tool
+async def get_tasks(list_id: str, include_completed: bool = False) -> str:
+    """
+    指定したタスクリスト内のタスク一覧を取得します。
+    list_id: タスクリストID（get_task_lists で取得）
+    include_completed: 完了済みタスクも含めるか（デフォルト: False）
+    """
+    ctx = tool_context()
+    params = task_list_params(include_completed)
+    path = f"/me/todo/lists/{list_id}/tasks"
+
+    async def load() -> str:
+        if GRAPH_DELTA_SYNC and ctx.session_id:
+            # デルタ同期: 2 回目以降は変更分だけを取得し、ローカルのスナップショットから回答する
+            # スナップショットは完了済みも含めて持ち、未完了だけが必要ならローカルで絞り込む
+            tasks = await delta_store.sync(ctx.session_id, ctx.access_token, f"{path}/delta")
+            if not include_completed:
+                tasks = [task for task in tasks if task.get("status") != "completed"]
+            pages = as_pages(tasks)
+        else:
+            # @odata.nextLink をたどって全ページを取得し、届いたページから順に整形する
+            pages = iter_graph_pages(path, ctx.access_token, params=params)
+        result, truncated = await collect_formatted(pages, format_task)
+
+        if not result:
+            return "タスクがありません。"
+
+        if truncated:
+            result.append(f"（タスクが多いため {len(result)} 件で打ち切りました）")
+        return "タスク一覧:\n" + "\n".join(result)
+
+    # 同じ引数での呼び出しは短時間キャッシュから返す
+    try:
+        return await graph_cache.get_or_load(ctx.access_token, path, params, load)
+    except GraphError as e:
+        return f"エラー: {e}"
+
+
+# ---------------------------------
+# ツール3: タスク作成
+# ---------------------------------
+@tool
+async def create_task(
+    list_id: str,
+    title: str,
+    due_date: str = None,
+    importance: str = "normal",
+    body: str = "",
+    reminder_datetime: str = None
+) -> str:
+    """
+    新しいタスクを作成します。
+    list_id: タスクリストID（get_task_lists で取得）
+    title: タスクのタイトル（必須）
+    due_date: 期限日時（ISO8601形式、例: 2026-01-20T17:00:00+09:00、省略可）
+    importance: 重要度（low/normal/high、デフォルト: normal）
+    body: 詳細説明（省略可）
+    reminder_datetime: リマインダー日時（ISO8601形式、省略可）
+    """
+    ctx = tool_context()
+    # リクエストボディを構築
+    task_body = build_task_body(ctx.user_timezone, title, due_date, importance, body, reminder_datetime)
 
+    res = await graph_request("POST", f"/me/todo/lists/{list_id}/tasks", ctx.access_token, json=task_body)
+    if res.status_code not in (200, 201):
+        return f"エラー: {res.status_code} - {res.text}"
 
-# =====================================
-# Microsoft To Do API ツール
-# =====================================
+    # タスク一覧のキャッシュを無効化する
+    graph_cache.invalidate(ctx.access_token, f"/me/todo/lists/{list_id}/tasks")
 
-def create_todo_tools(access_token: str, user_timezone: str):
-    """
-    Microsoft To Do API を呼ぶツールを生成する
+    created = res.json()
+    return f"タスクを作成しました: {created.get('title')} (ID: {created.get('id')})"
 
-    Args:
-        access_token: Microsoft Graph API のアクセストークン
-        user_timezone: ユーザーのタイムゾーン（例: Asia/Tokyo）
 
-    Returns:
-        Strands tools のリスト
+# ---------------------------------
+# ツール3b: タスクの一括作成（JSON バッチ）
+# ---------------------------------
+@tool
+async def create_tasks(list_id: str, tasks: list[dict]) -> str:
+    """
+    複数のタスクを 1 回でまとめて作成します。2 件以上作成するときは create_task を繰り返さずこちらを使ってください。
+    list_id: タスクリストID（get_task_lists で取得）
+    tasks: 作成するタスクのリスト。各要素は create_task と同じキーを持つ辞書
+           （title は必須、due_date / importance / body / reminder_datetime は省略可）
+           例: [{"title": "資料作成", "due_date": "2026-01-20T17:00:00+09:00"}, {"title": "経費精算"}]
+    """
+    ctx = tool_context()
+    if not tasks:
+        return "作成するタスクが指定されていません。"
+
+    batch_requests = []
+    for i, task in enumerate(tasks):
+        if not task.get("title"):
+            return f"エラー: {i + 1} 件目のタスクに title がありません"
+        batch_requests.append(BatchRequest(
+            id=str(i),
+            method="POST",
+            url=f"/me/todo/lists/{list_id}/tasks",
+            body=build_task_body(
+                ctx.user_timezone,
+                task["title"],
+                task.get("due_date"),
+                task.get("importance", "normal"),
+                task.get("body", ""),
+                task.get("reminder_datetime"),
+            ),
+        ))
+
+    # 20 件ずつの /$batch にまとめて送る
+    try:
+        responses = await graph_batch(ctx.access_token, batch_requests)
+    except GraphError as e:
+        return f"エラー: {e}"
+
+    graph_cache.invalidate(ctx.access_token, f"/me/todo/lists/{list_id}/tasks")
+
+    # 1 件ずつ成否を報告する
+    result = []
+    succeeded = 0
+    for i, task in enumerate(tasks):
+        resp = responses.get(str(i))
+        if resp is not None and resp.ok:
+            succeeded += 1
+            result.append(f"✓ {resp.body.get('title')} (ID: {resp.body.get('id')})")
+        else:
+            error = resp.error_message if resp is not None else "レスポンスがありません"
+            result.append(f"✗ {task['title']} - エラー: {error}")
+    return f"タスクを作成しました ({succeeded}/{len(tasks)}件成功):\n" + "\n".join(result)
+
+
+# ---------------------------------
+# ツール3c: 複数リストのタスク一覧取得（JSON バッチ）
+# ---------------------------------
+@tool
+async def get_tasks_for_lists(list_ids: list[str], include_completed: bool = False) -> str:
+    """
+    複数のタスクリストのタスク一覧を 1 回でまとめて取得します。2 つ以上のリストを確認するときはこちらを使ってください。
+    list_ids: タスクリストIDのリスト（get_task_lists で取得）
+    include_completed: 完了済みタスクも含めるか（デフォルト: False）
     """
+    ctx = tool_context()
+    if not list_ids:
+        return "タスクリストIDが指定されていません。"
 
-    # ---------------------------------
-    # ツール1: タスクリスト一覧取得
-    # ---------------------------------
-    @tool
-    def get_task_lists() -> str:
-        """
-        Microsoft To Do のタスクリスト一覧を取得します。
-        タスクを操作する前に、まずこのツールでリストIDを確認してください。
-        """
-        url = f"{GRAPH_BASE}/me/todo/lists"
-        headers = {"Authorization": f"Bearer {access_token}"}
-
-        with httpx.Client() as client:
-            res = client.get(url, headers=headers)
-            if res.status_code != 200:
-                return f"エラー: {res.status_code} - {res.text}"
-
-            data = res.json()
-            lists = data.get("value", [])
-
-            if not lists:
-                return "タスクリストがありません。"
-
-            result = []
-            for lst in lists:
-                display_name = lst.get("displayName", "(名前なし)")
-                list_id = lst.get("id", "")
-                # デフォルトリストかどうかを表示
-                wellknown = lst.get("wellknownListName", "")
-                default_mark = " [デフォルト]" if wellknown == "defaultList" else ""
-                result.append(f"- {display_name}{default_mark} (ID: {list_id})")
-            return "タスクリスト一覧:\n" + "\n".join(result)
+    params = task_list_params(include_completed)
+    batch_requests = [
+        BatchRequest(id=str(i), method="GET", url=build_url(f"/me/todo/lists/{list_id}/tasks", params))
+        for i, list_id in enumerate(list_ids)
+    ]
 
-    # ---------------------------------
-    # ツール2: タスク一覧取得
-    # ---------------------------------
-    @tool
-    def get_tasks(list_id: str, include_completed: bool = False) -> str:
-        """
-        指定したタスクリスト内のタスク一覧を取得します。
-        list_id: タスクリストID（get_task_lists で取得）
-        include_completed: 完了済みタスクも含めるか（デフォルト: False）
-        """
-        url = f"{GRAPH_BASE}/me/todo/lists/{list_id}/tasks"
-        headers = {"Authorization": f"Bearer {access_token}"}
-        params = {}
+    try:
+        responses = await graph_batch(ctx.access_token, batch_requests)
+    except GraphError as e:
+        return f"エラー: {e}"
+
+    # リストごとに整形する（続きのページがあれば @odata.nextLink をたどる）
+    sections = []
+    for i, list_id in enumerate(list_ids):
+        resp = responses.get(str(i))
+        if resp is None or not resp.ok:
+            error = resp.error_message if resp is not None else "レスポンスがありません"
+            sections.append(f"## リスト {list_id}\nエラー: {error}")
+            continue
 
-        # 未完了のみ取得する場合はフィルタを追加
-        if not include_completed:
-            params["$filter"] = "status ne 'completed'"
+        try:
+            lines, truncated = await collect_formatted(iter_batch_pages(resp, ctx.access_token), format_task)
+        except GraphError as e:
+            sections.append(f"## リスト {list_id}\nエラー: {e}")
+            continue
+
+        if not lines:
+            lines = ["タスクがありません。"]
+        if truncated:
+            lines.append(f"（タスクが多いため {len(lines)} 件で打ち切りました）")
+        sections.append(f"## リスト {list_id}\n" + "\n".join(lines))
+    return "タスク一覧:\n" + "\n\n".join(sections)
+
+
+# ---------------------------------
+# ツール4: タスク更新
+# ---------------------------------
+@tool
+async def update_task(
+    list_id: str,
+    task_id: str,
+    title: str = None,
+    due_date: str = None,
+    importance: str = None,
+    body: str = None
+) -> str:
+    """
+    既存のタスクを更新します。
+    list_id: タスクリストID
+    task_id: タスクID（get_tasks で取得）
+    title: 新しいタイトル（省略時は変更なし）
+    due_date: 新しい期限（ISO8601形式、省略時は変更なし）
+    importance: 新しい重要度（low/normal/high、省略時は変更なし）
+    body: 新しい詳細説明（省略時は変更なし）
+    """
+    ctx = tool_context()
+    # 変更するフィールドのみを含むボディを構築
+    task_body = {}
+    if title is not None:
+        task_body["title"] = title
+    if importance is not None:
+        task_body["importance"] = importance
+    if due_date is not None:
+        task_body["dueDateTime"] = {
+            "dateTime": due_date,
+            "timeZone": ctx.user_timezone,
+        }
+    if body is not None:
+        task_body["body"] = {
+            "content": body,
+            "contentType": "text",
+        }
 
-        with httpx.Client() as client:
-            res = client.get(url, headers=headers, params=params)
-            if res.status_code != 200:
-                return f"エラー: {res.status_code} - {res.text}"
+    if not task_body:
+        return "更新する項目が指定されていません。"
 
-            data = res.json()
-            tasks = data.get("value", [])
+    res = await graph_request("PATCH", f"/me/todo/lists/{list_id}/tasks/{task_id}", ctx.access_token, json=task_body)
+    if res.status_code != 200:
+        return f"エラー: {res.status_code} - {res.text}"
 
-            if not tasks:
-                return "タスクがありません。"
+    graph_cache.invalidate(ctx.access_token, f"/me/todo/lists/{list_id}/tasks")
 
-            # 重要度の日本語マッピング
-            importance_jp = {"low": "低", "normal": "通常", "high": "高"}
+    updated = res.json()
+    return f"タスクを更新しました: {updated.get('title')}"
 
-            result = []
-            for task in tasks:
-                title = task.get("title", "(タイトルなし)")
-                task_id = task.get("id", "")
-                status = task.get("status", "notStarted")
-                importance = task.get("importance", "normal")
-                importance_str = importance_jp.get(importance, importance)
 
-                # 期限日時
-                due = task.get("dueDateTime")
-                due_str = ""
-                if due:
-                    due_dt = due.get("dateTime", "")[:10]  # YYYY-MM-DD 形式
-                    due_str = f" 期限: {due_dt}"
+# ---------------------------------
+# ツール5: タスク完了
+# ---------------------------------
+@tool
+async def complete_task(list_id: str, task_id: str) -> str:
+    """
+    タスクを完了状態にします。
+    list_id: タスクリストID
+    task_id: タスクID（get_tasks で取得）
+    """
+    ctx = tool_context()
+    task_body = {"status": "completed"}
 
-                # ステータスアイコン
-                status_icon = "✓" if status == "completed" else "○"
+    res = await graph_request("PATCH", f"/me/todo/lists/{list_id}/tasks/{task_id}", ctx.access_token, json=task_body)
+    if res.status_code != 200:
+        return f"エラー: {res.status_code} - {res.text}"
 
-                result.append(f"{status_icon} {title} [重要度: {importance_str}]{due_str} (ID: {task_id})")
-            return "タスク一覧:\n" + "\n".join(result)
+    graph_cache.invalidate(ctx.access_token, f"/me/todo/lists/{list_id}/tasks")
 
-    # ---------------------------------
-    # ツール3: タスク作成
-    # ---------------------------------
-    @tool
-    def create_task(
-        list_id: str,
-        title: str,
-        due_date: str = None,
-        importance: str = "normal",
-        body: str = "",
-        reminder_datetime: str = None
-    ) -> str:
-        """
-        新しいタスクを作成します。
-        list_id: タスクリストID（get_task_lists で取得）
-        title: タスクのタイトル（必須）
-        due_date: 期限日時（ISO8601形式、例: 2026-01-20T17:00:00+09:00、省略可）
-        importance: 重要度（low/normal/high、デフォルト: normal）
-        body: 詳細説明（省略可）
-        reminder_datetime: リマインダー日時（ISO8601形式、省略可）
-        """
-        url = f"{GRAPH_BASE}/me/todo/lists/{list_id}/tasks"
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json",
-        }
+    updated = res.json()
+    return f"タスクを完了にしました: {updated.get('title')}"
 
-        # リクエストボディを構築
-        task_body = {
-            "title": title,
-            "importance": importance,
-        }
 
-        # 期限日時があれば追加
-        if due_date:
-            task_body["dueDateTime"] = {
-                "dateTime": due_date,
-                "timeZone": user_timezone,
-            }
-
-        # 詳細説明があれば追加
-        if body:
-            task_body["body"] = {
-                "content": body,
-                "contentType": "text",
-            }
-
-        # リマインダーがあれば追加
-        if reminder_datetime:
-            task_body["reminderDateTime"] = {
-                "dateTime": reminder_datetime,
-                "timeZone": user_timezone,
-            }
-            task_body["isReminderOn"] = True
-
-        with httpx.Client() as client:
-            res = client.post(url, headers=headers, json=task_body)
-            if res.status_code not in (200, 201):
-                return f"エラー: {res.status_code} - {res.text}"
-
-            created = res.json()
-            return f"タスクを作成しました: {created.get('title')} (ID: {created.get('id')})"
+# Agent に登録する To Do ツール
+TODO_TOOLS = [
+    get_task_lists,
+    get_tasks,
+    get_tasks_for_lists,
+    create_task,
+    create_tasks,
+    update_task,
+    complete_task,
+]
 
-    # ---------------------------------
-    # ツール4: タスク更新
-    # ---------------------------------
-    @tool
-    def update_task(
-        list_id: str,
-        task_id: str,
-        title: str = None,
-        due_date: str = None,
-        importance: str = None,
-        body: str = None
-    ) -> str:
-        """
-        既存のタスクを更新します。
-        list_id: タスクリストID
-        task_id: タスクID（get_tasks で取得）
-        title: 新しいタイトル（省略時は変更なし）
-        due_date: 新しい期限（ISO8601形式、省略時は変更なし）
-        importance: 新しい重要度（low/normal/high、省略時は変更なし）
-        body: 新しい詳細説明（省略時は変更なし）
-        """
-        url = f"{GRAPH_BASE}/me/todo/lists/{list_id}/tasks/{task_id}"
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json",
-        }
 
-        # 変更するフィールドのみを含むボディを構築
-        task_body = {}
-        if title is not None:
-            task_body["title"] = title
-        if importance is not None:
-            task_body["importance"] = importance
-        if due_date is not None:
-            task_body["dueDateTime"] = {
-                "dateTime": due_date,
-                "timeZone": user_timezone,
-            }
-        if body is not None:
-            task_body["body"] = {
-                "content": body,
-                "contentType": "text",
-            }
-
-        if not task_body:
-            return "更新する項目が指定されていません。"
-
-        with httpx.Client() as client:
-            res = client.patch(url, headers=headers, json=task_body)
-            if res.status_code != 200:
-                return f"エラー: {res.status_code} - {res.text}"
-
-            updated = res.json()
-            return f"タスクを更新しました: {updated.get('title')}"
+# =====================================
+# Confluence API ツール
+# =====================================
 
-    # ---------------------------------
-    # ツール5: タスク完了
-    # ---------------------------------
-    @tool
-    def complete_task(list_id: str, task_id: str) -> str:
-        """
-        タスクを完了状態にします。
-        list_id: タスクリストID
-        task_id: タスクID（get_tasks で取得）
-        """
-        url = f"{GRAPH_BASE}/me/todo/lists/{list_id}/tasks/{task_id}"
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json",
-        }
+async def run_confluence(func, *args, idempotent: bool = True, **kwargs):
+    """
+    同期の Confluence API 呼び出しをスレッドプールで実行する
 
-        task_body = {"status": "completed"}
+    ツールは async 関数なので、ここで await しても他のセッションのストリーミングは止まらない
+    スロットリング（429）や一時的なエラーは共通の耐障害レイヤーでリトライする
 
-        with httpx.Client() as client:
-            res = client.patch(url, headers=headers, json=task_body)
-            if res.status_code != 200:
-                return f"エラー: {res.status_code} - {res.text}"
+    Args:
+        func: 呼び出す関数（例: confluence.get_page_by_id）
+        *args, **kwargs: func に渡す引数
+        idempotent: 冪等な呼び出しか（False ならタイムアウトなど送信後の失敗や 502 / 504 ではリトライしない）
 
-            updated = res.json()
-            return f"タスクを完了にしました: {updated.get('title')}"
+    Returns:
+        func の戻り値
+    """
+    # create_confluence_tools で読み込み済み（ツールが無ければここには来ない）
+    import requests
 
-    # ツールのリストを返す
-    return [get_task_lists, get_tasks, create_task, update_task, complete_task]
+    loop = asyncio.get_running_loop()
 
+    def classify(result, error) -> tuple[bool, float | None]:
+        if error is None:
+            return False, None
+        response = getattr(error, "response", None)
+        if response is not None:
+            # 冪等でない呼び出し（ページ作成）は、処理されていないことが分かるスロットリングだけをリトライする
+            if response.status_code in (RETRYABLE_STATUS if idempotent else THROTTLE_STATUS):
+                return True, parse_retry_after(response.headers.get("Retry-After"))
+            return False, None
+        # 接続できなかった場合は送信されていないので、常にリトライしてよい
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True, None
+        return idempotent and isinstance(error, (requests.ConnectionError, requests.Timeout)), None
+
+    async def call():
+        return await loop.run_in_executor(_confluence_executor, functools.partial(func, *args, **kwargs))
+
+    return await confluence_backend.call(call, classify)
 
-# =====================================
-# Confluence API ツール
-# =====================================
 
 def create_confluence_tools():
     """
@@ -442,35 +936,138 @@ def create_confluence_tools():
         print("[Confluence] 環境変数が未設定のため、Confluence機能は無効です")
         return []
 
+    # atlassian（と requests / bs4）の import は重いので、Confluence を使う場合にだけ読み込む
+    from atlassian import Confluence
+    import requests
+    from requests.adapters import HTTPAdapter
+
     # Confluence クライアントを作成
+    # スレッドプールの全ワーカーが同時に接続を使えるよう、接続プールの上限を合わせる
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_maxsize=CONFLUENCE_MAX_WORKERS))
     confluence = Confluence(
         url=confluence_url,
         username=confluence_email,
         password=confluence_token,
-        cloud=True
+        cloud=True,
+        session=session
     )
+    # atlassian-python-api 5 以降の cloud=True のクライアントは v2 API 用で、以下で使う v1 のメソッドが無い
+    # （requirements.txt で 5 未満に固定している。ツールの呼び出しごとに AttributeError にせず、ここで無効化する）
+    missing = [name for name in ("get_page_by_id", "cql", "create_page", "update_page") if not hasattr(confluence, name)]
+    if missing:
+        print(
+            f"[Confluence] ERROR: クライアントに {', '.join(missing)} が無いため、Confluence機能を無効にします"
+            "（atlassian-python-api のバージョンを requirements.txt に合わせてください）"
+        )
+        return []
     print(f"[Confluence] 接続先: {confluence_url}")
     if default_space_key:
         print(f"[Confluence] デフォルトスペースキー: {default_space_key}")
 
+    # ローカル全文索引（無効なら None で、検索は常にリモートの CQL）
+    index = open_confluence_index()
+    if index is not None and CONFLUENCE_INDEX_CRAWL_SPACES:
+        def crawl():
+            for space in CONFLUENCE_INDEX_CRAWL_SPACES:
+                try:
+                    count = crawl_space(confluence, index, space, storage_to_markdown, CONFLUENCE_INDEX_CRAWL_MAX_PAGES)
+                    print(f"[ConfluenceIndex] クロール完了: {space} ({count} ページを登録)")
+                except Exception as e:
+                    print(f"[ConfluenceIndex] クロールに失敗しました: {space} - {e}")
+
+        # リクエストを待たせないよう、スレッドプールでバックグラウンドに実行する
+        _confluence_executor.submit(crawl)
+
+    # ---------------------------------
+    # ページ本文の取得（ローカルキャッシュ付き）
+    # ---------------------------------
+    async def load_page_text(page_id: str) -> CachedPage:
+        """
+        ページを変換済みのテキストで取得する
+
+        キャッシュがあればバージョンだけを取得し、一致すれば本文をダウンロードせずにキャッシュから返す
+        """
+        # キャッシュはディスクを読み書きするので、イベントループを塞がないようスレッドで実行する
+        cached = await asyncio.to_thread(confluence_cache.get, page_id)
+        if cached is not None:
+            meta = await run_confluence(confluence.get_page_by_id, page_id, expand="version")
+            fresh = meta.get("version", {}).get("number") == cached.version
+            confluence_cache.record_hit(fresh)
+            if fresh:
+                return cached
+
+        page = await run_confluence(
+            confluence.get_page_by_id,
+            page_id,
+            expand="body.storage,version,space"
+        )
+        loaded = CachedPage(
+            page_id=page_id,
+            version=page.get("version", {}).get("number", 0),
+            title=page.get("title", "(タイトルなし)"),
+            text=storage_to_markdown(page.get("body", {}).get("storage", {}).get("value", "")),
+        )
+        await asyncio.to_thread(confluence_cache.put, loaded)
+        if index is not None:
+            # SQLite の書き込みはクロール中のスレッドとロックを取り合うので、同じくスレッドで実行する
+            await asyncio.to_thread(
+                index.upsert, page_id, loaded.version, loaded.title, loaded.text, page.get("space", {}).get("key", "")
+            )
+        return loaded
+
     # ---------------------------------
     # ツール1: ページ取得
     # ---------------------------------
     @tool
-    def get_confluence_page(page_id: str) -> str:
+    async def get_confluence_page(
+        page_id: str,
+        section: str = None,
+        offset: int = 0,
+        max_chars: int = CONFLUENCE_PAGE_MAX_CHARS,
+        raw: bool = False
+    ) -> str:
         """
-        Confluenceページの内容を取得します。
+        Confluenceページの内容を取得します（本文は読みやすいテキストに変換して返します）。
         page_id: ページID（URLの末尾の数字、例: 123456789）
+        section: 見出しを指定すると、そのセクションだけを返します（部分一致）
+        offset: 本文の何文字目から返すか（長いページの続きを読むときに指定）
+        max_chars: 1回に返す最大文字数（0 以下の場合は既定値）
+        raw: True の場合、変換前のストレージ形式（HTML）を全文返します（ページを更新するときに使用）
         """
         try:
-            page = confluence.get_page_by_id(
-                page_id,
-                expand="body.storage,version"
-            )
-            title = page.get("title", "(タイトルなし)")
-            body = page.get("body", {}).get("storage", {}).get("value", "")
-            version = page.get("version", {}).get("number", "?")
-            return f"# {title}\n\nバージョン: {version}\n\n{body}"
+            # 更新用には元の HTML が必要なので、変換も分割もキャッシュもしない
+            if raw:
+                page = await run_confluence(
+                    confluence.get_page_by_id,
+                    page_id,
+                    expand="body.storage,version"
+                )
+                title = page.get("title", "(タイトルなし)")
+                body = page.get("body", {}).get("storage", {}).get("value", "")
+                version = page.get("version", {}).get("number", "?")
+                return f"# {title}\n\nバージョン: {version}\n\n{body}"
+
+            cached = await load_page_text(page_id)
+            header = f"# {cached.title}\n\nバージョン: {cached.version}\n\n"
+            text = cached.text
+            if section:
+                selected = select_section(text, section)
+                if selected is None:
+                    return header + f"見出し「{section}」が見つかりませんでした。見出し一覧:\n{outline(text)}"
+                text = selected
+
+            # slice_text は 0 以下を「上限なし」と扱うので、モデルが 0 や負の値を渡しても全文を返さない
+            if max_chars <= 0:
+                max_chars = CONFLUENCE_PAGE_MAX_CHARS
+            chunk, next_offset = slice_text(text, offset, max_chars)
+            if next_offset is None:
+                return header + chunk
+            note = f"\n\n（{offset}〜{next_offset} 文字目 / 全 {len(text)} 文字。続きは offset={next_offset} で取得できます）"
+            # 初回は見出し一覧も付けて、必要なセクションだけ読めるようにする
+            if offset == 0 and not section:
+                note += f"\n見出し一覧:\n{outline(text)}"
+            return header + chunk + note
         except Exception as e:
             return f"エラー: ページの取得に失敗しました - {str(e)}"
 
@@ -478,35 +1075,62 @@ def create_confluence_tools():
     # ツール2: 検索
     # ---------------------------------
     @tool
-    def search_confluence(query: str, space_key: str = None, limit: int = 10) -> str:
+    async def search_confluence(query: str, space_key: str = None, limit: int = 10, remote: bool = False) -> str:
         """
         Confluenceでコンテンツを検索します。
-        query: 検索キーワード
+        query: 検索キーワード（空白区切りで複数指定すると全てを含むページ）
         space_key: スペースキーで絞り込み（省略時は全スペース）
         limit: 取得件数（デフォルト10件）
+        remote: True の場合、ローカル索引を使わずに Confluence 全体を検索します
         """
         try:
-            # CQL クエリを構築
-            cql = f'text ~ "{query}"'
-            if space_key:
-                cql += f' AND space = "{space_key}"'
-
-            results = confluence.cql(cql, limit=limit)
+            # ローカル索引は取得・クロール済みのページだけなので、limit 件に満たなければリモートの結果で補う
+            hits = []
+            if index is not None and not remote:
+                hits = await asyncio.to_thread(index.search, query, space_key, limit)
+                await asyncio.to_thread(index.log_stats)
+            output = [
+                f"- [{hit.title}] (ID: {hit.page_id}, スペース: {hit.space})\n  {hit.snippet}"
+                for hit in hits
+            ]
+            if len(hits) >= limit:
+                return f"検索結果 ({len(hits)}件、ローカル索引):\n" + "\n".join(output)
+
+            # CQL クエリを構築（値はエスケープして埋め込む）
+            cql = build_search_cql(query, space_key)
+
+            try:
+                results = await run_confluence(confluence.cql, cql, limit=limit)
+            except Exception as e:
+                if not hits:
+                    raise
+                # リモートに届かなくても、ローカル索引で見つかった分は返す
+                print(f"[ConfluenceIndex] リモート検索に失敗したため、ローカル索引の結果のみ返します: {e}")
+                return (
+                    f"検索結果 ({len(hits)}件、ローカル索引のみ):\n" + "\n".join(output)
+                    + "\n（リモート検索に失敗したため、取得済みのページだけが対象です）"
+                )
             items = results.get("results", [])
 
-            if not items:
-                return "検索結果が見つかりませんでした。"
-
-            # 結果を整形
-            output = []
+            # ローカル索引の結果（スニペット付き）を先に、リモートの結果は重複を除いて後ろに並べる
+            seen = {hit.page_id for hit in hits}
             for item in items:
+                if len(output) >= limit:
+                    break
                 content = item.get("content", {})
-                title = content.get("title", "(タイトルなし)")
                 page_id = content.get("id", "")
+                if page_id in seen:
+                    continue
+                seen.add(page_id)
+                title = content.get("title", "(タイトルなし)")
                 space = item.get("resultGlobalContainer", {}).get("title", "")
                 output.append(f"- [{title}] (ID: {page_id}, スペース: {space})")
 
-            return f"検索結果 ({len(items)}件):\n" + "\n".join(output)
+            if not output:
+                return "検索結果が見つかりませんでした。"
+            if hits:
+                return f"検索結果 ({len(output)}件、うちローカル索引 {len(hits)}件):\n" + "\n".join(output)
+            return f"検索結果 ({len(output)}件):\n" + "\n".join(output)
         except Exception as e:
             return f"エラー: 検索に失敗しました - {str(e)}"
 
@@ -514,7 +1138,7 @@ def create_confluence_tools():
     # ツール3: ページ作成
     # ---------------------------------
     @tool
-    def create_confluence_page(
+    async def create_confluence_page(
         title: str,
         body: str,
         space_key: str = None,
@@ -533,13 +1157,26 @@ def create_confluence_tools():
             return "エラー: スペースキーが指定されておらず、デフォルトスペースキーも設定されていません"
 
         try:
-            page = confluence.create_page(
+            page = await run_confluence(
+                confluence.create_page,
+                idempotent=False,
                 space=target_space,
                 title=title,
                 body=body,
                 parent_id=parent_id
             )
             page_id = page.get("id", "")
+            # 書き込んだ内容でキャッシュしておき、直後の取得で本文をダウンロードし直さない
+            if page_id:
+                created = CachedPage(
+                    page_id=page_id,
+                    version=page.get("version", {}).get("number", 1),
+                    title=title,
+                    text=storage_to_markdown(body),
+                )
+                await asyncio.to_thread(confluence_cache.put, created)
+                if index is not None:
+                    await asyncio.to_thread(index.upsert, page_id, created.version, title, created.text, target_space)
             page_url = f"{confluence_url}/wiki/spaces/{target_space}/pages/{page_id}"
             return f"ページを作成しました: {title} (ID: {page_id})\nURL: {page_url}"
         except Exception as e:
@@ -549,20 +1186,31 @@ def create_confluence_tools():
     # ツール4: ページ更新
     # ---------------------------------
     @tool
-    def update_confluence_page(page_id: str, title: str, body: str) -> str:
+    async def update_confluence_page(page_id: str, title: str, body: str) -> str:
         """
         既存のConfluenceページを更新します。
         page_id: ページID
         title: 新しいタイトル
-        body: 新しい本文（HTML形式）
+        body: 新しい本文（HTML形式）。既存の本文を編集する場合は get_confluence_page を raw=True で取得してください
         """
         try:
-            page = confluence.update_page(
+            page = await run_confluence(
+                confluence.update_page,
                 page_id=page_id,
                 title=title,
                 body=body
             )
             version = page.get("version", {}).get("number", "?")
+            # 書き込んだ内容でキャッシュを更新する（バージョンが分からなければ捨てる）
+            if isinstance(version, int):
+                updated = CachedPage(page_id=page_id, version=version, title=title, text=storage_to_markdown(body))
+                await asyncio.to_thread(confluence_cache.put, updated)
+                if index is not None:
+                    await asyncio.to_thread(index.upsert, page_id, version, title, updated.text)
+            else:
+                await asyncio.to_thread(confluence_cache.invalidate, page_id)
+                if index is not None:
+                    await asyncio.to_thread(index.remove, page_id)
             return f"ページを更新しました: {title} (Version: {version})"
         except Exception as e:
             return f"エラー: ページの更新に失敗しました - {str(e)}"
@@ -571,59 +1219,210 @@ def create_confluence_tools():
     return [get_confluence_page, search_confluence, create_confluence_page, update_confluence_page]
 
 
+def get_confluence_tools():
+    """
+    Confluence ツールを取得する（初回呼び出し時のみ生成）
+
+    クライアント（requests.Session と接続プール）は microVM の寿命の間使い回すので、
+    2 回目以降のリクエストでは環境変数の読み込みやセッション作成が発生しない
+
+    Returns:
+        Strands tools のリスト（環境変数未設定時は空リスト）
+    """
+    global _confluence_tools
+
+    if _confluence_tools is None:
+        with _confluence_tools_lock:
+            if _confluence_tools is None:
+                started = time.perf_counter()
+                _confluence_tools = create_confluence_tools()
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                print(f"[Confluence] ツールを初期化しました ({elapsed_ms:.1f} ms、以降のリクエストでは再利用)")
+    return _confluence_tools
+
+
 # =====================================
-# ストリーミングイベント変換
+# モデル
 # =====================================
 
-def convert_event(event) -> dict | None:
+# Bedrock の Claude モデルを使用
+# 高性能モデル（複数手順の計画や Confluence の編集。振り分けが無効なら常にこちら）
+BEDROCK_MODEL_ID = "us.anthropic.claude-sonnet-4-5-20250929-v1:0"
+# 高速モデル（ツール 1 回で済む単純な依頼。model_router.py で振り分ける）
+BEDROCK_FAST_MODEL_ID = os.environ.get("BEDROCK_FAST_MODEL_ID", "us.anthropic.claude-haiku-4-5-20251001-v1:0")
+BEDROCK_REGION = "us-east-1"
+
+# Bedrock のプロンプトキャッシュを使うか
+# システムプロンプト・ツール定義の末尾と、最後のユーザーメッセージの末尾にキャッシュポイントを置く
+# （同じ Agent の次のモデル呼び出し・次のターンでは、前回までの履歴がキャッシュから読まれる）
+AGENT_PROMPT_CACHE = env_bool("AGENT_PROMPT_CACHE", True)
+# キャッシュの TTL（"5m" / "1h"。空なら Bedrock のデフォルトの 5 分）
+AGENT_PROMPT_CACHE_TTL = os.environ.get("AGENT_PROMPT_CACHE_TTL", "").strip() or None
+
+# プロセス共通の BedrockModel（種類ごとに 1 つ。boto3 クライアントと接続プールを全セッションで共有する）
+_models: dict[str, BedrockModel] = {}
+# 両方のモデルで共有する boto3 セッション（認証情報の解決とサービス定義の読み込みを 1 度で済ませる）
+_boto_session: boto3.Session | None = None
+_model_lock = threading.Lock()
+_warmup_thread: threading.Thread | None = None
+
+
+def create_model(tier: str = STRONG):
     """
-    Strands のイベントをフロントエンド向け JSON 形式に変換
+    モデルを返す（種類ごとにプロセスで 1 度だけ作成し、全セッションで共有する）
 
-    Strands Agent は様々なイベントを発行するが、
-    フロントエンドで必要なのは:
-    - text: AI の応答テキスト（差分）
-    - tool_use: ツール使用開始の通知
+    BedrockModel は設定と boto3 クライアントだけを持ち、会話の状態は Agent 側にあるので共有してよい。
+    boto3 クライアントの作成では認証情報の解決（コンテナの認証情報エンドポイントへの問い合わせ）も行われるため、
+    セッションごとに作り直さない。
+
+    ベンチマーク（bench/agent_bench.py）はこの関数を差し替えて、スクリプト化したモデルで invoke_agent を実行する
 
     Args:
-        event: Strands からのイベント（dict 形式）
+        tier: STRONG（BEDROCK_MODEL_ID）または FAST（BEDROCK_FAST_MODEL_ID）
+    """
+    global _boto_session
+
+    model = _models.get(tier)
+    if model is None:
+        with _model_lock:
+            model = _models.get(tier)
+            if model is None:
+                started = time.perf_counter()
+                cache_config = None
+                if AGENT_PROMPT_CACHE:
+                    cache_config = CacheConfig(strategy="auto", ttl=AGENT_PROMPT_CACHE_TTL, tools_ttl=True)
+                model_id = BEDROCK_FAST_MODEL_ID if tier == FAST else BEDROCK_MODEL_ID
+                if _boto_session is None:
+                    _boto_session = boto3.Session(region_name=BEDROCK_REGION)
+                model = BedrockModel(model_id=model_id, boto_session=_boto_session, cache_config=cache_config)
+                _models[tier] = model
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                print(f"[Model] BedrockModel ({tier}: {model_id}) を作成しました ({elapsed_ms:.1f} ms、以降のセッションでは共有)")
+    return model
+
+
+def create_agent_model():
+    """
+    Agent に渡すモデル
 
-    Returns:
-        フロント向け JSON または None（無視するイベント）
+    振り分けが有効なら、高性能モデルと高速モデルの ModelRouter（Agent ごとに作る。モデルは共有）。
+    最初の候補（高性能モデル）が agent.model になり、要約など振り分けを通らない処理で使われる
     """
-    try:
-        if not hasattr(event, 'get'):
-            return None
+    if not AGENT_MODEL_ROUTING:
+        return create_model(STRONG)
+    return ModelRouter(
+        [
+            RoutingCandidate(create_model(STRONG), name=STRONG),
+            RoutingCandidate(create_model(FAST), name=FAST),
+        ],
+        strategy=RouteStrategy(),
+    )
 
-        inner_event = event.get('event')
-        if not inner_event:
-            return None
 
-        # ---------------------------------
-        # テキスト差分を検知
-        # contentBlockDelta.delta.text に文字列が入っている
-        # ---------------------------------
-        content_block_delta = inner_event.get('contentBlockDelta')
-        if content_block_delta:
-            delta = content_block_delta.get('delta', {})
-            text = delta.get('text')
-            if text:
-                return {'type': 'text', 'data': text}
+def warm_up() -> None:
+    """
+    最初のリクエストの前に済ませられる準備をする（バックグラウンドのスレッドで実行する）
 
-        # ---------------------------------
-        # ツール使用開始を検知
-        # contentBlockStart.start.toolUse に情報が入っている
-        # ---------------------------------
-        content_block_start = inner_event.get('contentBlockStart')
-        if content_block_start:
-            start = content_block_start.get('start', {})
-            tool_use = start.get('toolUse')
-            if tool_use:
-                tool_name = tool_use.get('name', 'unknown')
-                return {'type': 'tool_use', 'tool_name': tool_name}
+    - BedrockModel と boto3 クライアントの作成（認証情報の解決を含む。振り分けが有効なら両方のモデル）
+    - Bedrock Runtime への接続（CountTokens を 1 回呼んで TLS 接続を接続プールに残す）
+    - Confluence ツールの生成（atlassian の import を含む）
+    """
+    started = time.perf_counter()
+    for tier in (STRONG, FAST) if AGENT_MODEL_ROUTING else (STRONG,):
+        model = create_model(tier)
+        try:
+            model.client.count_tokens(
+                modelId=model.config["model_id"],
+                input={"converse": {"messages": [{"role": "user", "content": [{"text": "ping"}]}]}},
+            )
+        except Exception as e:
+            # モデルが CountTokens に対応していない場合などもエラーになるが、接続と認証情報の準備はできている
+            print(f"[Warmup] CountTokens ({tier}): {type(e).__name__}: {e}")
+    get_confluence_tools()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"[Warmup] 完了しました ({elapsed_ms:.1f} ms)")
 
-        return None
-    except Exception:
-        return None
+
+def start_warm_up() -> None:
+    """ウォームアップをバックグラウンドで 1 度だけ開始する（/ping やヘルスチェックを待たせない）"""
+    global _warmup_thread
+
+    if not AGENT_WARMUP or _warmup_thread is not None:
+        return
+    _warmup_thread = threading.Thread(target=warm_up, name="warmup", daemon=True)
+    _warmup_thread.start()
+
+
+@app.ping
+def ping():
+    """
+    /ping のハンドラー
+
+    AgentCore Runtime は起動直後から /ping を呼ぶので、まだウォームアップしていなければここで開始する。
+    ステータスは返さず、SDK の自動判定（処理中のタスクがあれば HealthyBusy）に任せる
+    """
+    start_warm_up()
+    return None
+
+
+# =====================================
+# 先読み（prefetch）
+# =====================================
+#
+# To Do の操作には必ず list_id が必要なので、モデルはほぼ毎回 get_task_lists に 1 ターン使い、
+# 多くのセッションは今日の予定の取得から始まる。新しいセッションではこれらを
+# モデルの準備と並行して先に取得し、短時間で取得できたものは最初のターンのコンテキストに入れる。
+# 間に合わなかったものもそのまま実行を続け、読み取りキャッシュを温める
+# （モデルが同じツールを呼んだら、実行中の読み込みの結果を待って共有する）。
+
+# 実行中の先読みタスク（途中で GC されないよう参照を持っておく）
+_prefetch_tasks: set[asyncio.Task] = set()
+
+
+def start_prefetch(tools: list, user_timezone: str, client_now_iso: str) -> list[tuple[str, asyncio.Task]]:
+    """
+    タスクリストと今日の予定の取得を開始する
+
+    Returns:
+        (コンテキストでの見出し, 取得中のタスク) のリスト
+    """
+    tools_by_name = {t.tool_name: t for t in tools}
+    now = resolve_now(user_timezone, client_now_iso)
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    start_iso = today.isoformat()
+    end_iso = (today + timedelta(days=1)).isoformat()
+
+    calls = [
+        ("タスクリスト（get_task_lists の結果）", tools_by_name["get_task_lists"]()),
+        (f"今日の予定（get_schedule {start_iso} 〜 {end_iso} の結果）", tools_by_name["get_schedule"](start_iso, end_iso)),
+    ]
+    prefetch = []
+    for label, coro in calls:
+        task = asyncio.ensure_future(coro)
+        _prefetch_tasks.add(task)
+        task.add_done_callback(_prefetch_tasks.discard)
+        prefetch.append((label, task))
+    return prefetch
+
+
+async def collect_prefetch(prefetch: list[tuple[str, asyncio.Task]], wait_sec: float) -> str | None:
+    """
+    最大 wait_sec だけ待ち、取得できた結果をコンテキスト用のテキストにまとめる
+
+    Returns:
+        コンテキストのテキスト（何も取得できなかった場合は None）
+    """
+    await asyncio.wait([task for _, task in prefetch], timeout=wait_sec)
+    sections = []
+    for label, task in prefetch:
+        if not task.done() or task.cancelled() or task.exception() is not None:
+            continue
+        result = task.result()
+        if result.startswith("エラー"):
+            continue
+        sections.append(f"## {label}\n{result}")
+    print(f"[Prefetch] {len(sections)}/{len(prefetch)} 件をコンテキストに追加しました (待ち時間上限: {wait_sec:.2f} 秒)")
+    return "\n\n".join(sections) if sections else None
 
 
 # =====================================
@@ -647,7 +1446,7 @@ async def invoke_agent(payload, context):
         context: AgentCore からのコンテキスト情報（session_id など）
 
     Yields:
-        SSE 形式のイベント（text または tool_use）
+        SSE 形式のイベント（text / tool_use / tool_result / usage / complete）
     """
 
     # ---------------------------------
@@ -675,21 +1474,33 @@ async def invoke_agent(payload, context):
         }
         return
 
+    # このリクエストのレイテンシ・トークンの計測を始める（Agent の生成時間も含める）
+    turn = start_turn()
+
     # ---------------------------------
-    # ツールを生成
+    # ツールに渡す値
     # ---------------------------------
-    # closure でトークンを保持し、LLM には見せない
-    graph_tools = create_graph_tools(ms_graph_token, user_timezone)
-    todo_tools = create_todo_tools(ms_graph_token, user_timezone)
-    confluence_tools = create_confluence_tools()
-
-    # 全ツールを結合
-    all_tools = graph_tools + todo_tools + confluence_tools
+    # トークンはツールの引数ではなく contextvars で渡し、LLM には見せない
+    # （このリクエストから実行されるツール・先読みのタスクだけがこの値を参照する）
+    set_tool_context(ms_graph_token, user_timezone, session_id)
+    # ツールはプロセスで 1 度だけ定義したものを使う
+    # （Confluence の認証情報はプロセス共通なので、初回に生成したツールを使い回す）
+    all_tools = GRAPH_TOOLS + TODO_TOOLS + get_confluence_tools()
 
     # ---------------------------------
     # システムプロンプト
     # ---------------------------------
     # AI の役割と、利用可能な機能を定義
+    if AGENT_TIME_CONTEXT:
+        # 日時は各ターンのメッセージに入れるので、get_current_datetime のためのモデル往復は不要
+        datetime_rules = """- ユーザーのメッセージの先頭の <context> に現在日時・曜日・今週の範囲が含まれています
+- 「今日」「明日」「今週」などの相対表現や曜日は、<context> の日時を基準に解決してください（get_current_datetime を呼ぶ必要はありません）"""
+    else:
+        datetime_rules = """- 「今日」「明日」「今週」などの相対表現を使う場合は、必ず get_current_datetime ツールで現在日時を確認してから処理してください
+- 曜日を計算で求めず、必ず get_current_datetime ツールで確認してください"""
+    prefetch_rules = ""
+    if AGENT_PREFETCH:
+        prefetch_rules = "- ユーザーのメッセージに <prefetched> がある場合は、その内容（タスクリストのIDや今日の予定）をツールを呼ばずに使ってください\n"
     system_prompt = f"""
 あなたは秘書AIエージェントです。
 ユーザーの Outlook カレンダー、Microsoft To Do、Confluence を操作できます。
@@ -699,50 +1510,113 @@ async def invoke_agent(payload, context):
 
 # 注意事項
 - 日時は必ず ISO8601 形式（例: 2026-01-15T10:00:00+09:00）で指定してください
-- 「今日」「明日」「今週」などの相対表現を使う場合は、必ず get_current_datetime ツールで現在日時を確認してから処理してください
-- 曜日を計算で求めず、必ず get_current_datetime ツールで確認してください
+{datetime_rules}
 - To Do のタスク操作には必ず list_id が必要です。まず get_task_lists でリストIDを取得してください
+- 会議の日程調整では get_schedule で予定を一覧せず、find_free_slots で候補枠を探してください
+{prefetch_rules}- 複数のタスクを作成するときは create_tasks、複数のリストのタスクを確認するときは get_tasks_for_lists で 1 回にまとめてください
 """
 
     # ---------------------------------
     # AI エージェントを取得または作成
     # ---------------------------------
-    # セッションIDでキャッシュを参照し、同じセッションなら既存のAgentを再利用
+    # セッションIDでストアを参照し、同じセッションなら既存のAgentを再利用
     # これにより会話履歴（agent.messages）が保持される
-    global _agent_cache
-
-    if session_id and session_id in _agent_cache:
-        # 既存のAgentを再利用（会話履歴が保持されている）
-        agent = _agent_cache[session_id]
-        # ツールを更新（トークンが変わる可能性があるため）
-        agent.tools = all_tools
-        print(f"[Session] Reusing existing agent for session: {session_id}")
-    else:
-        # 新しいAgentを作成
-        # Bedrock の Claude モデルを使用
-        bedrock_model = BedrockModel(
-            model_id="us.anthropic.claude-sonnet-4-5-20250929-v1:0",
-            # model_id="us.anthropic.claude-haiku-4-5-20251001-v1:0",
-            region_name="us-east-1"
-        )
-        agent = Agent(
-            model=bedrock_model,
-            system_prompt=system_prompt,
-            tools=all_tools
-        )
-        # キャッシュに保存
-        if session_id:
-            _agent_cache[session_id] = agent
-            print(f"[Session] Created new agent for session: {session_id}")
+    agent = None
+    # ストアで「実行中」にしたか（acquire で取り出したか add で登録したときだけ release する）
+    registered = False
+    prefetch = None
+    converter = StreamConverter()
+    # Agent の取得・作成から try に入れる（Agent の作成や先読みの待ちで例外・キャンセルが起きても、
+    # finally で release して「実行中」のまま残らないようにする）
+    try:
+        # 同じセッションの最初のリクエストが同時に届いても、退避の読み込みと Agent の作成は 1 回だけ行う
+        async with _session_store.creating(session_id) if session_id else contextlib.nullcontext():
+            agent = _session_store.acquire(session_id) if session_id else None
+            registered = agent is not None
+            if agent is not None:
+                # 既存のAgentを再利用（会話履歴が保持されている）
+                # ツールは登録済みのものをそのまま使う（トークンが変わっても tool_context() で新しい値が読まれる）
+                print(f"[Session] Reusing existing agent for session: {session_id}")
+            else:
+                # 新しいセッションでは、モデルの準備と並行してタスクリストと今日の予定を先に取得しておく
+                if AGENT_PREFETCH:
+                    prefetch = start_prefetch(all_tools, user_timezone, client_now_iso)
+
+                # ストアから追い出されたセッションなら、退避しておいた会話履歴を復元する
+                # （ファイルの読み込みと JSON の変換でイベントループを止めないよう、スレッドで実行する）
+                restored = await asyncio.to_thread(_session_store.load_spilled, session_id) if session_id else None
+
+                # 新しいAgentを作成
+                with agent_create_span(turn, restored=restored is not None):
+                    agent = Agent(
+                        # 振り分けが有効なら、ターンごとに高速モデルと高性能モデルを選ぶ（履歴は共通）
+                        model=create_agent_model(),
+                        system_prompt=system_prompt,
+                        tools=all_tools,
+                        messages=restored.messages if restored else None,
+                        state=restored.state if restored else None,
+                        # 古いツール結果の省略とトークン予算で、ターンごとに送る履歴を抑える
+                        conversation_manager=create_conversation_manager(stable_prefix=AGENT_PROMPT_CACHE),
+                        # 独立したツールは並列に、同じリソースを変更するツールは要求順に実行する
+                        tool_executor=create_tool_executor(),
+                        # モデル呼び出し・ツール呼び出しの時間を計測する
+                        hooks=[TelemetryHooks()],
+                    )
+                # ストアに保存
+                if session_id:
+                    agent = _session_store.add(session_id, agent)
+                    registered = True
+                    if restored is not None:
+                        print(f"[Session] Restored agent from spill for session: {session_id} ({len(restored.messages)} messages)")
+                    else:
+                        print(f"[Session] Created new agent for session: {session_id}")
 
-    # ---------------------------------
-    # ストリーミング実行
-    # ---------------------------------
-    # async generator でイベントを逐次返す
-    async for event in agent.stream_async(prompt):
-        converted = convert_event(event)
-        if converted:
+        # ---------------------------------
+        # ストリーミング実行
+        # ---------------------------------
+        # async generator でイベントを逐次返す
+        # 日時コンテキストを入れる場合は、ユーザーの入力の前に content block として付ける
+        agent_input = with_time_context(prompt, user_timezone, client_now_iso) if AGENT_TIME_CONTEXT else [{"text": prompt}]
+        if prefetch:
+            prefetched = await collect_prefetch(prefetch, AGENT_PREFETCH_WAIT_SEC)
+            if prefetched:
+                agent_input.insert(-1, {"text": f"<prefetched>\n{prefetched}\n</prefetched>"})
+        # このターンで使うモデルを決める（前のターンのルートはセッションの Agent に残しておく）
+        route = classify_prompt(prompt, agent.state.get("model_route"))
+        agent.state.set("model_route", route.route)
+        print(f"[Router] route={route.route} reason={route.reason} prompt_chars={len(prompt or '')}")
+        async for event in agent.stream_async(agent_input, invocation_state={ROUTE_KEY: route.route}):
+            for converted in converter.feed(event):
+                if converted["type"] == "text":
+                    turn.mark_first_text()
+                yield converted
+        # 最後の usage イベントにトークン数とレイテンシの内訳を載せる
+        for converted in converter.finish(turn.summary()):
             yield converted
+    finally:
+        clear_tool_context()
+        finish_turn(turn, converter.usage)
+        # 1 リクエストあたりのモデル往復回数とレイテンシの内訳
+        summary = turn.summary()
+        print(
+            f"[Turn] model_calls={converter.model_calls} tool_calls={converter.tool_calls} "
+            + " ".join(f"{key}={value}" for key, value in summary.items())
+            + f" input_tokens={converter.usage['inputTokens']} output_tokens={converter.usage['outputTokens']}"
+            f" cache_read_tokens={converter.usage['cacheReadInputTokens']}"
+            f" cache_write_tokens={converter.usage['cacheWriteInputTokens']}"
+            f" time_context={AGENT_TIME_CONTEXT}"
+        )
+        # 実行が終わったら履歴サイズを再計算し、上限を超えていれば古いセッションを追い出す
+        if registered:
+            _session_store.release(session_id)
+        if session_id:
+            _session_store.log_stats()
+        graph_cache.log_stats()
+        if GRAPH_DELTA_SYNC:
+            delta_store.log_stats()
+        graph_backend.log_stats()
+        confluence_backend.log_stats()
+        confluence_cache.log_stats()
 
 
 # =====================================
@@ -752,4 +1626,6 @@ async def invoke_agent(payload, context):
 if __name__ == "__main__":
     # ローカルで実行する場合（デバッグ用）
     # 通常は AgentCore Runtime がこのファイルをロードする
+    # サーバーの起動と並行してウォームアップを始める
+    start_warm_up()
     app.run()
\ No newline at end of file
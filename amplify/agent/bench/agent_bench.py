@@ -0,0 +1,513 @@
+# =====================================
+# invoke_agent のエンドツーエンド・ベンチマーク / 負荷試験（オフライン）
+# =====================================
+#
+# Microsoft Graph / Confluence / Bedrock を使わずに、invoke_agent をそのまま実行して計測する:
+# - Graph: 記録済みフィクスチャを返すフェイク（bench/fake_graph.py、httpx のトランスポートを差し替え）
+# - Confluence: ローカルの HTTP サーバー（bench/fake_confluence.py、CONFLUENCE_URL をこのサーバーに向ける）
+# - モデル: ユーザーの入力に応じて決まったツール呼び出しを返すスクリプト化したモデル（app.create_model を差し替え）
+#
+# 各セッションは SCENARIOS の会話を順に送り、N セッションを同時に実行する。報告する値:
+# - リクエストのレイテンシ（p50 / p95）と最初のテキストまでの時間
+# - スループット（リクエスト/秒）
+# - 1 リクエストあたりのモデル呼び出し回数と、Graph / Confluence への HTTP 往復回数
+# - 1 セッションあたりのメモリ（tracemalloc で測った、実行後に残っている確保量）
+# - 1 リクエストあたりの入力トークン数と、そのうちプロンプトキャッシュから読んだ割合、
+#   課金上の入力トークン数（CACHE_READ_WEIGHT / CACHE_WRITE_WEIGHT で重み付け）
+#
+# --time-context both で、日時コンテキストあり（既定）となし（get_current_datetime を呼ばせる）を比べる。
+# --prompt-cache both で、プロンプトキャッシュあり（既定。履歴は予算を超えるまで書き換えない）となしを比べる。
+# --routing both で、高速モデルへの振り分けあり（既定）と、常に高性能モデルを使う場合を比べる
+# （高速モデルは --fast-model-ms / --fast-token-ms の遅延で応答する）。
+# キャッシュは Bedrock の動きを近似する: システムプロンプトとツール定義、および以前の呼び出しで
+# 送った履歴のプレフィックス（最後のメッセージまで）が一致すれば、その分を cacheReadInputTokens とする。
+#
+# 実行方法（amplify/agent ディレクトリで）:
+#   python -m bench.agent_bench
+#   python -m bench.agent_bench --sessions 1,10,50 --turns 5 --model-ms 300
+#   python -m bench.agent_bench --time-context both --prefetch
+#   python -m bench.agent_bench --prompt-cache both --time-context on --turns 10
+#   python -m bench.agent_bench --routing both --time-context on
+
+import argparse
+import asyncio
+import contextlib
+import gc
+import hashlib
+import io
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from zoneinfo import ZoneInfo
+
+from strands.models.model import Model
+
+from bench.fake_confluence import FakeConfluence
+from bench.fake_graph import FakeGraph
+
+USER_TIMEZONE = "Asia/Tokyo"
+
+# 各セッションが順に送る会話（キーワードでスクリプト化したモデルの動きが決まる）
+SCENARIOS = [
+    "今日の予定とタスクをまとめて",
+    "今日の予定を教えて",
+    "未完了のタスクを確認して",
+    "会議室の予約方法を Confluence で調べて",
+    # 複数の情報を組み合わせる依頼（振り分けが有効なら高性能モデル）
+    "予定とタスクを確認して、優先順位をつけて今日の作業計画を立てて",
+    "ありがとう",
+]
+
+# 課金上の重み（Claude on Bedrock: キャッシュの読み込みは入力の 0.1 倍、書き込みは 1.25 倍）
+CACHE_READ_WEIGHT = 0.1
+CACHE_WRITE_WEIGHT = 1.25
+
+_LIST_ID = re.compile(r"\(ID: ([^)]+)\)")
+_PAGE_ID = re.compile(r"ID: (\d+)")
+
+
+# =====================================
+# スクリプト化したモデル
+# =====================================
+
+@dataclass
+class ModelStats:
+    calls: int = 0
+    input_tokens: int = 0
+
+
+def _approx_tokens(messages: list[dict]) -> int:
+    """
+    usage に載せる入力トークン数の近似（3 文字で 1 トークン）
+
+    モデル側の計測で負荷試験の CPU を使わないよう、ブロックの長さを足すだけにしている
+    """
+    chars = 0
+    for message in messages:
+        for block in message["content"]:
+            if "text" in block:
+                chars += len(block["text"])
+            elif "toolResult" in block:
+                chars += sum(len(c.get("text", "")) for c in block["toolResult"].get("content", []))
+            elif "toolUse" in block:
+                chars += len(str(block["toolUse"].get("input", "")))
+    return chars // 3
+
+
+class PromptCacheSimulator:
+    """
+    Bedrock のプロンプトキャッシュの近似（Agent ごと）
+
+    BedrockModel（CacheConfig）はシステムプロンプト・ツール定義の末尾と、最後のメッセージの末尾に
+    キャッシュポイントを置く。以前の呼び出しで書き込んだプレフィックスと先頭から一致する部分は読み込み、
+    残りは書き込みになる（途中のメッセージが書き換わると、そこから後ろはキャッシュに当たらない）。
+    TTL と最小トークン数は考慮しない。
+    """
+
+    def __init__(self):
+        self._prefixes: set[bytes] = set()
+        self._fixed_cached = False
+
+    def split(self, fixed_tokens: int, messages: list[dict]) -> tuple[int, int]:
+        """
+        Returns:
+            (キャッシュから読んだトークン数, キャッシュに書き込んだトークン数)
+        """
+        read = fixed_tokens if self._fixed_cached else 0
+        self._fixed_cached = True
+        digest = hashlib.sha1()
+        matched = 0
+        last = b""
+        for i, message in enumerate(messages):
+            digest.update(json.dumps(message, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8"))
+            last = digest.digest()
+            if last in self._prefixes:
+                matched = i + 1
+        self._prefixes.add(last)
+        read += _approx_tokens(messages[:matched])
+        return read, fixed_tokens + _approx_tokens(messages) - read
+
+
+def _current_turn(messages: list[dict]) -> tuple[str, dict[str, str]]:
+    """
+    最後のユーザー入力（toolResult を含まないユーザーメッセージ）と、
+    それ以降に実行したツールの結果（ツール名 -> 結果のテキスト）を返す
+    """
+    start = 0
+    prompt = ""
+    for i in range(len(messages) - 1, -1, -1):
+        message = messages[i]
+        if message["role"] == "user" and not any("toolResult" in b for b in message["content"]):
+            start = i
+            prompt = "\n".join(b.get("text", "") for b in message["content"])
+            break
+    names: dict[str, str] = {}
+    results: dict[str, str] = {}
+    for message in messages[start + 1:]:
+        for block in message["content"]:
+            if "toolUse" in block:
+                names[block["toolUse"]["toolUseId"]] = block["toolUse"]["name"]
+            elif "toolResult" in block:
+                name = names.get(block["toolResult"]["toolUseId"], "")
+                results[name] = "\n".join(c.get("text", "") for c in block["toolResult"].get("content", []))
+    return prompt, results
+
+
+def plan_step(prompt: str, results: dict[str, str]) -> list[tuple[str, dict]] | str:
+    """
+    次に呼ぶツール（名前と入力のリスト）か、最終的な応答テキストを返す
+
+    実際のモデルと同じように振る舞う:
+    - <context> が無ければ（日時コンテキスト無効）、日付が必要な会話の前に get_current_datetime を呼ぶ
+    - <prefetched> にタスクリストがあれば get_task_lists を呼ばない
+    """
+    today = datetime.now(ZoneInfo(USER_TIMEZONE)).replace(hour=0, minute=0, second=0, microsecond=0)
+    schedule = ("get_schedule", {"start_iso": today.isoformat(), "end_iso": (today + timedelta(days=1)).isoformat()})
+    needs_clock = "<context>" not in prompt and "get_current_datetime" not in results
+    prefetched_lists = _LIST_ID.search(prompt.split("</prefetched>")[0]) if "<prefetched>" in prompt else None
+    list_match = _LIST_ID.search(results.get("get_task_lists", "")) or prefetched_lists
+
+    if "予定とタスク" in prompt:
+        if needs_clock:
+            return [("get_current_datetime", {})]
+        if "get_schedule" not in results:
+            return [schedule] if list_match else [schedule, ("get_task_lists", {})]
+        if "get_tasks" not in results and list_match:
+            return [("get_tasks", {"list_id": list_match.group(1)})]
+        return _answer(results)
+    if "予定" in prompt:
+        if needs_clock:
+            return [("get_current_datetime", {})]
+        if "get_schedule" not in results:
+            return [schedule]
+        return _answer(results)
+    if "タスク" in prompt:
+        if not list_match:
+            return [("get_task_lists", {})]
+        if "get_tasks" not in results:
+            return [("get_tasks", {"list_id": list_match.group(1)})]
+        return _answer(results)
+    if "Confluence" in prompt:
+        if "search_confluence" not in results:
+            return [("search_confluence", {"query": "会議室"})]
+        page_match = _PAGE_ID.search(results["search_confluence"])
+        if "get_confluence_page" not in results and page_match:
+            return [("get_confluence_page", {"page_id": page_match.group(1)})]
+        return _answer(results)
+    return "どういたしまして。ほかにお手伝いできることがあれば教えてください。"
+
+
+def _answer(results: dict[str, str]) -> str:
+    """ツールの結果を要約したような応答（長さはツールの結果に比例させる）"""
+    lines = [f"{name} の結果を確認しました。" for name in results]
+    summary = "".join(text[:120] for text in results.values())
+    return "\n".join(lines) + "\n\n" + summary + "\n\n以上です。ほかに確認したいことはありますか？"
+
+
+class ScriptedModel(Model):
+    """
+    plan_step に従ってツール呼び出しと応答をストリームするモデル
+
+    Args:
+        first_token_ms: 最初のチャンクまでの遅延（モデルの処理時間の模擬）
+        token_ms: テキスト差分 1 つあたりの遅延
+        stats: 呼び出し回数などを集計する先
+        prompt_cache: プロンプトキャッシュを模擬するか（usage にキャッシュの読み書きのトークン数を載せる）
+    """
+
+    def __init__(self, first_token_ms: float, token_ms: float, stats: ModelStats, prompt_cache: bool = False):
+        self.first_token_ms = first_token_ms
+        self.token_ms = token_ms
+        self.stats = stats
+        self._fixed_tokens: int | None = None
+        self._cache = PromptCacheSimulator() if prompt_cache else None
+
+    def update_config(self, **model_config):
+        pass
+
+    def get_config(self):
+        return {}
+
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        raise NotImplementedError("structured_output はベンチマークでは使わない")
+        yield
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        self.stats.calls += 1
+        if self._fixed_tokens is None:
+            # システムプロンプトとツール定義は Agent ごとに変わらないので 1 度だけ数える
+            self._fixed_tokens = len(system_prompt or "") // 2 + len(json.dumps(tool_specs or [])) // 4
+        input_tokens = self._fixed_tokens + _approx_tokens(messages)
+        self.stats.input_tokens += input_tokens
+        cache_read = cache_write = 0
+        if self._cache is not None:
+            # Bedrock と同じく、inputTokens はキャッシュの読み書き以外の分
+            cache_read, cache_write = self._cache.split(self._fixed_tokens, messages)
+            input_tokens -= cache_read + cache_write
+        await asyncio.sleep(self.first_token_ms / 1000)
+
+        prompt, results = _current_turn(messages)
+        step = plan_step(prompt, results)
+        yield {"messageStart": {"role": "assistant"}}
+        if isinstance(step, list):
+            for i, (name, tool_input) in enumerate(step):
+                tool_use_id = f"tooluse_{self.stats.calls}_{i}"
+                yield {"contentBlockStart": {"start": {"toolUse": {"toolUseId": tool_use_id, "name": name}}}}
+                yield {"contentBlockDelta": {"delta": {"toolUse": {"input": json.dumps(tool_input, ensure_ascii=False)}}}}
+                yield {"contentBlockStop": {}}
+            yield {"messageStop": {"stopReason": "tool_use"}}
+        else:
+            # 4 文字ずつの差分で、8 差分ごとにまとめて待つ（asyncio.sleep の粒度より細かく待たない）
+            for i in range(0, len(step), 4):
+                yield {"contentBlockDelta": {"delta": {"text": step[i:i + 4]}}}
+                if i % 32 == 28:
+                    await asyncio.sleep(self.token_ms * 8 / 1000)
+            yield {"contentBlockStop": {}}
+            yield {"messageStop": {"stopReason": "end_turn"}}
+        output_tokens = len(str(step)) // 3
+        yield {
+            "metadata": {
+                "usage": {
+                    "inputTokens": input_tokens,
+                    "outputTokens": output_tokens,
+                    "totalTokens": input_tokens + cache_read + cache_write + output_tokens,
+                    "cacheReadInputTokens": cache_read,
+                    "cacheWriteInputTokens": cache_write,
+                },
+                "metrics": {"latencyMs": round(self.first_token_ms)},
+            }
+        }
+
+
+# =====================================
+# 実行と集計
+# =====================================
+
+@dataclass
+class RequestResult:
+    latency_ms: float
+    first_text_ms: float | None
+    model_calls: int
+    graph_requests: int
+    route: str | None = None
+    input_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+    error: bool = False
+
+    @property
+    def prompt_tokens(self) -> int:
+        """キャッシュの読み書きを含む入力トークン数"""
+        return self.input_tokens + self.cache_read_tokens + self.cache_write_tokens
+
+    @property
+    def billed_tokens(self) -> float:
+        """課金上の入力トークン数（キャッシュの読み書きを重み付けした値）"""
+        return (
+            self.input_tokens
+            + self.cache_read_tokens * CACHE_READ_WEIGHT
+            + self.cache_write_tokens * CACHE_WRITE_WEIGHT
+        )
+
+
+@dataclass
+class RunResult:
+    label: str
+    sessions: int
+    wall_sec: float
+    requests: list[RequestResult] = field(default_factory=list)
+    graph_round_trips: int = 0
+    confluence_round_trips: int = 0
+
+
+async def _run_request(app, session_id: str, token: str, prompt: str) -> RequestResult:
+    payload = {
+        "prompt": prompt,
+        "msGraphAccessToken": token,
+        "userTimeZone": USER_TIMEZONE,
+        "clientNowIso": datetime.now(ZoneInfo(USER_TIMEZONE)).replace(tzinfo=None).isoformat(timespec="seconds"),
+    }
+    started = time.perf_counter()
+    first_text_ms = None
+    usage: dict = {}
+    async for event in app.invoke_agent(payload, SimpleNamespace(session_id=session_id)):
+        if event.get("type") == "text" and first_text_ms is None:
+            first_text_ms = (time.perf_counter() - started) * 1000
+        elif event.get("type") == "usage":
+            usage = event
+    return RequestResult(
+        latency_ms=(time.perf_counter() - started) * 1000,
+        first_text_ms=first_text_ms,
+        model_calls=usage.get("model_calls", 0),
+        graph_requests=usage.get("graph_requests", 0),
+        route=usage.get("route"),
+        input_tokens=usage.get("inputTokens", 0),
+        cache_read_tokens=usage.get("cacheReadInputTokens", 0),
+        cache_write_tokens=usage.get("cacheWriteInputTokens", 0),
+        error=not usage,
+    )
+
+
+async def run_sessions(app, label: str, sessions: int, turns: int, fake_graph, fake_confluence) -> RunResult:
+    """sessions 個のセッションを同時に実行し、各セッションで turns 回の会話を送る"""
+    fake_graph.stats.reset()
+    fake_confluence.stats.reset()
+    run_id = f"{label}-{sessions}-{time.monotonic_ns()}"
+    result = RunResult(label=label, sessions=sessions, wall_sec=0.0)
+
+    async def session(i: int) -> None:
+        session_id = f"bench-{run_id}-{i}"
+        token = f"bench-token-{run_id}-{i}"
+        for turn in range(turns):
+            result.requests.append(await _run_request(app, session_id, token, SCENARIOS[turn % len(SCENARIOS)]))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    result.wall_sec = time.perf_counter() - started
+    result.graph_round_trips = fake_graph.stats.requests
+    result.confluence_round_trips = fake_confluence.stats.requests
+    return result
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def print_results(results: list[RunResult]) -> None:
+    print(
+        f"{'mode':<35}{'sessions':>9}{'requests':>9}{'p50':>9}{'p95':>9}{'first p50':>11}"
+        f"{'req/s':>8}{'fast':>6}{'model/req':>10}{'graph/req':>10}{'conf/req':>9}{'in tok/req':>11}{'cached':>8}{'billed/req':>11}{'errors':>7}"
+    )
+    for r in results:
+        latencies = [x.latency_ms for x in r.requests]
+        first = [x.first_text_ms for x in r.requests if x.first_text_ms is not None]
+        n = len(r.requests)
+        prompt_tokens = sum(x.prompt_tokens for x in r.requests)
+        cached = sum(x.cache_read_tokens for x in r.requests) / prompt_tokens if prompt_tokens else 0.0
+        print(
+            f"{r.label:<35}{r.sessions:>9}{n:>9}"
+            f"{statistics.median(latencies):>7.0f}ms{_percentile(latencies, 0.95):>7.0f}ms"
+            f"{statistics.median(first) if first else 0:>9.0f}ms"
+            f"{n / r.wall_sec:>8.1f}{sum(x.route == 'fast' for x in r.requests) / n:>6.0%}"
+            f"{sum(x.model_calls for x in r.requests) / n:>10.2f}"
+            f"{r.graph_round_trips / n:>10.2f}{r.confluence_round_trips / n:>9.2f}"
+            f"{prompt_tokens / n:>11.0f}{cached:>8.0%}{sum(x.billed_tokens for x in r.requests) / n:>11.0f}"
+            f"{sum(x.error for x in r.requests):>7}"
+        )
+
+
+async def measure_memory(app, sessions: int, turns: int, fake_graph, fake_confluence) -> float:
+    """sessions 個のセッションを実行した後に残っているメモリを、1 セッションあたりのバイト数で返す"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    await run_sessions(app, "memory", sessions, turns, fake_graph, fake_confluence)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / sessions
+
+
+async def run(args, app, fake_graph, fake_confluence) -> None:
+    import model_router
+
+    model_stats = ModelStats()
+    # AGENT_PROMPT_CACHE は Agent の作成時（履歴の圧縮方法）とモデルの作成時に読まれる
+    def create_model(tier: str = model_router.STRONG) -> ScriptedModel:
+        if tier == model_router.FAST:
+            return ScriptedModel(args.fast_model_ms, args.fast_token_ms, model_stats, app.AGENT_PROMPT_CACHE)
+        return ScriptedModel(args.model_ms, args.token_ms, model_stats, app.AGENT_PROMPT_CACHE)
+
+    app.create_model = create_model
+    app.AGENT_PREFETCH = args.prefetch
+    choices = {"on": [True], "off": [False], "both": [True, False]}
+    modes = [
+        (t, c, r)
+        for t in choices[args.time_context]
+        for c in choices[args.prompt_cache]
+        for r in choices[args.routing]
+    ]
+    session_counts = [int(x) for x in args.sessions.split(",")]
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    results = []
+    with quiet:
+        # 他の実行で作ったセッションが残っていない状態で測る（ストアの上限による追い出しを避ける）
+        memory_per_session = await measure_memory(app, args.memory_sessions, args.turns, fake_graph, fake_confluence)
+        for time_context, prompt_cache, routing in modes:
+            app.AGENT_TIME_CONTEXT = time_context
+            app.AGENT_PROMPT_CACHE = prompt_cache
+            # 振り分けの有無は Agent の作成時（app）と分類時（model_router）に読まれる
+            app.AGENT_MODEL_ROUTING = model_router.AGENT_MODEL_ROUTING = routing
+            label = (
+                f"time_ctx={'on' if time_context else 'off'} cache={'on' if prompt_cache else 'off'} "
+                f"route={'on' if routing else 'off'}"
+            )
+            for sessions in session_counts:
+                results.append(await run_sessions(app, label, sessions, args.turns, fake_graph, fake_confluence))
+
+    print(
+        f"model={args.model_ms:.0f}ms+{args.token_ms:.1f}ms/token "
+        f"fast_model={args.fast_model_ms:.0f}ms+{args.fast_token_ms:.1f}ms/token graph_rtt={args.graph_rtt_ms:.0f}ms "
+        f"confluence_rtt={args.confluence_rtt_ms:.0f}ms turns/session={args.turns} prefetch={args.prefetch}"
+    )
+    print_results(results)
+    print(
+        f"memory: {memory_per_session / 1024:.0f}KB/session "
+        f"({args.memory_sessions} sessions x {args.turns} turns, tracemalloc)"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="invoke_agent のオフライン・ベンチマーク / 負荷試験")
+    parser.add_argument("--sessions", default="1,10,50", help="同時セッション数（カンマ区切りで複数）")
+    parser.add_argument("--turns", type=int, default=len(SCENARIOS), help="1 セッションあたりの会話の数")
+    parser.add_argument("--model-ms", type=float, default=300.0, help="モデルの最初のチャンクまでの遅延")
+    parser.add_argument("--token-ms", type=float, default=2.0, help="テキスト差分 1 つあたりの遅延")
+    parser.add_argument("--graph-rtt-ms", type=float, default=20.0, help="フェイク Graph の往復遅延")
+    parser.add_argument("--confluence-rtt-ms", type=float, default=150.0, help="フェイク Confluence の往復遅延")
+    parser.add_argument("--time-context", choices=["on", "off", "both"], default="both", help="日時コンテキストの有無")
+    parser.add_argument("--fast-model-ms", type=float, default=150.0, help="高速モデルの最初のチャンクまでの遅延")
+    parser.add_argument("--fast-token-ms", type=float, default=1.0, help="高速モデルのテキスト差分 1 つあたりの遅延")
+    parser.add_argument("--routing", choices=["on", "off", "both"], default="on", help="高速モデルへの振り分けの有無")
+    parser.add_argument("--prompt-cache", choices=["on", "off", "both"], default="on", help="プロンプトキャッシュの有無")
+    parser.add_argument("--prefetch", action="store_true", help="新しいセッションで先読みする（AGENT_PREFETCH）")
+    parser.add_argument("--memory-sessions", type=int, default=20, help="メモリを測るセッション数")
+    parser.add_argument("--verbose", action="store_true", help="app のログを表示する")
+    args = parser.parse_args()
+
+    fake_confluence = FakeConfluence(rtt_ms=args.confluence_rtt_ms).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        # app の import 時に読まれる設定（キャッシュや退避先は一時ディレクトリにする）
+        os.environ["CONFLUENCE_URL"] = fake_confluence.url
+        os.environ["CONFLUENCE_EMAIL"] = "bench@example.com"
+        os.environ["CONFLUENCE_API_TOKEN"] = "bench"
+        os.environ["CONFLUENCE_CACHE_DIR"] = os.path.join(tmp, "confluence-cache")
+        os.environ["AGENT_SESSION_SPILL_DIR"] = os.path.join(tmp, "sessions")
+        with contextlib.redirect_stdout(io.StringIO()):
+            import app
+            import graph_client
+        # 本番と同じクライアントで測る（作れなければ Confluence 抜きの数字にせず、ここで止める）
+        if not app.get_confluence_tools():
+            sys.exit("[Bench] Confluence のツールを作成できませんでした（ログを確認してください）")
+
+        fake_graph = FakeGraph(rtt_ms=args.graph_rtt_ms)
+        graph_client.set_graph_transport(fake_graph.transport())
+        try:
+            asyncio.run(run(args, app, fake_graph, fake_confluence))
+        finally:
+            graph_client.set_graph_transport(None)
+            fake_confluence.stop()
+
+
+if __name__ == "__main__":
+    main()
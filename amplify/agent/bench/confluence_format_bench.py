@@ -0,0 +1,83 @@
+# =====================================
+# Confluence ページ変換のベンチマーク
+# =====================================
+#
+# 実際の Wiki ページに近い構造（見出し・表・コードマクロ・情報パネル・タスクリスト・リンク）の
+# 大きなストレージ形式ページを生成し、テキストへの変換速度と出力サイズ（文字数・推定トークン数）を測る。
+#
+# 実行方法（amplify/agent ディレクトリで）:
+#   python -m bench.confluence_format_bench
+#   python -m bench.confluence_format_bench --sections 200 --repeat 20
+
+import argparse
+import statistics
+import time
+
+from confluence_format import slice_text, storage_to_markdown
+from history import estimate_tokens
+
+
+def build_page(sections: int) -> str:
+    """sections 個の見出しを持つストレージ形式のページを生成する"""
+    parts = ['<ac:structured-macro ac:name="toc" ac:schema-version="1"><ac:parameter ac:name="maxLevel">3</ac:parameter></ac:structured-macro>']
+    for i in range(sections):
+        parts.append(f'<h2 style="text-align: left;">{i + 1}. 設計メモ {i + 1}</h2>')
+        parts.append(
+            f'<p style="text-align: left;"><span style="color: rgb(23,43,77);">この節では<strong>コンポーネント {i}</strong> の'
+            f'仕様を説明します。詳細は <ac:link><ri:page ri:content-title="関連ページ {i}" ri:space-key="DEV" /></ac:link> と '
+            f'<a href="https://example.atlassian.net/wiki/spaces/DEV/pages/{100000 + i}">設計書</a> を参照してください。</span></p>'
+        )
+        parts.append(
+            '<ac:structured-macro ac:name="info" ac:schema-version="1" ac:macro-id="0f3c2a1e-1111-2222-3333-444455556666">'
+            '<ac:parameter ac:name="title">注意</ac:parameter><ac:rich-text-body><p>本番環境では設定値を変更しないでください。</p>'
+            '</ac:rich-text-body></ac:structured-macro>'
+        )
+        rows = "".join(
+            f'<tr><td class="confluenceTd"><p>項目 {r}</p></td><td class="confluenceTd"><p>値 {r * i}</p></td>'
+            f'<td class="confluenceTd"><p><ac:link><ri:user ri:account-id="5b10ac8d82e05b22cc7d4ef{r}" /></ac:link></p></td></tr>'
+            for r in range(5)
+        )
+        parts.append(
+            '<table data-layout="default" ac:local-id="b1c2"><colgroup><col style="width: 226.0px;" /><col style="width: 226.0px;" />'
+            '<col style="width: 226.0px;" /></colgroup><tbody><tr><th class="confluenceTh"><p><strong>項目</strong></p></th>'
+            f'<th class="confluenceTh"><p><strong>値</strong></p></th><th class="confluenceTh"><p><strong>担当</strong></p></th></tr>{rows}</tbody></table>'
+        )
+        parts.append(
+            '<ac:structured-macro ac:name="code" ac:schema-version="1"><ac:parameter ac:name="language">python</ac:parameter>'
+            f'<ac:parameter ac:name="theme">Midnight</ac:parameter><ac:plain-text-body><![CDATA[def handler_{i}(event):\n'
+            '    return {"status": 200}\n]]></ac:plain-text-body></ac:structured-macro>'
+        )
+        parts.append(
+            '<ac:task-list><ac:task><ac:task-id>1</ac:task-id><ac:task-status>complete</ac:task-status>'
+            '<ac:task-body><span class="placeholder-inline-tasks">レビュー済み</span></ac:task-body></ac:task>'
+            '<ac:task><ac:task-id>2</ac:task-id><ac:task-status>incomplete</ac:task-status>'
+            '<ac:task-body><span class="placeholder-inline-tasks">テストを追加する</span></ac:task-body></ac:task></ac:task-list>'
+        )
+    return "".join(parts)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Confluence ページ変換のベンチマーク")
+    parser.add_argument("--sections", type=int, nargs="+", default=[10, 50, 200], help="ページの見出し数")
+    parser.add_argument("--repeat", type=int, default=10, help="変換の実行回数")
+    parser.add_argument("--max-chars", type=int, default=8000, help="1 回に返す最大文字数")
+    args = parser.parse_args()
+
+    print(f"{'sections':>8}{'storage chars':>15}{'text chars':>12}{'ratio':>8}{'tokens before':>15}{'tokens after':>14}{'first chunk':>13}{'p50':>10}")
+    for sections in args.sections:
+        storage = build_page(sections)
+        latencies = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            text = storage_to_markdown(storage)
+            latencies.append((time.perf_counter() - started) * 1000)
+        chunk, _ = slice_text(text, 0, args.max_chars)
+        print(
+            f"{sections:>8}{len(storage):>15,}{len(text):>12,}{len(text) / len(storage):>8.3f}"
+            f"{estimate_tokens([storage]):>15,}{estimate_tokens([text]):>14,}{estimate_tokens([chunk]):>13,}"
+            f"{statistics.median(latencies):>8.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# =====================================
+# Confluence 検索のベンチマーク（ローカル索引 vs リモート CQL）
+# =====================================
+#
+# 生成したページをローカル索引（SQLite FTS5）に登録し、検索のレイテンシをリモートの CQL 検索と比べる。
+# リモートは既定では固定の往復遅延を模擬する。--live を付けると環境変数
+# （CONFLUENCE_URL / CONFLUENCE_EMAIL / CONFLUENCE_API_TOKEN）の Confluence に実際に CQL を投げる。
+#
+# 実行方法（amplify/agent ディレクトリで）:
+#   python -m bench.confluence_search_bench
+#   python -m bench.confluence_search_bench --pages 2000 --remote-ms 600
+#   python -m bench.confluence_search_bench --live --space DEV
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from bench.confluence_format_bench import build_page
+from confluence_format import storage_to_markdown
+from confluence_search import ConfluenceIndex, build_search_cql
+
+QUERIES = ["予約方法", "会議室", "設定値", "handler_42", "コンポーネント 7", "本番環境 注意", "存在しない語句"]
+TOPICS = ["会議室の予約方法", "経費精算の手順", "VPN の設定値", "オンボーディング", "障害対応フロー"]
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def build_index(path: str, pages: int) -> tuple[ConfluenceIndex, float]:
+    """pages 件のページを索引に登録し、1 ページあたりの登録時間（ミリ秒）を返す"""
+    index = ConfluenceIndex(path)
+    started = time.perf_counter()
+    for i in range(pages):
+        topic = TOPICS[i % len(TOPICS)]
+        text = f"{topic}\n\n" + storage_to_markdown(build_page(3)).replace("handler_0", f"handler_{i}")
+        index.upsert(str(100000 + i), 1, f"{topic} ({i})", text, "DEV")
+    return index, (time.perf_counter() - started) * 1000 / pages
+
+
+def measure_local(index: ConfluenceIndex, repeat: int) -> list[float]:
+    latencies = []
+    for _ in range(repeat):
+        for query in QUERIES:
+            started = time.perf_counter()
+            index.search(query, limit=10)
+            latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def measure_remote(args) -> list[float]:
+    if not args.live:
+        # 実測の代わりに往復遅延を模擬する（CQL の text 検索は数百ミリ秒かかることが多い）
+        latencies = []
+        for _ in range(args.repeat):
+            for _ in QUERIES:
+                started = time.perf_counter()
+                time.sleep(args.remote_ms / 1000)
+                latencies.append((time.perf_counter() - started) * 1000)
+        return latencies
+
+    from atlassian import Confluence
+
+    confluence = Confluence(
+        url=os.environ["CONFLUENCE_URL"],
+        username=os.environ["CONFLUENCE_EMAIL"],
+        password=os.environ["CONFLUENCE_API_TOKEN"],
+        cloud=True,
+    )
+    latencies = []
+    for _ in range(args.repeat):
+        for query in QUERIES:
+            started = time.perf_counter()
+            confluence.cql(build_search_cql(query, args.space), limit=10)
+            latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Confluence 検索のベンチマーク（ローカル索引 vs リモート CQL）")
+    parser.add_argument("--pages", type=int, default=500, help="索引に登録するページ数")
+    parser.add_argument("--repeat", type=int, default=5, help="各クエリの実行回数")
+    parser.add_argument("--remote-ms", type=float, default=400.0, help="模擬するリモート検索の往復遅延")
+    parser.add_argument("--live", action="store_true", help="実際の Confluence に CQL を投げて計測する")
+    parser.add_argument("--space", default=None, help="--live のときに絞り込むスペースキー")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index, upsert_ms = build_index(os.path.join(tmp, "index.sqlite3"), args.pages)
+        local = measure_local(index, args.repeat)
+        size = os.path.getsize(os.path.join(tmp, "index.sqlite3"))
+    remote = measure_remote(args)
+
+    print(f"pages={args.pages} index_size={size / 1024 / 1024:.1f}MB upsert={upsert_ms:.2f}ms/page")
+    print(f"{'source':<10}{'p50':>10}{'p95':>10}")
+    for name, latencies in (("local", local), ("remote", remote)):
+        print(f"{name:<10}{statistics.median(latencies):>8.2f}ms{_percentile(latencies, 0.95):>8.2f}ms")
+    if not args.live:
+        print(f"(remote は {args.remote_ms:.0f}ms の往復遅延を模擬した値)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+# =====================================
+# ベンチマーク用のフェイク Confluence（REST API v1）
+# =====================================
+#
+# atlassian.Confluence は requests で同期的に HTTP を呼ぶので、httpx のモックではなく
+# ローカルのスレッド HTTP サーバーとして動かす。生成したページを返し、往復遅延を模擬する。
+#
+# 対応しているエンドポイント（Confluence Cloud / Server 共通の REST API v1）:
+#   GET  .../rest/api/content/{id}?expand=...   ページの取得（expand に body.storage があれば本文も返す）
+#   GET  .../rest/api/search?cql=...            CQL 検索（text ~ / title ~ の語句を含むページ）
+#   GET  .../rest/api/content?spaceKey=...      スペースのページ一覧（索引のクロール用）
+
+import json
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from bench.confluence_format_bench import build_page
+
+TOPICS = ["会議室の予約方法", "経費精算の手順", "VPN の設定値", "オンボーディング", "障害対応フロー"]
+
+_CONTENT_PATH = re.compile(r"/rest/api/content/(\d+)$")
+_CQL_TERM = re.compile(r'(?:text|title) ~ "((?:[^"\\]|\\.)*)"')
+
+
+@dataclass
+class FakeConfluenceStats:
+    requests: int = 0
+    bytes_sent: int = 0
+    by_path: dict[str, int] = field(default_factory=dict)
+
+    def reset(self) -> None:
+        self.requests = 0
+        self.bytes_sent = 0
+        self.by_path = {}
+
+
+class FakeConfluence:
+    """
+    生成したページを返すフェイク Confluence
+
+    Args:
+        page_count: ページ数
+        sections: 1 ページあたりのセクション数（本文の大きさ）
+        rtt_ms: 1 リクエストあたりの往復遅延
+        space_key: ページが属するスペース
+    """
+
+    def __init__(self, page_count: int = 50, sections: int = 8, rtt_ms: float = 150.0, space_key: str = "DEV"):
+        self.rtt_ms = rtt_ms
+        self.space_key = space_key
+        self.stats = FakeConfluenceStats()
+        self._lock = threading.Lock()
+        body = build_page(sections)
+        self.pages = {
+            str(100000 + i): {
+                "id": str(100000 + i),
+                "type": "page",
+                "title": f"{TOPICS[i % len(TOPICS)]} ({i})",
+                "version": {"number": 1},
+                "space": {"key": space_key, "name": space_key},
+                "body": {"storage": {"value": f"<h1>{TOPICS[i % len(TOPICS)]}</h1>{body}", "representation": "storage"}},
+            }
+            for i in range(page_count)
+        }
+        self._server: ThreadingHTTPServer | None = None
+
+    @property
+    def url(self) -> str:
+        """CONFLUENCE_URL に設定する URL"""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeConfluence":
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-confluence", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    # ---------------------------------
+    # リクエスト処理
+    # ---------------------------------
+
+    def _handle(self, handler: BaseHTTPRequestHandler) -> None:
+        url = urlparse(handler.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        path = url.path.rstrip("/")
+
+        match = _CONTENT_PATH.search(path)
+        if match:
+            status, data = self._get_page(match.group(1), params.get("expand", ""))
+        elif path.endswith("/rest/api/search"):
+            status, data = 200, self._search(params.get("cql", ""), int(params.get("limit", "25")))
+        elif path.endswith("/rest/api/content"):
+            status, data = 200, self._list_pages(int(params.get("start", "0")), int(params.get("limit", "25")))
+        else:
+            status, data = 404, {"message": f"not found: {path}"}
+
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        route = "/content/{id}" if match else path.rsplit("/rest/api", 1)[-1]
+        with self._lock:
+            self.stats.requests += 1
+            self.stats.bytes_sent += len(body)
+            self.stats.by_path[route] = self.stats.by_path.get(route, 0) + 1
+
+        # ネットワーク遅延の模擬（サーバーのスレッドで待つので、クライアントのスレッドプールが埋まる様子も再現される）
+        time.sleep(self.rtt_ms / 1000)
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def _get_page(self, page_id: str, expand: str) -> tuple[int, dict]:
+        page = self.pages.get(page_id)
+        if page is None:
+            return 404, {"message": f"No content found with id: {page_id}"}
+        if "body.storage" in expand:
+            return 200, page
+        return 200, {k: v for k, v in page.items() if k != "body"}
+
+    def _search(self, cql: str, limit: int) -> dict:
+        terms = [t.replace('\\"', '"').replace("\\\\", "\\") for t in _CQL_TERM.findall(cql)]
+        words = [w.strip("\\") for t in terms for w in t.split() if w.strip("\\")]
+        results = []
+        for page in self.pages.values():
+            text = page["title"] + page["body"]["storage"]["value"]
+            if all(w in text for w in words):
+                results.append({
+                    "content": {"id": page["id"], "type": "page", "title": page["title"]},
+                    "resultGlobalContainer": {"title": page["space"]["name"]},
+                })
+            if len(results) >= limit:
+                break
+        return {"results": results, "size": len(results)}
+
+    def _list_pages(self, start: int, limit: int) -> dict:
+        pages = list(self.pages.values())[start:start + limit]
+        return {"results": pages, "size": len(pages), "start": start, "limit": limit}
@@ -0,0 +1,240 @@
+# =====================================
+# ベンチマーク用の Graph API スタンドイン
+# =====================================
+#
+# 記録した Graph のレスポンス（fixtures/graph_fixture.json）を元に、
+# calendarView / To Do の一覧 API を httpx.MockTransport として再現する。
+# $select / $top / $filter / $orderby / @odata.nextLink / gzip に対応し、
+# RTT と帯域を指定してネットワーク遅延も模擬する。
+#
+# 参加者の空き状況（POST /me/calendar/getSchedule, POST /me/findMeetingTimes）は、
+# メールアドレスを種にして生成した予定から答える（同じアドレスには常に同じ予定を返す）。
+
+import asyncio
+import copy
+import gzip
+import json
+import os
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+import httpx
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "graph_fixture.json")
+
+# $select を指定しても Graph が必ず返すフィールド
+_ALWAYS_RETURNED = ("@odata.etag", "id")
+
+
+@dataclass
+class FakeGraphStats:
+    """フェイクサーバー側で数えたリクエスト数と転送量"""
+
+    requests: int = 0
+    bytes_sent: int = 0
+    by_path: dict[str, int] = field(default_factory=dict)
+
+    def reset(self) -> None:
+        self.requests = 0
+        self.bytes_sent = 0
+        self.by_path.clear()
+
+
+class FakeGraph:
+    """
+    記録済みフィクスチャを返すフェイク Graph
+
+    Args:
+        event_count: calendarView が返す予定の件数（フィクスチャを複製して水増しする）
+        task_count: タスク一覧が返すタスクの件数
+        rtt_ms: 1 リクエストあたりの往復遅延
+        bandwidth_mbps: 帯域（レスポンスサイズに応じて遅延を足す）
+        honor_query: False にすると $select / $orderby / gzip を無視する（最適化前の挙動の再現）
+        attendee_events_per_day: getSchedule で参加者 1 人が 1 日に持つ予定の数
+        schedule_status: getSchedule が返すステータス（200 以外で findMeetingTimes へのフォールバックを再現）
+    """
+
+    def __init__(
+        self,
+        event_count: int = 50,
+        task_count: int = 50,
+        rtt_ms: float = 20.0,
+        bandwidth_mbps: float = 50.0,
+        honor_query: bool = True,
+        attendee_events_per_day: int = 4,
+        schedule_status: int = 200,
+    ):
+        with open(FIXTURE_PATH, encoding="utf-8") as f:
+            fixture = json.load(f)
+        self.events = _replicate(fixture["calendarView"], event_count)
+        self.lists = fixture["todoLists"]
+        self.tasks = _replicate(fixture["todoTasks"], task_count)
+        self.rtt_ms = rtt_ms
+        self.bandwidth_mbps = bandwidth_mbps
+        self.honor_query = honor_query
+        self.attendee_events_per_day = attendee_events_per_day
+        self.schedule_status = schedule_status
+        self.stats = FakeGraphStats()
+
+    def transport(self) -> httpx.MockTransport:
+        """graph_client.set_graph_transport() に渡すトランスポート"""
+        return httpx.MockTransport(self.handle)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path.removeprefix("/v1.0")
+        params = request.url.params
+
+        if request.method == "POST" and path == "/me/calendar/getSchedule":
+            if self.schedule_status != 200:
+                return await self._respond(
+                    request, path, {"error": {"code": "ErrorAccessDenied", "message": path}}, self.schedule_status
+                )
+            return await self._respond(request, path, self._get_schedule(json.loads(request.content)))
+        if request.method == "POST" and path == "/me/findMeetingTimes":
+            return await self._respond(request, path, self._find_meeting_times(json.loads(request.content)))
+
+        if path == "/me/calendarView":
+            items = self.events
+            if self.honor_query and params.get("$orderby") == "start/dateTime":
+                items = sorted(items, key=lambda ev: ev["start"]["dateTime"])
+        elif path == "/me/todo/lists":
+            items = self.lists
+        elif path.startswith("/me/todo/lists/") and path.endswith("/tasks"):
+            items = self.tasks
+            if params.get("$filter") == "status ne 'completed'":
+                items = [t for t in items if t.get("status") != "completed"]
+        else:
+            return httpx.Response(404, json={"error": {"code": "ResourceNotFound", "message": path}})
+
+        # ページング（$top / $skip と @odata.nextLink）
+        top = int(params.get("$top", "10" if path == "/me/calendarView" else "100"))
+        skip = int(params.get("$skip", "0"))
+        page = items[skip:skip + top]
+        if self.honor_query and params.get("$select"):
+            selected = set(params["$select"].split(",")) | set(_ALWAYS_RETURNED)
+            page = [{k: v for k, v in item.items() if k in selected} for item in page]
+
+        data: dict = {"value": page}
+        if skip + top < len(items):
+            next_url = request.url.copy_merge_params({"$skip": str(skip + top)})
+            data["@odata.nextLink"] = str(next_url)
+        return await self._respond(request, path, data)
+
+    async def _respond(self, request: httpx.Request, path: str, data: dict, status: int = 200) -> httpx.Response:
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        accepts_gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+        if self.honor_query and accepts_gzip:
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+
+        self.stats.requests += 1
+        self.stats.bytes_sent += len(body)
+        self.stats.by_path[path] = self.stats.by_path.get(path, 0) + 1
+
+        # ネットワーク遅延の模擬（RTT + 転送時間）
+        delay = self.rtt_ms / 1000 + len(body) * 8 / (self.bandwidth_mbps * 1_000_000)
+        await asyncio.sleep(delay)
+        return httpx.Response(status, content=body, headers=headers)
+
+    # ---------------------------------
+    # 空き状況
+    # ---------------------------------
+
+    def attendee_items(self, email: str, start: datetime, end: datetime, tz_name: str) -> list[dict]:
+        """参加者の予定（getSchedule の scheduleItems の形式）"""
+        return [
+            {
+                "isPrivate": False,
+                "status": status,
+                "subject": f"{email} の予定",
+                "location": "",
+                "start": {"dateTime": s.strftime("%Y-%m-%dT%H:%M:%S.0000000"), "timeZone": tz_name},
+                "end": {"dateTime": e.strftime("%Y-%m-%dT%H:%M:%S.0000000"), "timeZone": tz_name},
+            }
+            for s, e, status in generate_busy(email, start, end, self.attendee_events_per_day)
+        ]
+
+    def _get_schedule(self, body: dict) -> dict:
+        tz_name = body["startTime"]["timeZone"]
+        start = datetime.fromisoformat(body["startTime"]["dateTime"][:19])
+        end = datetime.fromisoformat(body["endTime"]["dateTime"][:19])
+        interval = int(body.get("availabilityViewInterval", 30))
+        values = []
+        for email in body["schedules"]:
+            if email.startswith("unknown"):
+                values.append({
+                    "scheduleId": email,
+                    "error": {"message": "The user or group is not found.", "responseCode": "ErrorMailRecipientNotFound"},
+                })
+                continue
+            values.append({
+                "scheduleId": email,
+                "availabilityView": "0" * max(1, int((end - start).total_seconds() // 60 // interval)),
+                "scheduleItems": self.attendee_items(email, start, end, tz_name),
+                "workingHours": {"startTime": "09:00:00.0000000", "endTime": "18:00:00.0000000"},
+            })
+        return {"value": values}
+
+    def _find_meeting_times(self, body: dict) -> dict:
+        """要求された枠を 30 分刻みで調べ、全参加者が busy / oof でない時間を提案する"""
+        duration = timedelta(minutes=int(body["meetingDuration"].removeprefix("PT").removesuffix("M")))
+        emails = [a["emailAddress"]["address"] for a in body["attendees"]]
+        suggestions = []
+        for time_slot in body["timeConstraint"]["timeSlots"]:
+            tz_name = time_slot["start"]["timeZone"]
+            slot_start = datetime.fromisoformat(time_slot["start"]["dateTime"][:19])
+            slot_end = datetime.fromisoformat(time_slot["end"]["dateTime"][:19])
+            busy = [
+                (s, e) for email in emails
+                for s, e, status in generate_busy(email, slot_start, slot_end, self.attendee_events_per_day)
+                if status != "tentative"
+            ]
+            cursor = slot_start
+            while cursor + duration <= slot_end and len(suggestions) < body.get("maxCandidates", 20):
+                if not any(s < cursor + duration and e > cursor for s, e in busy):
+                    suggestions.append({
+                        "confidence": 100.0,
+                        "meetingTimeSlot": {
+                            "start": {"dateTime": cursor.strftime("%Y-%m-%dT%H:%M:%S.0000000"), "timeZone": tz_name},
+                            "end": {"dateTime": (cursor + duration).strftime("%Y-%m-%dT%H:%M:%S.0000000"), "timeZone": tz_name},
+                        },
+                    })
+                cursor += timedelta(minutes=30)
+        return {"emptySuggestionsReason": "" if suggestions else "AttendeesUnavailable", "meetingTimeSuggestions": suggestions}
+
+
+def generate_busy(owner: str, start: datetime, end: datetime, per_day: int) -> list[tuple[datetime, datetime, str]]:
+    """
+    owner を種にして、start 〜 end の各平日に per_day 件の予定（開始・終了・状態）を生成する
+
+    同じ owner・同じ日には常に同じ予定を返す（期間の指定が変わっても日ごとの予定は変わらない）
+    """
+    items = []
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day < end:
+        if day.weekday() < 5:
+            rng = random.Random(f"{owner}:{day.date()}")
+            for _ in range(per_day):
+                event_start = day + timedelta(hours=rng.randint(9, 17), minutes=rng.choice([0, 30]))
+                event_end = event_start + timedelta(minutes=rng.choice([30, 30, 60, 60, 90]))
+                status = rng.choices(["busy", "tentative", "oof"], weights=[16, 3, 1])[0]
+                if event_end > start and event_start < end:
+                    items.append((event_start, event_end, status))
+        day += timedelta(days=1)
+    return sorted(items)
+
+
+def _replicate(items: list[dict], count: int) -> list[dict]:
+    """フィクスチャのアイテムを count 件になるまで複製する（id は重複しないように振り直す）"""
+    result = []
+    for i in range(count):
+        item = copy.deepcopy(items[i % len(items)])
+        item["id"] = f"{item['id']}-{i}"
+        if "subject" in item:
+            item["subject"] = f"{item['subject']} #{i}"
+        if "title" in item:
+            item["title"] = f"{item['title']} #{i}"
+        result.append(item)
+    return result
@@ -0,0 +1,244 @@
+# =====================================
+# 会議の空き枠検索（find_free_slots）のベンチマーク
+# =====================================
+#
+# 1. ツールの比較: 来週 1 週間・参加者 N 名の日程調整で、モデルが読むテキストの量と Graph の呼び出しを比べる
+#    - get_schedule: 以前の方法。自分の予定を一覧してモデルが空きを探す（参加者の予定は見えない）
+#    - 予定の一覧（参加者を含む）: 参加者の予定もモデルに渡して探させる場合に必要なテキスト（ローカルで整形）
+#    - find_free_slots: 空き枠をサーバー側で計算し、候補だけを返す（getSchedule / findMeetingTimes）
+# 2. 空き枠の計算: free_slots.find_slots（ソート + 1 回の走査）と、刻みごとに全予定との重なりを調べる
+#    素朴な方法の処理時間を比べ、find_slots の候補（仮の予定と重ならないもの）が素朴な方法の結果に
+#    含まれ、最も早い候補が一致することを確かめる
+#
+# 実行方法（amplify/agent ディレクトリで）:
+#   python -m bench.free_slots_bench
+#   python -m bench.free_slots_bench --attendees 8 --events-per-day 4 --algo-events 300 --algo-weeks 8
+
+import argparse
+import asyncio
+import contextlib
+import io
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import graph_client
+from bench.fake_graph import FakeGraph, generate_busy
+from free_slots import Availability, find_slots, merge_intervals, working_windows
+from graph_cache import graph_cache
+from history import estimate_tokens
+from tool_context import set_tool_context
+
+TIMEZONE = "Asia/Tokyo"
+
+with contextlib.redirect_stdout(io.StringIO()):
+    from app import find_free_slots, get_schedule
+
+
+def _next_monday(tz: ZoneInfo) -> datetime:
+    now = datetime.now(tz)
+    return (now + timedelta(days=7 - now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _tokens(text: str) -> int:
+    return estimate_tokens([{"text": text}])
+
+
+# ---------------------------------
+# 1. ツールの比較
+# ---------------------------------
+
+def _fake_graph(args, start: datetime, schedule_status: int = 200) -> FakeGraph:
+    """自分の予定も参加者と同じ方法で生成したフェイク Graph"""
+    fake = FakeGraph(
+        rtt_ms=args.rtt_ms,
+        attendee_events_per_day=args.events_per_day,
+        schedule_status=schedule_status,
+    )
+    naive_start = start.replace(tzinfo=None)
+    fake.events = [
+        {
+            "id": f"me-{i}",
+            "subject": f"定例ミーティング #{i}",
+            "showAs": status,
+            "isCancelled": False,
+            "isAllDay": False,
+            "start": {"dateTime": s.strftime("%Y-%m-%dT%H:%M:%S.0000000"), "timeZone": TIMEZONE},
+            "end": {"dateTime": e.strftime("%Y-%m-%dT%H:%M:%S.0000000"), "timeZone": TIMEZONE},
+        }
+        for i, (s, e, status) in enumerate(
+            generate_busy("me@example.com", naive_start, naive_start + timedelta(days=7), args.events_per_day)
+        )
+    ]
+    return fake
+
+
+async def _measure(fake: FakeGraph, call, repeat: int) -> dict:
+    fake.stats.reset()
+    latencies = []
+    output = ""
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = await call()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        "chars": len(output),
+        "tokens": _tokens(output),
+        "requests": fake.stats.requests // repeat,
+        "bytes": fake.stats.bytes_sent // repeat,
+        "p50_ms": statistics.median(latencies),
+        "output": output,
+    }
+
+
+async def compare_tools(args) -> None:
+    # Graph 呼び出しを比べたいので、読み取りキャッシュは使わない
+    graph_cache.enabled = False
+    set_tool_context("bench-token", TIMEZONE)
+    tz = ZoneInfo(TIMEZONE)
+    start = _next_monday(tz)
+    end = start + timedelta(days=7)
+    attendees = [f"member{i}@example.com" for i in range(args.attendees)]
+
+    rows = []
+    fake = _fake_graph(args, start)
+    graph_client.set_graph_transport(fake.transport())
+    with contextlib.redirect_stdout(io.StringIO()):
+        schedule = await _measure(fake, lambda: get_schedule(start.isoformat(), end.isoformat()), args.repeat)
+    rows.append(("get_schedule (自分のみ)", schedule))
+
+    # 参加者の予定も get_schedule と同じ形式でモデルに渡した場合
+    lines = [schedule["output"]]
+    for email in attendees:
+        lines.append(f"{email}:")
+        for item in fake.attendee_items(email, start.replace(tzinfo=None), end.replace(tzinfo=None), TIMEZONE):
+            lines.append(f"- {item['start']['dateTime'][:16]}〜{item['end']['dateTime'][11:16]} {item['status']}")
+    dump = "\n".join(lines)
+    rows.append(("予定の一覧 (参加者を含む)", {"chars": len(dump), "tokens": _tokens(dump)}))
+
+    call = lambda: find_free_slots(  # noqa: E731
+        start.isoformat(), end.isoformat(), args.duration, attendees, buffer_minutes=args.buffer
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        slots = await _measure(fake, call, args.repeat)
+    rows.append(("find_free_slots", slots))
+
+    fallback = _fake_graph(args, start, schedule_status=403)
+    graph_client.set_graph_transport(fallback.transport())
+    with contextlib.redirect_stdout(io.StringIO()):
+        rows.append(("find_free_slots (findMeetingTimes)", await _measure(fallback, call, args.repeat)))
+    await graph_client.close_graph_client()
+
+    print(
+        f"期間={start.date()}〜{(end - timedelta(days=1)).date()} 参加者={args.attendees} "
+        f"予定={args.events_per_day}件/人/日 会議={args.duration}分 余裕={args.buffer}分 rtt={args.rtt_ms:.0f}ms"
+    )
+    print(f"{'方法':<36}{'出力(文字)':>12}{'推定トークン':>14}{'requests':>10}{'bytes':>10}{'p50':>10}")
+    for label, row in rows:
+        requests = f"{row['requests']}" if "requests" in row else "-"
+        size = f"{row['bytes']}" if "bytes" in row else "-"
+        latency = f"{row['p50_ms']:.1f}ms" if "p50_ms" in row else "-"
+        print(f"{label:<36}{row['chars']:>12}{row['tokens']:>14}{requests:>10}{size:>10}{latency:>10}")
+    print()
+    print(slots["output"])
+
+
+# ---------------------------------
+# 2. 空き枠の計算
+# ---------------------------------
+
+def _random_availability(rng: random.Random, start: datetime, weeks: int, people: int, events: int) -> Availability:
+    """1 人あたり events 件の予定を、期間内の平日 8:00〜19:00 にランダムに置く"""
+    availability = Availability()
+    days = [start + timedelta(days=d) for d in range(weeks * 7) if (start + timedelta(days=d)).weekday() < 5]
+    for _ in range(people):
+        for _ in range(events):
+            event_start = rng.choice(days) + timedelta(minutes=rng.randrange(8 * 60, 19 * 60, 15))
+            event_end = event_start + timedelta(minutes=rng.choice([15, 30, 30, 60, 90]))
+            availability.add(rng.choices(["busy", "tentative"], weights=[4, 1])[0], event_start, event_end)
+    return availability
+
+
+def _naive_slots(availability: Availability, windows, duration: timedelta, buffer: timedelta, step: timedelta):
+    """刻みごとに全予定との重なりを調べて、予定と重ならない開始時刻をすべて求める（比較用）"""
+    blocked = [(s - buffer, e + buffer) for s, e in availability.busy + availability.tentative]
+    starts = []
+    for window_start, window_end in windows:
+        midnight = window_start.replace(hour=0, minute=0)
+        candidate = midnight + step * -(-(window_start - midnight) // step)
+        while candidate + duration <= window_end:
+            if not any(s < candidate + duration and e > candidate for s, e in blocked):
+                starts.append(candidate)
+            candidate += step
+    return starts
+
+
+def compare_algorithms(args) -> None:
+    tz = ZoneInfo(TIMEZONE)
+    start = _next_monday(tz)
+    end = start + timedelta(weeks=args.algo_weeks)
+    duration = timedelta(minutes=args.duration)
+    buffer = timedelta(minutes=args.buffer)
+    step = timedelta(minutes=15)
+    work_start, work_end = datetime.strptime("09:00", "%H:%M").time(), datetime.strptime("18:00", "%H:%M").time()
+    availability = _random_availability(
+        random.Random(0), start, args.algo_weeks, args.algo_attendees + 1, args.algo_events
+    )
+
+    def run_sweep():
+        return find_slots(
+            availability, start, end, duration,
+            work_start=work_start, work_end=work_end, buffer=buffer, step=step, max_results=args.algo_results,
+        )
+
+    def run_naive():
+        windows = working_windows(start, end, work_start, work_end)
+        return _naive_slots(availability, windows, duration, buffer, step)
+
+    timings = {}
+    for label, fn in (("find_slots", run_sweep), ("素朴な方法", run_naive)):
+        samples = []
+        for _ in range(args.algo_repeat):
+            started = time.perf_counter()
+            result = fn()
+            samples.append((time.perf_counter() - started) * 1000)
+        timings[label] = (statistics.median(samples), result)
+
+    sweep_ms, slots = timings["find_slots"]
+    naive_ms, naive_starts = timings["素朴な方法"]
+    firm_starts = sorted(s.start for s in slots if s.tentative_minutes == 0)
+    consistent = set(firm_starts) <= set(naive_starts) and firm_starts[:1] == naive_starts[:1]
+    total = len(availability.busy) + len(availability.tentative)
+    print(
+        f"空き枠の計算: 予定 {total} 件（{args.algo_attendees + 1} 人 × {args.algo_events} 件、{args.algo_weeks} 週間）"
+        f" 確定 {len(merge_intervals(availability.busy, buffer))} 区間にまとめた"
+    )
+    print(f"  find_slots    {sweep_ms:8.2f}ms  候補 {len(slots)} 件（空き時間ごとに 1 件）")
+    print(f"  素朴な方法    {naive_ms:8.2f}ms  開始時刻 {len(naive_starts)} 件")
+    print(f"  find_slots の候補が素朴な方法の結果と矛盾しないか: {'一致' if consistent else '不一致'}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="会議の空き枠検索のベンチマーク")
+    parser.add_argument("--attendees", type=int, default=3, help="参加者の人数（ツールの比較）")
+    parser.add_argument("--events-per-day", type=int, default=3, help="1 人が 1 日に持つ予定の数（ツールの比較）")
+    parser.add_argument("--duration", type=int, default=30, help="会議の長さ（分）")
+    parser.add_argument("--buffer", type=int, default=10, help="前後の予定との間に空ける時間（分）")
+    parser.add_argument("--rtt-ms", type=float, default=20.0, help="フェイク Graph の往復遅延")
+    parser.add_argument("--repeat", type=int, default=5, help="ツールの比較の繰り返し回数")
+    parser.add_argument("--algo-events", type=int, default=100, help="空き枠の計算: 1 人あたりの予定の数")
+    parser.add_argument("--algo-attendees", type=int, default=3, help="空き枠の計算: 参加者の人数（自分を除く）")
+    parser.add_argument("--algo-weeks", type=int, default=8, help="空き枠の計算: 期間（週）")
+    parser.add_argument("--algo-results", type=int, default=1000, help="空き枠の計算: 返す候補の最大数")
+    parser.add_argument("--algo-repeat", type=int, default=5, help="空き枠の計算の繰り返し回数")
+    args = parser.parse_args()
+
+    asyncio.run(compare_tools(args))
+    print()
+    compare_algorithms(args)
+
+
+if __name__ == "__main__":
+    main()
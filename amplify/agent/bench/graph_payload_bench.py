@@ -0,0 +1,88 @@
+# =====================================
+# Graph ツールの転送量・レイテンシのベンチマーク
+# =====================================
+#
+# 記録済みフィクスチャを返すフェイク Graph に対して Graph 読み取りツールを実行し、
+# 最適化前（$select / gzip なし）と最適化後の転送バイト数とツールのレイテンシを比較する。
+#
+# 実行方法（amplify/agent ディレクトリで）:
+#   python -m bench.graph_payload_bench
+#   python -m bench.graph_payload_bench --events 200 --rtt-ms 40 --bandwidth-mbps 20
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import graph_client
+from graph_cache import graph_cache
+from app import get_schedule, get_task_lists, get_tasks
+from bench.fake_graph import FakeGraph
+from tool_context import set_tool_context
+
+
+async def _measure(fake: FakeGraph, name: str, call, repeat: int) -> dict:
+    """ツールを repeat 回実行して、1 回あたりの転送量とレイテンシを求める"""
+    fake.stats.reset()
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output = await call()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        "tool": name,
+        "bytes": fake.stats.bytes_sent // repeat,
+        "requests": fake.stats.requests // repeat,
+        "p50_ms": statistics.median(latencies),
+        "output_chars": len(output),
+    }
+
+
+async def run(args) -> None:
+    # 転送量を比べたいので、読み取りキャッシュは使わない
+    graph_cache.enabled = False
+    set_tool_context("bench-token", "Asia/Tokyo")
+
+    results = {}
+    for mode, honor_query in (("before", False), ("after", True)):
+        fake = FakeGraph(
+            event_count=args.events,
+            task_count=args.tasks,
+            rtt_ms=args.rtt_ms,
+            bandwidth_mbps=args.bandwidth_mbps,
+            honor_query=honor_query,
+        )
+        graph_client.set_graph_transport(fake.transport())
+
+        calls = [
+            ("get_schedule", lambda: get_schedule("2026-01-15T00:00:00+09:00", "2026-01-22T00:00:00+09:00")),
+            ("get_task_lists", lambda: get_task_lists()),
+            ("get_tasks", lambda: get_tasks("list-1")),
+        ]
+        results[mode] = [await _measure(fake, name, call, args.repeat) for name, call in calls]
+        await graph_client.close_graph_client()
+
+    graph_client.set_graph_transport(None)
+
+    print(f"events={args.events} tasks={args.tasks} rtt={args.rtt_ms}ms bandwidth={args.bandwidth_mbps}Mbps")
+    print(f"{'tool':<16}{'bytes before':>14}{'bytes after':>13}{'ratio':>8}{'p50 before':>13}{'p50 after':>12}")
+    for before, after in zip(results["before"], results["after"]):
+        ratio = after["bytes"] / before["bytes"] if before["bytes"] else 0
+        print(
+            f"{before['tool']:<16}{before['bytes']:>14,}{after['bytes']:>13,}{ratio:>8.3f}"
+            f"{before['p50_ms']:>11.1f}ms{after['p50_ms']:>10.1f}ms"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Graph ツールの転送量・レイテンシのベンチマーク")
+    parser.add_argument("--events", type=int, default=50, help="calendarView が返す予定の件数")
+    parser.add_argument("--tasks", type=int, default=50, help="タスク一覧が返すタスクの件数")
+    parser.add_argument("--rtt-ms", type=float, default=20.0, help="1 リクエストあたりの往復遅延")
+    parser.add_argument("--bandwidth-mbps", type=float, default=50.0, help="模擬する帯域")
+    parser.add_argument("--repeat", type=int, default=5, help="各ツールの実行回数")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# =====================================
+# コールドスタートのベンチマーク
+# =====================================
+#
+# 新しいプロセス（microVM の起動直後に相当）で以下を測る。各サンプルは別プロセスで実行する:
+# - app の import 時間（--eager-atlassian で、以前のように atlassian を先に import した場合と比べる）
+# - 最初のリクエストの、最初のテキストまでの時間と完了までの時間
+#   - cold: ウォームアップなし（最初のリクエストが BedrockModel と Confluence ツールを作る）
+#   - warm: コンテナの初期化中に warm_up() が済んでいる場合
+#
+# オフラインでは BedrockModel を実際に作成し（boto3 クライアントの作成を含む）、ストリームだけを
+# スクリプト化したモデル（bench/agent_bench.py）に置き換える。Graph / Confluence はフェイクを使う。
+# 認証情報の解決と Bedrock への TLS 接続は --live（実際の Bedrock を呼ぶ）でだけ計測される。
+#
+# 実行方法（amplify/agent ディレクトリで）:
+#   python -m bench.startup_bench
+#   python -m bench.startup_bench --samples 10 --importtime
+#   python -m bench.startup_bench --live   # AWS の認証情報が必要
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PROMPT = "会議室の予約方法を Confluence で調べて"
+# -X importtime の内訳に表示するパッケージ
+TOP_PACKAGES = ["strands", "bedrock_agentcore", "opentelemetry", "boto3", "httpx", "atlassian", "requests"]
+
+
+# ---------------------------------
+# 子プロセス（1 サンプル）
+# ---------------------------------
+
+def run_child(args) -> None:
+    import contextlib
+    import io
+
+    # ローカルのキャッシュに前のサンプルのページが残っていると初回にならないので無効にする
+    os.environ["CONFLUENCE_CACHE_DIR"] = ""
+
+    # app の import を最初に測る（ベンチマーク側の import で strands などが先に読み込まれないように）
+    eager_ms = 0.0
+    if args.eager_atlassian:
+        eager_started = time.perf_counter()
+        import atlassian  # noqa: F401
+        eager_ms = (time.perf_counter() - eager_started) * 1000
+    import_started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app
+        import graph_client
+    import_ms = (time.perf_counter() - import_started) * 1000 + eager_ms
+
+    import asyncio
+    from types import SimpleNamespace
+
+    from bench.agent_bench import ModelStats, ScriptedModel
+    from bench.fake_confluence import FakeConfluence
+    from bench.fake_graph import FakeGraph
+
+    fake_confluence = FakeConfluence(rtt_ms=args.confluence_rtt_ms).start()
+    os.environ["CONFLUENCE_URL"] = fake_confluence.url
+    os.environ["CONFLUENCE_EMAIL"] = "bench@example.com"
+    os.environ["CONFLUENCE_API_TOKEN"] = "bench"
+
+    graph_client.set_graph_transport(FakeGraph(rtt_ms=args.graph_rtt_ms).transport())
+    if not args.live:
+        scripted = ScriptedModel(args.model_ms, args.token_ms, ModelStats())
+
+        class OfflineBedrockModel(app.BedrockModel):
+            """作成（boto3 クライアント）は本物、ストリームだけスクリプト化したモデル"""
+
+            def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+                return scripted.stream(messages, tool_specs, system_prompt, **kwargs)
+
+        app.BedrockModel = OfflineBedrockModel
+
+    warm_ms = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        if args.child == "warm":
+            warm_started = time.perf_counter()
+            app.warm_up()
+            warm_ms = (time.perf_counter() - warm_started) * 1000
+
+    async def first_request() -> tuple[float | None, float]:
+        payload = {"prompt": PROMPT, "msGraphAccessToken": "bench-token", "userTimeZone": "Asia/Tokyo"}
+        request_started = time.perf_counter()
+        first_text_ms = None
+        async for event in app.invoke_agent(payload, SimpleNamespace(session_id="startup-bench")):
+            if event.get("type") == "text" and first_text_ms is None:
+                first_text_ms = (time.perf_counter() - request_started) * 1000
+        return first_text_ms, (time.perf_counter() - request_started) * 1000
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        first_text_ms, request_ms = asyncio.run(first_request())
+    fake_confluence.stop()
+    # 本番と同じクライアントで測る（作れなければ Confluence 抜きの数字にせず、ここで止める。計測後なので時間には含めない）
+    if not app.get_confluence_tools():
+        sys.exit("[Bench] Confluence のツールを作成できませんでした（ログを確認してください）")
+    print(json.dumps({
+        "import_ms": import_ms,
+        "warm_ms": warm_ms,
+        "first_text_ms": first_text_ms,
+        "request_ms": request_ms,
+    }))
+
+
+# ---------------------------------
+# 親プロセス（集計）
+# ---------------------------------
+
+def _spawn(args, mode: str, eager_atlassian: bool = False) -> dict:
+    command = [
+        sys.executable, "-m", "bench.startup_bench", "--child", mode,
+        "--model-ms", str(args.model_ms), "--token-ms", str(args.token_ms),
+        "--graph-rtt-ms", str(args.graph_rtt_ms), "--confluence-rtt-ms", str(args.confluence_rtt_ms),
+    ]
+    if eager_atlassian:
+        command.append("--eager-atlassian")
+    if args.live:
+        command.append("--live")
+    env = dict(os.environ)
+    if not args.live:
+        # オフラインでは認証情報の探索で EC2 メタデータに問い合わせない（タイムアウト待ちを避ける）
+        env["AWS_EC2_METADATA_DISABLED"] = "true"
+    output = subprocess.run(command, capture_output=True, text=True, env=env, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _importtime() -> dict[str, float]:
+    """-X importtime で、主なパッケージの import 時間（累積、ミリ秒）を求める"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"], capture_output=True, text=True, check=True
+    )
+    times: dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].strip()
+        if name in TOP_PACKAGES and name not in times:
+            times[name] = int(parts[1]) / 1000
+    return times
+
+
+def _p50(samples: list[dict], key: str) -> str:
+    values = [s[key] for s in samples if s.get(key) is not None]
+    return f"{statistics.median(values):.0f}ms" if values else "-"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="コールドスタートのベンチマーク")
+    parser.add_argument("--samples", type=int, default=5, help="各モードのサンプル数（それぞれ新しいプロセス）")
+    parser.add_argument("--model-ms", type=float, default=300.0, help="スクリプト化したモデルの最初のチャンクまでの遅延")
+    parser.add_argument("--token-ms", type=float, default=2.0, help="テキスト差分 1 つあたりの遅延")
+    parser.add_argument("--graph-rtt-ms", type=float, default=20.0, help="フェイク Graph の往復遅延")
+    parser.add_argument("--confluence-rtt-ms", type=float, default=150.0, help="フェイク Confluence の往復遅延")
+    parser.add_argument("--importtime", action="store_true", help="-X importtime の主なパッケージの内訳を表示する")
+    parser.add_argument("--live", action="store_true", help="実際の Bedrock を呼ぶ（AWS の認証情報が必要）")
+    parser.add_argument("--child", choices=["cold", "warm"], help=argparse.SUPPRESS)
+    parser.add_argument("--eager-atlassian", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    rows = [
+        ("cold (eager atlassian)", [_spawn(args, "cold", eager_atlassian=True) for _ in range(args.samples)]),
+        ("cold", [_spawn(args, "cold") for _ in range(args.samples)]),
+        ("warm", [_spawn(args, "warm") for _ in range(args.samples)]),
+    ]
+    print(f"samples={args.samples} model={'live' if args.live else f'{args.model_ms:.0f}ms (scripted)'} prompt={PROMPT}")
+    print(f"{'mode':<24}{'import app':>12}{'warm_up':>10}{'first text':>12}{'request':>10}")
+    for label, samples in rows:
+        print(
+            f"{label:<24}{_p50(samples, 'import_ms'):>12}{_p50(samples, 'warm_ms'):>10}"
+            f"{_p50(samples, 'first_text_ms'):>12}{_p50(samples, 'request_ms'):>10}"
+        )
+    print("eager atlassian: 以前のように app の import 時に atlassian も読み込んだ場合（import app に含む）")
+    if args.importtime:
+        print("import の内訳（累積）: " + ", ".join(f"{k}={v:.0f}ms" for k, v in _importtime().items()))
+
+
+if __name__ == "__main__":
+    main()
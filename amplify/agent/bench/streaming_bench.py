@@ -0,0 +1,235 @@
+# =====================================
+# ストリーミングイベント変換のマイクロベンチマーク
+# =====================================
+#
+# 記録済みの Strands イベントストリーム（fixtures/strands_events.jsonl）を再生し、
+# 以前の convert_event と、新しい convert_event / StreamConverter（まとめ送りあり・なし）の
+# 1 イベントあたりの処理時間と、送信する SSE のメッセージ数・バイト数を比べる。
+#
+# フィクスチャはスクリプト化したモデルで実際の Strands Agent を動かして記録したもの
+# （イベントの形は本物と同じ。JSON にできない値（agent やスパンなど）と、
+# 実行時には参照渡しで済む会話全体（messages / tool_config / system_prompt）は除いてある）。
+#
+# 実行方法（amplify/agent ディレクトリで）:
+#   python -m bench.streaming_bench
+#   python -m bench.streaming_bench --record   # フィクスチャを作り直す
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from types import SimpleNamespace
+
+from streaming import StreamConverter, convert_event
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "strands_events.jsonl")
+# 記録しないキー（実行時は同じオブジェクトへの参照で、変換処理は触らない）
+_SKIPPED_KEYS = {"messages", "tool_config", "system_prompt"}
+
+
+def legacy_convert_event(event) -> dict | None:
+    """最適化前の convert_event（比較用にそのまま残している）"""
+    try:
+        if not hasattr(event, 'get'):
+            return None
+
+        inner_event = event.get('event')
+        if not inner_event:
+            return None
+
+        content_block_delta = inner_event.get('contentBlockDelta')
+        if content_block_delta:
+            delta = content_block_delta.get('delta', {})
+            text = delta.get('text')
+            if text:
+                return {'type': 'text', 'data': text}
+
+        content_block_start = inner_event.get('contentBlockStart')
+        if content_block_start:
+            start = content_block_start.get('start', {})
+            tool_use = start.get('toolUse')
+            if tool_use:
+                tool_name = tool_use.get('name', 'unknown')
+                return {'type': 'tool_use', 'tool_name': tool_name}
+
+        return None
+    except Exception:
+        return None
+
+
+# ---------------------------------
+# フィクスチャの記録
+# ---------------------------------
+
+def _answer_deltas() -> list[str]:
+    """Claude のストリームに近い、数文字ずつのテキスト差分"""
+    answer = (
+        "今日の予定とタスクを確認しました。\n\n"
+        "**予定**\n- 10:00〜11:00 定例ミーティング（会議室A）\n- 14:00〜15:00 設計レビュー\n- 16:30〜17:00 1on1\n\n"
+        "**未完了のタスク**\n- 資料作成（期限: 今日 17:00、重要度: 高）\n- 経費精算（期限: 明日）\n\n"
+        "午前中は定例ミーティングまでに資料作成を進め、設計レビューの後に経費精算を片付けるのがおすすめです。"
+    ) * 3
+    deltas, i, sizes = [], 0, [1, 3, 2, 4, 2, 1, 5, 3]
+    while i < len(answer):
+        size = sizes[len(deltas) % len(sizes)]
+        deltas.append(answer[i:i + size])
+        i += size
+    return deltas
+
+
+async def _record() -> list[dict]:
+    from strands import Agent, tool
+    from strands.models.model import Model
+
+    @tool
+    async def get_task_lists() -> str:
+        """タスクリスト一覧"""
+        return "タスクリスト一覧:\n- タスク [デフォルト] (ID: list-1)"
+
+    @tool
+    async def get_schedule(start_iso: str, end_iso: str) -> str:
+        """予定一覧"""
+        return "予定一覧 (3件):\n- 定例ミーティング\n- 設計レビュー\n- 1on1"
+
+    class ScriptedModel(Model):
+        def __init__(self):
+            self.calls = 0
+
+        def update_config(self, **model_config):
+            pass
+
+        def get_config(self):
+            return {}
+
+        async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+            yield {}
+
+        async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+            self.calls += 1
+            yield {"messageStart": {"role": "assistant"}}
+            if self.calls == 1:
+                for text in ["確認", "します", "。"]:
+                    yield {"contentBlockDelta": {"delta": {"text": text}}}
+                yield {"contentBlockStop": {}}
+                for i, (name, args) in enumerate([
+                    ("get_task_lists", {}),
+                    ("get_schedule", {"start_iso": "2026-01-15T00:00:00+09:00", "end_iso": "2026-01-16T00:00:00+09:00"}),
+                ]):
+                    yield {"contentBlockStart": {"start": {"toolUse": {"toolUseId": f"tooluse_{i}", "name": name}}}}
+                    yield {"contentBlockDelta": {"delta": {"toolUse": {"input": json.dumps(args)}}}}
+                    yield {"contentBlockStop": {}}
+                yield {"messageStop": {"stopReason": "tool_use"}}
+            else:
+                for text in _answer_deltas():
+                    yield {"contentBlockDelta": {"delta": {"text": text}}}
+                yield {"contentBlockStop": {}}
+                yield {"messageStop": {"stopReason": "end_turn"}}
+            yield {"metadata": {"usage": {"inputTokens": 2400, "outputTokens": 180, "totalTokens": 2580}, "metrics": {"latencyMs": 900}}}
+
+    agent = Agent(model=ScriptedModel(), tools=[get_task_lists, get_schedule], callback_handler=None)
+    events = []
+    async for event in agent.stream_async("今日の予定とタスクを教えて"):
+        if "result" in event:
+            events.append({"result": {"stop_reason": str(event["result"].stop_reason)}})
+            continue
+        recorded = {}
+        for key, value in event.items():
+            if key in _SKIPPED_KEYS:
+                continue
+            try:
+                json.dumps(value)
+            except (TypeError, ValueError):
+                continue
+            recorded[key] = value
+        events.append(recorded)
+    return events
+
+
+def load_events() -> list[dict]:
+    with open(FIXTURE_PATH, encoding="utf-8") as f:
+        events = [json.loads(line) for line in f]
+    # AgentResult の代わり（stop_reason 属性だけを持つ）
+    for event in events:
+        if "result" in event:
+            event["result"] = SimpleNamespace(**event["result"])
+    return events
+
+
+# ---------------------------------
+# 計測
+# ---------------------------------
+
+def _measure(name: str, events: list[dict], run, repeat: int) -> dict:
+    outputs = run(events)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        run(events)
+    elapsed = time.perf_counter() - started
+    sse_bytes = sum(len(f"data: {json.dumps(o, ensure_ascii=False)}\n\n".encode("utf-8")) for o in outputs)
+    return {
+        "name": name,
+        "ns_per_event": elapsed / (repeat * len(events)) * 1e9,
+        "messages": len(outputs),
+        "bytes": sse_bytes,
+    }
+
+
+def _run_function(convert):
+    def run(events):
+        outputs = []
+        for event in events:
+            converted = convert(event)
+            if converted:
+                outputs.append(converted)
+        return outputs
+    return run
+
+
+def _run_converter(**kwargs):
+    def run(events):
+        converter = StreamConverter(**kwargs)
+        outputs = []
+        for event in events:
+            outputs.extend(converter.feed(event))
+        outputs.extend(converter.finish())
+        return outputs
+    return run
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ストリーミングイベント変換のマイクロベンチマーク")
+    parser.add_argument("--repeat", type=int, default=2000, help="ストリームを再生する回数")
+    parser.add_argument("--coalesce-chars", type=int, default=32, help="まとめ送りの文字数")
+    parser.add_argument("--record", action="store_true", help="フィクスチャを記録し直す")
+    args = parser.parse_args()
+
+    if args.record:
+        events = asyncio.run(_record())
+        with open(FIXTURE_PATH, "w", encoding="utf-8") as f:
+            for event in events:
+                f.write(json.dumps(event, ensure_ascii=False) + "\n")
+        print(f"{len(events)} イベントを記録しました: {FIXTURE_PATH}")
+
+    events = load_events()
+    results = [
+        _measure("legacy convert_event", events, _run_function(legacy_convert_event), args.repeat),
+        _measure("convert_event", events, _run_function(convert_event), args.repeat),
+        _measure("StreamConverter", events, _run_converter(coalesce_chars=0, extra_events=False), args.repeat),
+        _measure("StreamConverter+extra", events, _run_converter(coalesce_chars=0), args.repeat),
+        _measure(
+            f"StreamConverter+coalesce{args.coalesce_chars}",
+            events,
+            # 再生は一瞬で終わるので、時間ではなく文字数だけで区切られる
+            _run_converter(coalesce_chars=args.coalesce_chars, coalesce_ms=10_000),
+            args.repeat,
+        ),
+    ]
+    print(f"events={len(events)} repeat={args.repeat}")
+    print(f"{'converter':<28}{'ns/event':>10}{'SSE messages':>14}{'SSE bytes':>11}")
+    for r in results:
+        print(f"{r['name']:<28}{r['ns_per_event']:>10.0f}{r['messages']:>14}{r['bytes']:>11,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+# =====================================
+# 環境変数による設定値の読み込み
+# =====================================
+#
+# チューニング用のパラメータは環境変数で上書きできるようにしている。
+# 未設定や不正な値の場合はデフォルト値を使う（起動を止めない）。
+
+import os
+
+
+def env_int(name: str, default: int) -> int:
+    """環境変数を int として読む（未設定・不正値ならデフォルト）"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"[Config] {name}={value!r} は整数ではないため、デフォルト値 {default} を使用します")
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    """環境変数を float として読む（未設定・不正値ならデフォルト）"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        print(f"[Config] {name}={value!r} は数値ではないため、デフォルト値 {default} を使用します")
+        return default
+
+
+def env_bool(name: str, default: bool) -> bool:
+    """環境変数を bool として読む（1/true/yes/on を真とみなす）"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
@@ -0,0 +1,244 @@
+# =====================================
+# Confluence ページのローカルキャッシュ
+# =====================================
+#
+# get_confluence_page は、内容が変わっていないページでも毎回本文全体をダウンロードし直していた。
+# 変換済みの本文とバージョン番号を microVM のローカルディスクに保存し、
+# 次回はバージョンだけを取得して一致すればキャッシュから返す（本文のダウンロードと変換を省く）。
+#
+# - キーはページID（Confluence の認証情報はプロセス全体で共通なので、ユーザーごとには分けない）
+# - create_confluence_page / update_confluence_page の後は書き込んだ内容で更新する
+# - 合計サイズが上限を超えたら、最も長く使われていないページから削除する
+# - get / put / invalidate は同期的にディスクを読み書きするので、非同期のツールからは asyncio.to_thread で呼ぶ
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from config import env_int
+from telemetry import record_cache_lookup
+
+
+@dataclass
+class CachedPage:
+    """キャッシュ済みのページ（本文は変換済みのテキスト）"""
+
+    page_id: str
+    version: int
+    title: str
+    text: str
+
+
+@dataclass
+class ConfluenceCacheStats:
+    """キャッシュのメトリクス（ログ出力用）"""
+
+    hits: int = 0
+    misses: int = 0
+    stale: int = 0
+    evicted: int = 0
+    errors: int = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "evicted": self.evicted,
+            "errors": self.errors,
+        }
+
+
+class ConfluencePageCache:
+    """ページID + バージョン番号で検証するディスクキャッシュ"""
+
+    def __init__(self, cache_dir: str | None, max_bytes: int):
+        """
+        Args:
+            cache_dir: 保存先ディレクトリ（None ならキャッシュしない）
+            max_bytes: キャッシュファイルの合計バイト数の上限
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = bool(cache_dir) and max_bytes > 0
+        self.stats = ConfluenceCacheStats()
+        # ページIDのハッシュ -> ファイルサイズ（先頭が最も長く使われていないページ）
+        self._index: OrderedDict[str, int] = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        if self.enabled:
+            self._load_index()
+
+    @classmethod
+    def from_env(cls) -> "ConfluencePageCache":
+        """
+        環境変数から設定を読み込んでキャッシュを作成する
+
+        環境変数:
+            CONFLUENCE_CACHE_DIR: 保存先ディレクトリ（デフォルト: /tmp/confluence-cache、空文字で無効）
+            CONFLUENCE_CACHE_MAX_BYTES: 合計バイト数の上限（デフォルト: 64MB）
+        """
+        cache_dir = os.environ.get("CONFLUENCE_CACHE_DIR", "/tmp/confluence-cache")
+        return cls(
+            cache_dir=cache_dir or None,
+            max_bytes=env_int("CONFLUENCE_CACHE_MAX_BYTES", 64 * 1024 * 1024),
+        )
+
+    # ---------------------------------
+    # 公開 API
+    # ---------------------------------
+
+    def get(self, page_id: str) -> CachedPage | None:
+        """
+        キャッシュ済みのページを返す（バージョンが最新かどうかは呼び出し側で確認する）
+
+        Returns:
+            キャッシュ済みのページ（無ければ None）
+        """
+        if not self.enabled:
+            return None
+        digest = self._digest(page_id)
+        with self._lock:
+            if digest not in self._index:
+                self.stats.misses += 1
+                record_cache_lookup("confluence", False)
+                return None
+            self._index.move_to_end(digest)
+        try:
+            with open(self._path(digest), encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[ConfluenceCache] キャッシュの読み込みに失敗しました: {e}")
+            self.stats.errors += 1
+            self.invalidate(page_id)
+            return None
+        # ハッシュ衝突などで別のページだった場合は使わない
+        if data.get("page_id") != page_id:
+            self.stats.misses += 1
+            record_cache_lookup("confluence", False)
+            return None
+        return CachedPage(
+            page_id=page_id,
+            version=data.get("version", 0),
+            title=data.get("title", ""),
+            text=data.get("text", ""),
+        )
+
+    def record_hit(self, fresh: bool) -> None:
+        """バージョンを確認した結果を記録する（fresh=False はキャッシュが古かった場合）"""
+        if fresh:
+            self.stats.hits += 1
+        else:
+            self.stats.stale += 1
+        record_cache_lookup("confluence", fresh)
+
+    def put(self, page: CachedPage) -> None:
+        """ページを保存し、上限を超えた分を古い順に削除する"""
+        if not self.enabled:
+            return
+        digest = self._digest(page.page_id)
+        path = self._path(digest)
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "page_id": page.page_id,
+                        "version": page.version,
+                        "title": page.title,
+                        "text": page.text,
+                        "saved_at": time.time(),
+                    },
+                    f,
+                    ensure_ascii=False,
+                )
+            # 書きかけのファイルを読まないように rename で置き換える
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"[ConfluenceCache] キャッシュの書き込みに失敗しました: {e}")
+            self.stats.errors += 1
+            return
+
+        with self._lock:
+            self._total_bytes += size - self._index.pop(digest, 0)
+            self._index[digest] = size
+            evicted = []
+            while self._total_bytes > self.max_bytes and len(self._index) > 1:
+                old_digest, old_size = self._index.popitem(last=False)
+                self._total_bytes -= old_size
+                evicted.append(old_digest)
+            self.stats.evicted += len(evicted)
+        for old_digest in evicted:
+            self._remove_file(old_digest)
+
+    def invalidate(self, page_id: str) -> None:
+        """ページのキャッシュを削除する"""
+        if not self.enabled:
+            return
+        digest = self._digest(page_id)
+        with self._lock:
+            self._total_bytes -= self._index.pop(digest, 0)
+        self._remove_file(digest)
+
+    def log_stats(self) -> None:
+        """現在の状態とメトリクスをログに出す"""
+        if not self.enabled:
+            return
+        print(
+            f"[ConfluenceCache] pages={len(self._index)} bytes={self._total_bytes} "
+            f"stats={self.stats.as_dict()}"
+        )
+
+    # ---------------------------------
+    # ファイル
+    # ---------------------------------
+
+    @staticmethod
+    def _digest(page_id: str) -> str:
+        # ページIDをそのままファイル名に使わない（パストラバーサル対策）
+        return hashlib.sha256(page_id.encode("utf-8")).hexdigest()
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def _load_index(self) -> None:
+        """
+        前回のプロセスが残したキャッシュファイルを、更新日時の古い順にインデックスへ登録する
+
+        起動を遅くしないよう、ファイルの中身は読まずに stat だけで済ませる
+        """
+        try:
+            names = [n for n in os.listdir(self.cache_dir) if n.endswith(".json")]
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            print(f"[ConfluenceCache] キャッシュディレクトリを読めません: {e}")
+            return
+        entries = []
+        for name in names:
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[: -len(".json")], stat.st_size))
+        for _, digest, size in sorted(entries):
+            self._index[digest] = size
+            self._total_bytes += size
+
+    def _remove_file(self, digest: str) -> None:
+        try:
+            os.remove(self._path(digest))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"[ConfluenceCache] キャッシュファイルの削除に失敗しました: {e}")
+
+
+# プロセス全体で共有するキャッシュ
+confluence_cache = ConfluencePageCache.from_env()
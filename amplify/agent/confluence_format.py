@@ -0,0 +1,326 @@
+# =====================================
+# Confluence のストレージ形式をコンパクトなテキストに変換する
+# =====================================
+#
+# get_confluence_page は body.storage（XHTML + ac:/ri: マクロ）をそのまま返していたため、
+# 実際の Wiki ページでは数万トークンのマークアップがモデルのコンテキストに入っていた。
+# ここではストレージ形式を Markdown 風のテキストに変換し、
+# 見出し単位のセクション選択と、offset / max_chars による分割取得を提供する。
+#
+# 外部ライブラリは使わず、標準ライブラリの HTMLParser で 1 パスで変換する。
+# https://confluence.atlassian.com/doc/confluence-storage-format-790796544.html
+
+import re
+from dataclasses import dataclass
+from html.parser import HTMLParser
+
+_HEADINGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+_BLOCKS = {"p", "div", "blockquote", "section", "ac:layout-cell", "ac:rich-text-body", "ac:task-body"}
+_INLINE_MARKS = {"strong": "**", "b": "**", "em": "_", "i": "_", "s": "~~", "del": "~~", "code": "`"}
+# 中身を出力しない要素（マクロのパラメーターなど）
+_SKIP = {"ac:parameter", "style", "script", "ac:task-id", "ac:placeholder"}
+# 情報パネル系マクロのラベル
+_PANEL_LABELS = {"info": "INFO", "note": "NOTE", "warning": "WARNING", "tip": "TIP", "panel": "PANEL"}
+
+_BLANK_LINES = re.compile(r"\n{3,}")
+_TRAILING_SPACES = re.compile(r"[ \t]+\n")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class _StorageConverter(HTMLParser):
+    """ストレージ形式の XHTML を Markdown 風のテキストに変換するパーサー"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out: list[str] = []
+        self._skip_depth = 0
+        self._lists: list[list] = []  # [種類("ul"/"ol"), 次の番号]
+        self._link_href: str | None = None
+        self._link_start = 0
+        self._table_row: list[str] | None = None
+        self._cell_start = 0
+        self._table_rows = 0
+        self._macros: list[str] = []
+        self._code_language = ""
+        self._param_name: str | None = None
+        self._in_pre = False
+        self._in_image = False
+        self._task_marker = -1
+        # 直前に出力したリスト・パネルの記号の位置（その直後の <p> などで改行しない）
+        self._marker = -1
+
+    # ---- 出力ヘルパー ----
+
+    def _newline(self, count: int = 1) -> None:
+        if self._marker == len(self.out) - 1:
+            return
+        text = "".join(self.out[-3:])
+        missing = count - (len(text) - len(text.rstrip("\n")))
+        if self.out and missing > 0:
+            self.out.append("\n" * missing)
+
+    def _indent(self) -> str:
+        return "  " * max(0, len(self._lists) - 1)
+
+    # ---- HTMLParser のコールバック ----
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "ac:parameter" and self._macros:
+            # コードブロックの言語だけは拾う
+            self._param_name = attrs.get("ac:name")
+        if tag in _SKIP:
+            self._skip_depth += 1
+            return
+        if self._skip_depth:
+            return
+
+        if tag in _HEADINGS:
+            self._newline(2)
+            self.out.append("#" * _HEADINGS[tag] + " ")
+        elif tag in _BLOCKS:
+            self._newline(2 if not self._lists else 1)
+        elif tag == "br":
+            self.out.append("\n" + self._indent())
+        elif tag == "hr":
+            self._newline(2)
+            self.out.append("---")
+            self._newline(2)
+        elif tag in ("ul", "ol", "ac:task-list"):
+            self._newline(1)
+            self._lists.append([tag, 1])
+        elif tag == "li" or tag == "ac:task":
+            self._newline(1)
+            kind = self._lists[-1] if self._lists else ["ul", 1]
+            if kind[0] == "ol":
+                self.out.append(f"{self._indent()}{kind[1]}. ")
+                kind[1] += 1
+            elif kind[0] == "ac:task-list":
+                self._task_marker = len(self.out)
+                self.out.append(f"{self._indent()}- [ ] ")
+            else:
+                self.out.append(f"{self._indent()}- ")
+            self._marker = len(self.out) - 1
+        elif tag == "ac:task-status":
+            self._skip_depth += 1
+            self._macros.append("task-status")
+        elif tag in _INLINE_MARKS and not self._in_pre:
+            self.out.append(_INLINE_MARKS[tag])
+        elif tag == "a":
+            self._link_href = attrs.get("href")
+            self._link_start = len(self.out)
+        elif tag == "pre":
+            self._newline(2)
+            self.out.append("```\n")
+            self._in_pre = True
+        elif tag == "table":
+            self._newline(2)
+            self._table_rows = 0
+        elif tag == "tr":
+            self._table_row = []
+        elif tag in ("td", "th"):
+            self._cell_start = len(self.out)
+        elif tag == "ac:structured-macro":
+            name = attrs.get("ac:name", "")
+            self._macros.append(name)
+            if name in _PANEL_LABELS:
+                self._newline(2)
+                self.out.append(f"**{_PANEL_LABELS[name]}**: ")
+                self._marker = len(self.out) - 1
+            elif name in ("code", "noformat"):
+                self._code_language = ""
+            elif name not in ("expand", "section", "column", "details"):
+                # 中身を持たないマクロ（目次など）は名前だけ残す
+                self.out.append(f"[{name}]")
+        elif tag == "ac:plain-text-body":
+            self._newline(2)
+            self.out.append(f"```{self._code_language}\n")
+            self._in_pre = True
+        elif tag == "ac:image":
+            self._in_image = True
+        elif tag == "ri:attachment":
+            if self._in_image:
+                self.out.append(f"[画像: {attrs.get('ri:filename', '')}]")
+            else:
+                self.out.append(f"[添付: {attrs.get('ri:filename', '')}]")
+        elif tag == "ri:url" and self._in_image:
+            self.out.append(f"[画像: {attrs.get('ri:value', '')}]")
+        elif tag == "ri:page":
+            self.out.append(f"[[{attrs.get('ri:content-title', '')}]]")
+        elif tag == "ri:user":
+            self.out.append(f"@{attrs.get('ri:account-id') or attrs.get('ri:username', '')}")
+        elif tag == "time":
+            self.out.append(attrs.get("datetime", ""))
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP:
+            self._skip_depth = max(0, self._skip_depth - 1)
+            self._param_name = None
+            return
+        if tag == "ac:task-status":
+            self._skip_depth = max(0, self._skip_depth - 1)
+            if self._macros and self._macros[-1] == "task-status":
+                self._macros.pop()
+            return
+        if self._skip_depth:
+            return
+
+        if tag in _HEADINGS or tag in _BLOCKS:
+            self._newline(2 if not self._lists else 1)
+        elif tag in ("ul", "ol", "ac:task-list"):
+            if self._lists:
+                self._lists.pop()
+            self._newline(1 if self._lists else 2)
+        elif tag in _INLINE_MARKS and not self._in_pre:
+            self.out.append(_INLINE_MARKS[tag])
+        elif tag == "a":
+            text = "".join(self.out[self._link_start:]).strip()
+            href = self._link_href
+            if href and text and href != text:
+                del self.out[self._link_start:]
+                self.out.append(f"[{text}]({href})")
+            elif href and not text:
+                self.out.append(href)
+            self._link_href = None
+        elif tag == "pre":
+            self._newline(1)
+            self.out.append("```")
+            self._newline(2)
+            self._in_pre = False
+        elif tag in ("td", "th"):
+            cell = "".join(self.out[self._cell_start:])
+            del self.out[self._cell_start:]
+            if self._table_row is not None:
+                self._table_row.append(" ".join(cell.split()).replace("|", "\\|"))
+        elif tag == "tr":
+            if self._table_row is not None:
+                self.out.append("| " + " | ".join(self._table_row) + " |\n")
+                if self._table_rows == 0:
+                    self.out.append("|" + " --- |" * len(self._table_row) + "\n")
+                self._table_rows += 1
+            self._table_row = None
+        elif tag == "table":
+            self._newline(2)
+        elif tag == "ac:plain-text-body":
+            self._newline(1)
+            self.out.append("```")
+            self._newline(2)
+            self._in_pre = False
+        elif tag == "ac:structured-macro":
+            if self._macros:
+                name = self._macros.pop()
+                if name in _PANEL_LABELS:
+                    self._newline(2)
+        elif tag == "ac:image":
+            self._in_image = False
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            if self._param_name == "language":
+                self._code_language = data.strip()
+            elif self._macros and self._macros[-1] == "task-status" and data.strip() == "complete":
+                if 0 <= self._task_marker < len(self.out):
+                    self.out[self._task_marker] = self.out[self._task_marker].replace("[ ]", "[x]", 1)
+            return
+        if self._in_pre:
+            self.out.append(data)
+            return
+        # HTML と同様に空白を 1 つにまとめる
+        text = _WHITESPACE.sub(" ", data)
+        if not text.strip() and (not self.out or self.out[-1].endswith(("\n", " "))):
+            return
+        if self.out and self.out[-1].endswith("\n"):
+            text = text.lstrip()
+        self.out.append(text)
+
+    def unknown_decl(self, data):
+        # <![CDATA[...]]>（コードマクロの本文など）
+        if data.startswith("CDATA["):
+            self.handle_data(data[len("CDATA["):])
+
+
+def storage_to_markdown(storage: str) -> str:
+    """
+    Confluence のストレージ形式（XHTML）を Markdown 風のテキストに変換する
+
+    見出し・リスト・表・リンク・コードブロック・情報パネル・タスクリストを残し、
+    それ以外のマークアップとマクロのパラメーターは捨てる
+    """
+    converter = _StorageConverter()
+    converter.feed(storage)
+    converter.close()
+    text = "".join(converter.out)
+    text = _TRAILING_SPACES.sub("\n", text)
+    return _BLANK_LINES.sub("\n\n", text).strip()
+
+
+# ---------------------------------
+# セクション選択と分割取得
+# ---------------------------------
+
+@dataclass
+class Section:
+    """変換後のテキストの見出し 1 つ分"""
+
+    level: int
+    title: str
+    start: int
+
+
+_HEADING_LINE = re.compile(r"^(#{1,6}) (.+)$", re.MULTILINE)
+
+
+def list_sections(markdown: str) -> list[Section]:
+    """変換後のテキストから見出しの一覧を取り出す（コードブロック内の # は見出しとみなさない）"""
+    sections = []
+    fences = [m.start() for m in re.finditer(r"^```", markdown, re.MULTILINE)]
+    for match in _HEADING_LINE.finditer(markdown):
+        if sum(1 for f in fences if f < match.start()) % 2:
+            continue
+        sections.append(Section(level=len(match.group(1)), title=match.group(2).strip(), start=match.start()))
+    return sections
+
+
+def select_section(markdown: str, heading: str) -> str | None:
+    """
+    見出しに heading を含むセクション（配下の小見出しを含む）を返す
+
+    Returns:
+        セクションのテキスト（見つからなければ None）
+    """
+    sections = list_sections(markdown)
+    needle = heading.strip().lower()
+    for i, section in enumerate(sections):
+        if needle not in section.title.lower():
+            continue
+        end = len(markdown)
+        for following in sections[i + 1:]:
+            if following.level <= section.level:
+                end = following.start
+                break
+        return markdown[section.start:end].strip()
+    return None
+
+
+def outline(markdown: str) -> str:
+    """見出しの一覧をインデント付きで返す（セクション指定のヒント用）"""
+    return "\n".join(f"{'  ' * (s.level - 1)}- {s.title}" for s in list_sections(markdown))
+
+
+def slice_text(text: str, offset: int, max_chars: int) -> tuple[str, int | None]:
+    """
+    text の offset 文字目から最大 max_chars 文字を切り出す
+
+    途中で切れる場合は、なるべく改行の位置で切る
+
+    Returns:
+        (切り出したテキスト, 続きの offset。最後まで読んだら None)
+    """
+    offset = max(0, offset)
+    if max_chars <= 0 or offset + max_chars >= len(text):
+        return text[offset:], None
+    end = offset + max_chars
+    newline = text.rfind("\n", offset + max_chars // 2, end)
+    if newline != -1:
+        end = newline + 1
+    return text[offset:end], end
@@ -0,0 +1,252 @@
+# =====================================
+# Confluence 検索（ローカル全文索引 + CQL）
+# =====================================
+#
+# search_confluence は毎回リモートの CQL（text ~ "..."）を発行しており、遅いうえに
+# query を文字列埋め込みで CQL に入れていた（" を含むと構文エラーや条件の注入になる）。
+#
+# - ローカル索引: SQLite FTS5 に、エージェントが取得したページ（とスペースのクロール結果）を登録し、
+#   BM25 で順位付けしてスニペット付きで返す。日本語は単語区切りが無いので trigram トークナイザーを使う
+# - CQL: 値を正しくエスケープして組み立てる（ローカルで見つからないときのフォールバック）
+#
+# https://www.sqlite.org/fts5.html
+# https://developer.atlassian.com/cloud/confluence/advanced-searching-using-cql/
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+from config import env_bool, env_int
+
+CONFLUENCE_INDEX_ENABLED = env_bool("CONFLUENCE_INDEX_ENABLED", False)
+CONFLUENCE_INDEX_PATH = os.environ.get("CONFLUENCE_INDEX_PATH", "/tmp/confluence-index.sqlite3")
+# 起動時にクロールして索引に登録するスペース（カンマ区切り。空ならクロールしない）
+CONFLUENCE_INDEX_CRAWL_SPACES = [
+    s.strip() for s in os.environ.get("CONFLUENCE_INDEX_CRAWL_SPACES", "").split(",") if s.strip()
+]
+# 1 スペースあたりのクロール上限ページ数
+CONFLUENCE_INDEX_CRAWL_MAX_PAGES = env_int("CONFLUENCE_INDEX_CRAWL_MAX_PAGES", 500)
+
+# trigram トークナイザーは 3 文字未満の語を MATCH で検索できない
+_TRIGRAM_MIN_CHARS = 3
+# Lucene（CQL の text ~ の中身）で特別な意味を持つ文字
+_LUCENE_SPECIAL = re.compile(r'([+\-&|!(){}\[\]^~*?:\\/"])')
+
+
+# ---------------------------------
+# CQL のエスケープ
+# ---------------------------------
+
+def cql_quote(value: str) -> str:
+    """CQL の文字列リテラルとしてダブルクォートで囲む（\\ と " をエスケープ）"""
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def cql_text(query: str) -> str:
+    """
+    text ~ に渡す検索語を組み立てる
+
+    Lucene の特殊文字を \\ でエスケープしてから CQL の文字列リテラルにする
+    （CQL 上は \\\\ となり、Lucene には \\ として渡る）
+    """
+    return cql_quote(_LUCENE_SPECIAL.sub(r"\\\1", query))
+
+
+def build_search_cql(query: str, space_key: str | None = None) -> str:
+    """search_confluence 用の CQL を組み立てる"""
+    cql = f"text ~ {cql_text(query)}"
+    if space_key:
+        cql += f" AND space = {cql_quote(space_key)}"
+    return cql
+
+
+# ---------------------------------
+# ローカル全文索引
+# ---------------------------------
+
+@dataclass
+class SearchHit:
+    """ローカル索引の検索結果 1 件"""
+
+    page_id: str
+    title: str
+    space: str
+    snippet: str
+
+
+class ConfluenceIndex:
+    """SQLite FTS5（trigram）によるページの全文索引"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.local_hits = 0
+        self.local_misses = 0
+        self._lock = threading.Lock()
+        # ツールはイベントループ、クロールはスレッドプールから呼ぶので、ロックで直列化して共有する
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "page_id TEXT PRIMARY KEY, version INTEGER, space TEXT, indexed_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5("
+            "page_id UNINDEXED, space UNINDEXED, title, body, tokenize='trigram')"
+        )
+        self._conn.commit()
+
+    def upsert(self, page_id: str, version: int, title: str, text: str, space: str | None = None) -> None:
+        """
+        ページを索引に登録する（同じバージョンが登録済みなら何もしない）
+
+        space が None の場合（更新後など、スペースが分からないとき）は登録済みの値を引き継ぐ
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT version, space FROM pages WHERE page_id = ?", (page_id,)).fetchone()
+            if row is not None and row[0] == version:
+                return
+            if space is None:
+                space = row[1] if row else ""
+            with self._conn:
+                self._conn.execute("DELETE FROM pages_fts WHERE page_id = ?", (page_id,))
+                self._conn.execute(
+                    "INSERT INTO pages_fts (page_id, space, title, body) VALUES (?, ?, ?, ?)",
+                    (page_id, space, title, text),
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO pages (page_id, version, space, indexed_at) VALUES (?, ?, ?, ?)",
+                    (page_id, version, space, time.time()),
+                )
+
+    def indexed_version(self, page_id: str) -> int | None:
+        """登録済みのバージョン（未登録なら None）"""
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM pages WHERE page_id = ?", (page_id,)).fetchone()
+        return row[0] if row else None
+
+    def remove(self, page_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM pages_fts WHERE page_id = ?", (page_id,))
+            self._conn.execute("DELETE FROM pages WHERE page_id = ?", (page_id,))
+
+    def search(self, query: str, space_key: str | None = None, limit: int = 10) -> list[SearchHit]:
+        """
+        BM25 の順で検索する（空白区切りの語を全て含むページ）
+
+        3 文字以上の語は FTS5 の MATCH、3 文字未満の語（「会議」など）は LIKE で絞り込む
+        """
+        terms = query.split()
+        if not terms:
+            return []
+        long_terms = [t for t in terms if len(t) >= _TRIGRAM_MIN_CHARS]
+        short_terms = [t for t in terms if len(t) < _TRIGRAM_MIN_CHARS]
+
+        conditions, args = [], []
+        if long_terms:
+            conditions.append("pages_fts MATCH ?")
+            # 各語をフレーズとしてクォートし、FTS5 の構文（AND / OR / * など）として解釈させない
+            args.append(" ".join('"' + t.replace('"', '""') + '"' for t in long_terms))
+        for term in short_terms:
+            conditions.append("(title LIKE ? ESCAPE '\\' OR body LIKE ? ESCAPE '\\')")
+            pattern = "%" + re.sub(r"([%_\\])", r"\\\1", term) + "%"
+            args += [pattern, pattern]
+        if space_key:
+            conditions.append("space = ?")
+            args.append(space_key)
+
+        if long_terms:
+            columns = "page_id, title, space, snippet(pages_fts, 3, '**', '**', '…', 16)"
+            order = "ORDER BY bm25(pages_fts, 0, 0, 5.0, 1.0)"
+        else:
+            # MATCH が無いと BM25 もスニペットも使えないので、本文を返して Python 側で切り出す
+            columns = "page_id, title, space, body"
+            order = ""
+        sql = f"SELECT {columns} FROM pages_fts WHERE {' AND '.join(conditions)} {order} LIMIT ?"
+        args.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        hits = []
+        for page_id, title, space, snippet in rows:
+            if not long_terms:
+                snippet = _like_snippet(snippet, short_terms[0])
+            hits.append(SearchHit(page_id=page_id, title=title, space=space, snippet=" ".join(snippet.split())))
+        if hits:
+            self.local_hits += 1
+        else:
+            self.local_misses += 1
+        return hits
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def log_stats(self) -> None:
+        print(f"[ConfluenceIndex] pages={self.count()} local_hits={self.local_hits} local_misses={self.local_misses}")
+
+
+def open_confluence_index() -> ConfluenceIndex | None:
+    """
+    ローカル索引を開く（CONFLUENCE_INDEX_ENABLED が無効、または開けなければ None）
+
+    SQLite が FTS5 / trigram に対応していない場合もリモート検索だけで動くようにする
+    """
+    if not CONFLUENCE_INDEX_ENABLED:
+        return None
+    try:
+        index = ConfluenceIndex(CONFLUENCE_INDEX_PATH)
+    except sqlite3.Error as e:
+        print(f"[ConfluenceIndex] ローカル索引を開けないため、リモート検索のみを使用します: {e}")
+        return None
+    print(f"[ConfluenceIndex] ローカル索引: {CONFLUENCE_INDEX_PATH} ({index.count()} ページ)")
+    return index
+
+
+def _like_snippet(body: str, term: str, width: int = 40) -> str:
+    """LIKE で見つけたページの本文から、語の前後を切り出す"""
+    pos = body.find(term)
+    if pos < 0:
+        return body[: width * 2]
+    start = max(0, pos - width)
+    end = pos + len(term) + width
+    return ("…" if start else "") + body[start:pos] + f"**{term}**" + body[pos + len(term):end] + "…"
+
+
+def crawl_space(confluence, index: ConfluenceIndex, space_key: str, to_text, max_pages: int) -> int:
+    """
+    スペースのページを取得して索引に登録する（同期関数。スレッドプールで実行する）
+
+    Args:
+        confluence: atlassian.Confluence クライアント
+        index: 登録先の索引
+        space_key: クロールするスペース
+        to_text: ストレージ形式をテキストに変換する関数
+        max_pages: 取得するページ数の上限
+
+    Returns:
+        登録（または更新）したページ数
+    """
+    indexed = 0
+    start = 0
+    batch = 50
+    while start < max_pages:
+        pages = confluence.get_all_pages_from_space(
+            space_key, start=start, limit=min(batch, max_pages - start), expand="body.storage,version"
+        )
+        if not pages:
+            break
+        for page in pages:
+            version = page.get("version", {}).get("number", 0)
+            if index.indexed_version(page["id"]) == version:
+                continue
+            body = page.get("body", {}).get("storage", {}).get("value", "")
+            index.upsert(page["id"], version, page.get("title", ""), to_text(body), space_key)
+            indexed += 1
+        if len(pages) < batch:
+            break
+        start += len(pages)
+    return indexed
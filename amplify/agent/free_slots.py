@@ -0,0 +1,353 @@
+# =====================================
+# 会議の空き枠の計算
+# =====================================
+#
+# 以前は日程調整のたびに get_schedule で期間中の予定をすべてモデルに渡し、
+# 空き時間の計算をモデルに任せていた。予定が多いとトークンが増えて遅くなり、
+# 重なりの見落としや勤務時間外の提案などの誤りも起きやすい。
+#
+# find_free_slots ツールは、自分の予定（calendarView）と参加者の予定（getSchedule）の
+# 開始・終了・状態だけを取得し、このモジュールで空き枠を計算して、候補の枠だけをモデルに返す。
+# - 予定の区間をソートしてまとめ（前後の余裕 buffer だけ広げてから）、勤務時間の枠から差し引く
+# - まとめた区間と枠はどちらも時刻順なので、差し引きは 1 回の走査で済む（O(n log n) はソートだけ）
+# - 「仮の予定」（tentative）は確定の予定とは分けて、重なる時間が短い候補を優先する
+#
+# Graph の状態（showAs / scheduleItems の status）の扱い:
+#   busy / oof / unknown → 埋まっている、tentative → 仮、free / workingElsewhere → 空き
+
+import bisect
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from config import env_int
+
+# 候補の開始時刻の刻み（分）。空きの途中から始まる候補は、この刻みに切り上げる
+FREE_SLOTS_STEP_MINUTES = env_int("FREE_SLOTS_STEP_MINUTES", 15)
+# 自分の予定として読み込む最大件数（超えた分は空き枠の計算に含めず、その旨を返す）
+FREE_SLOTS_MAX_EVENTS = env_int("FREE_SLOTS_MAX_EVENTS", 1000)
+# findMeetingTimes（getSchedule が使えない場合）に要求する候補の最大数
+FREE_SLOTS_MAX_SUGGESTIONS = env_int("FREE_SLOTS_MAX_SUGGESTIONS", 50)
+# getSchedule 1 回で問い合わせる参加者の数
+GRAPH_SCHEDULE_BATCH = 20
+# getSchedule / findMeetingTimes で指定できる期間の上限（Graph の仕様）
+MAX_RANGE = timedelta(days=62)
+
+BUSY_STATUSES = frozenset({"busy", "oof", "unknown"})
+TENTATIVE_STATUSES = frozenset({"tentative"})
+
+Interval = tuple[datetime, datetime]
+
+
+# ---------------------------------
+# 日時の解釈
+# ---------------------------------
+
+def parse_local_datetime(value: str, tz: ZoneInfo) -> datetime:
+    """
+    ツールの引数の日時（ISO8601）を tz の日時にする（オフセットがなければ tz の時刻とみなす）
+
+    Raises:
+        ValueError: ISO8601 として解釈できない場合
+    """
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"日時は ISO8601 形式で指定してください: {value}") from None
+    return parsed.replace(tzinfo=tz) if parsed.tzinfo is None else parsed.astimezone(tz)
+
+
+def parse_clock(value: str) -> time:
+    """
+    勤務時間の時刻（HH:MM）を解釈する
+
+    Raises:
+        ValueError: HH:MM として解釈できない場合
+    """
+    try:
+        return datetime.strptime(value.strip(), "%H:%M").time()
+    except ValueError:
+        raise ValueError(f"時刻は HH:MM 形式で指定してください: {value}") from None
+
+
+def parse_graph_datetime(value: dict | None, tz: ZoneInfo) -> datetime | None:
+    """
+    Graph の dateTimeTimeZone（{"dateTime": "2026-01-15T09:00:00.0000000", "timeZone": "Asia/Tokyo"}）を
+    tz の日時にする（解釈できなければ None）
+
+    timeZone が Windows のタイムゾーン名（"Tokyo Standard Time" など）の場合は、
+    Prefer: outlook.timezone や startTime.timeZone で要求した tz の時刻とみなす
+    """
+    if not value or not value.get("dateTime"):
+        return None
+    try:
+        naive = datetime.fromisoformat(value["dateTime"][:19])
+    except ValueError:
+        return None
+    source = tz
+    if value.get("timeZone"):
+        try:
+            source = ZoneInfo(value["timeZone"])
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+    return naive.replace(tzinfo=source).astimezone(tz)
+
+
+def graph_datetime(value: datetime, tz_name: str) -> dict:
+    """Graph のリクエストに渡す dateTimeTimeZone"""
+    return {"dateTime": value.strftime("%Y-%m-%dT%H:%M:%S"), "timeZone": tz_name}
+
+
+# ---------------------------------
+# 予定の集約
+# ---------------------------------
+
+@dataclass
+class Availability:
+    """空き枠の計算に使う予定の区間（busy: 確定、tentative: 仮）"""
+
+    busy: list[Interval] = field(default_factory=list)
+    tentative: list[Interval] = field(default_factory=list)
+
+    def add(self, status: str | None, start: datetime | None, end: datetime | None) -> None:
+        if start is None or end is None or end <= start:
+            return
+        status = (status or "busy").lower()
+        if status in TENTATIVE_STATUSES:
+            self.tentative.append((start, end))
+        elif status in BUSY_STATUSES:
+            self.busy.append((start, end))
+
+    def add_events(self, events: list[dict], tz: ZoneInfo) -> None:
+        """calendarView の予定（start / end / showAs / isCancelled）を追加する"""
+        for ev in events:
+            if ev.get("isCancelled") or ev.get("@removed"):
+                continue
+            self.add(ev.get("showAs"), parse_graph_datetime(ev.get("start"), tz), parse_graph_datetime(ev.get("end"), tz))
+
+    def add_schedule_items(self, items: list[dict], tz: ZoneInfo) -> None:
+        """getSchedule の scheduleItems（start / end / status）を追加する"""
+        for item in items:
+            self.add(item.get("status"), parse_graph_datetime(item.get("start"), tz), parse_graph_datetime(item.get("end"), tz))
+
+
+# ---------------------------------
+# 区間の演算（入力と出力はどれも時刻順）
+# ---------------------------------
+
+def merge_intervals(intervals: list[Interval], buffer: timedelta = timedelta(0)) -> list[Interval]:
+    """
+    重なる・接する区間を 1 つにまとめる
+
+    Args:
+        intervals: 区間のリスト（順不同）
+        buffer: まとめる前に各区間を前後に広げる時間（予定の前後に空ける余裕）
+
+    Returns:
+        時刻順で互いに重ならない区間のリスト
+    """
+    if not intervals:
+        return []
+    ordered = sorted(intervals)
+    merged: list[Interval] = []
+    current_start, current_end = ordered[0][0] - buffer, ordered[0][1] + buffer
+    for start, end in ordered[1:]:
+        start, end = start - buffer, end + buffer
+        if start <= current_end:
+            if end > current_end:
+                current_end = end
+        else:
+            merged.append((current_start, current_end))
+            current_start, current_end = start, end
+    merged.append((current_start, current_end))
+    return merged
+
+
+def subtract_intervals(windows: list[Interval], busy: list[Interval]) -> list[Interval]:
+    """
+    windows から busy を除いた区間を返す（どちらも merge_intervals 済み、両方を 1 回だけ走査する）
+    """
+    free: list[Interval] = []
+    i = 0
+    for window_start, window_end in windows:
+        # この枠より前に終わる予定は、以降の枠にも関係しない
+        while i < len(busy) and busy[i][1] <= window_start:
+            i += 1
+        cursor = window_start
+        j = i
+        while j < len(busy) and busy[j][0] < window_end:
+            if busy[j][0] > cursor:
+                free.append((cursor, busy[j][0]))
+            cursor = max(cursor, busy[j][1])
+            j += 1
+        if cursor < window_end:
+            free.append((cursor, window_end))
+    return free
+
+
+def intersect_intervals(a: list[Interval], b: list[Interval]) -> list[Interval]:
+    """a と b の両方に含まれる区間を返す（どちらも merge_intervals 済み）"""
+    result: list[Interval] = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end = min(a[i][1], b[j][1])
+        if start < end:
+            result.append((start, end))
+        if a[i][1] <= b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def working_windows(
+    start: datetime,
+    end: datetime,
+    work_start: time,
+    work_end: time,
+    include_weekends: bool = False,
+) -> list[Interval]:
+    """
+    期間内の各日の勤務時間の枠（start 〜 end の範囲に切り詰める）
+
+    Args:
+        start / end: 期間（start のタイムゾーンの日付で区切る）
+        work_start / work_end: 1 日の中で候補にする時間帯
+        include_weekends: 土日も含めるか
+    """
+    tz = start.tzinfo
+    windows: list[Interval] = []
+    day: date = start.date()
+    while day <= end.date():
+        if include_weekends or day.weekday() < 5:
+            window_start = max(datetime.combine(day, work_start, tzinfo=tz), start)
+            window_end = min(datetime.combine(day, work_end, tzinfo=tz), end)
+            if window_start < window_end:
+                windows.append((window_start, window_end))
+        day += timedelta(days=1)
+    return windows
+
+
+# ---------------------------------
+# 候補の選定
+# ---------------------------------
+
+@dataclass(frozen=True)
+class Slot:
+    """
+    会議の候補
+
+    Attributes:
+        start / end: 候補の枠（会議の長さ）
+        free_start / free_end: 候補を含む、連続した空き時間
+        tentative_minutes: 仮の予定（前後の余裕を含む）と重なる時間（分）。0 の候補を優先する
+    """
+
+    start: datetime
+    end: datetime
+    free_start: datetime
+    free_end: datetime
+    tentative_minutes: int = 0
+
+
+def _align(value: datetime, step: timedelta) -> datetime:
+    """その日の 0 時を起点に、step の刻みに切り上げる"""
+    midnight = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight + step * -(-(value - midnight) // step)
+
+
+def _overlap_minutes(start: datetime, end: datetime, intervals: list[Interval], ends: list[datetime]) -> int:
+    """start 〜 end と intervals（merge 済み、ends はその終了時刻のリスト）が重なる時間（分）"""
+    total = timedelta(0)
+    for k in range(bisect.bisect_right(ends, start), len(intervals)):
+        other_start, other_end = intervals[k]
+        if other_start >= end:
+            break
+        total += min(end, other_end) - max(start, other_start)
+    return int(total.total_seconds() // 60)
+
+
+def find_slots(
+    availability: Availability,
+    start: datetime,
+    end: datetime,
+    duration: timedelta,
+    *,
+    work_start: time,
+    work_end: time,
+    buffer: timedelta = timedelta(0),
+    include_weekends: bool = False,
+    within: list[Interval] | None = None,
+    step: timedelta | None = None,
+    max_results: int = 5,
+) -> list[Slot]:
+    """
+    全員が空いている会議の候補を、よい順に返す
+
+    連続した空き時間ごとに候補を 1 つ選ぶ（同じ空き時間から刻みをずらした候補は出さない）。
+    候補は仮の予定と重ならない最も早い枠、なければ仮の予定と重なる時間が最も短い枠にする。
+    仮の予定と重ならない候補を優先し、その中では同じ日に偏らないよう各日の最初の候補を先に並べ、
+    残りを時刻順に続ける。
+
+    Args:
+        availability: 自分と参加者の予定
+        start / end: 探す期間
+        duration: 会議の長さ
+        work_start / work_end: 1 日の中で候補にする時間帯
+        buffer: 前後の予定との間に空ける時間
+        include_weekends: 土日も候補にするか
+        within: 指定した場合は、この区間の中だけで探す（findMeetingTimes の提案など）
+        step: 候補の開始時刻の刻み（省略時は FREE_SLOTS_STEP_MINUTES）
+        max_results: 返す候補の最大数
+
+    Returns:
+        Slot のリスト（先頭ほどよい候補）
+    """
+    step = step or timedelta(minutes=FREE_SLOTS_STEP_MINUTES)
+    windows = working_windows(start, end, work_start, work_end, include_weekends)
+    if within is not None:
+        windows = intersect_intervals(windows, merge_intervals(within))
+    free = [
+        (free_start, free_end)
+        for free_start, free_end in subtract_intervals(windows, merge_intervals(availability.busy, buffer))
+        if free_end - free_start >= duration
+    ]
+    tentative = merge_intervals(availability.tentative, buffer)
+    tentative_ends = [t_end for _, t_end in tentative]
+    # 仮の予定（前後の余裕を含む）とも重ならない部分（free と同じ順に並ぶ）
+    firm = subtract_intervals(free, tentative)
+
+    candidates: list[Slot] = []
+    k = 0
+    for free_start, free_end in free:
+        slot = None
+        while k < len(firm) and firm[k][0] < free_end:
+            part_start, part_end = firm[k]
+            k += 1
+            slot_start = _align(part_start, step)
+            if slot is None and slot_start + duration <= part_end:
+                slot = Slot(slot_start, slot_start + duration, free_start, free_end)
+        if slot is None:
+            # 仮の予定と重ならずには入らない場合は、重なる時間が最も短い開始時刻を選ぶ
+            slot_start = _align(free_start, step)
+            while slot_start + duration <= free_end:
+                overlap = _overlap_minutes(slot_start, slot_start + duration, tentative, tentative_ends)
+                if slot is None or overlap < slot.tentative_minutes:
+                    slot = Slot(slot_start, slot_start + duration, free_start, free_end, overlap)
+                slot_start += step
+            if slot is None:
+                continue
+        candidates.append(slot)
+
+    candidates.sort(key=lambda s: (s.tentative_minutes, s.start))
+    seen_days: set[date] = set()
+    first_of_day: list[Slot] = []
+    rest: list[Slot] = []
+    for slot in candidates:
+        if slot.tentative_minutes == 0 and slot.start.date() not in seen_days:
+            seen_days.add(slot.start.date())
+            first_of_day.append(slot)
+        else:
+            rest.append(slot)
+    return (first_of_day + rest)[:max_results]
@@ -0,0 +1,214 @@
+# =====================================
+# Graph 読み取りツールのキャッシュ
+# =====================================
+#
+# 1 つの会話の中で、モデルは get_task_lists や get_schedule を同じ引数で何度も呼ぶ。
+# 読み取り結果をユーザーごとに短い TTL でキャッシュし、Graph へのリクエストを減らす。
+#
+# - キーはエンドポイントのパスと正規化したクエリパラメータ
+# - 書き込み系ツール（create_meeting / create_task など）が同じリソースを変更したら無効化する
+# - 件数の上限を超えたら LRU で捨てる
+# - 同じキーの読み込みが実行中なら、それの完了を待って結果を共有する（single-flight）
+#
+# セキュリティ上の注意:
+# アクセストークンの中身（subject）は署名を検証していないので、それだけをキーにすると
+# 偽造したトークンで他人のキャッシュを読めてしまう。そのため、参照はトークン自体のハッシュで行い、
+# subject は「同じユーザーの別トークンで作られたキャッシュもまとめて無効化する」ためだけに使う。
+
+import asyncio
+import base64
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from config import env_bool, env_float, env_int
+from telemetry import record_cache_lookup
+
+GRAPH_CACHE_ENABLED = env_bool("GRAPH_CACHE_ENABLED", True)
+GRAPH_CACHE_TTL_SEC = env_float("GRAPH_CACHE_TTL_SEC", 30.0)
+GRAPH_CACHE_MAX_ENTRIES = env_int("GRAPH_CACHE_MAX_ENTRIES", 512)
+
+
+@dataclass
+class _CacheEntry:
+    subject: str
+    path: str
+    value: str
+    expires_at: float
+
+
+def token_hash(access_token: str) -> str:
+    """アクセストークンのハッシュ（トークンそのものはメモリ上のキーにも残さない）"""
+    return hashlib.sha256(access_token.encode("utf-8")).hexdigest()
+
+
+def token_subject(access_token: str) -> str:
+    """
+    アクセストークン（JWT）からユーザーを表す subject を取り出す
+
+    Graph のトークンは JWT でない場合もある（個人アカウントなど）ので、
+    取り出せなければトークンのハッシュをそのまま subject とみなす
+    """
+    try:
+        payload = access_token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        subject = claims.get("oid") or claims.get("sub")
+        if subject:
+            return f"{claims.get('tid', '')}:{subject}"
+    except (IndexError, ValueError, AttributeError):
+        pass
+    return token_hash(access_token)
+
+
+def _consume_exception(task: asyncio.Future) -> None:
+    """待っている呼び出しが無くても「例外が取り出されなかった」警告を出さない"""
+    if not task.cancelled():
+        task.exception()
+
+
+class GraphReadCache:
+    """ユーザーごとの Graph 読み取り結果キャッシュ（read-through + 書き込み時の無効化）"""
+
+    def __init__(self, ttl_sec: float, max_entries: int, enabled: bool = True):
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self.enabled = enabled and ttl_sec > 0 and max_entries > 0
+        self.hits = 0
+        self.misses = 0
+        self.joined = 0
+        self.invalidations = 0
+        self._entries: OrderedDict[tuple, _CacheEntry] = OrderedDict()
+        # 実行中の読み込み（キー -> 読み込みのタスク）
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(access_token: str, path: str, params: dict | None, headers: dict | None) -> tuple:
+        normalized_params = tuple(sorted((k, str(v)) for k, v in (params or {}).items()))
+        normalized_headers = tuple(sorted((headers or {}).items()))
+        return token_hash(access_token), path, normalized_params, normalized_headers
+
+    async def get_or_load(
+        self,
+        access_token: str,
+        path: str,
+        params: dict | None,
+        loader: Callable[[], Awaitable[str]],
+        headers: dict | None = None,
+    ) -> str:
+        """
+        キャッシュにあればそれを返し、なければ loader を呼んで結果を保存する
+
+        Args:
+            access_token: Microsoft Graph API のアクセストークン
+            path: エンドポイントのパス（無効化の単位。例: /me/todo/lists/{id}/tasks）
+            params: クエリパラメータ（キーの一部）
+            loader: Graph を呼んで整形済みの文字列を返す関数（失敗時は例外を投げること）
+            headers: 結果に影響するリクエストヘッダー（Prefer のタイムゾーンなど。キーの一部）
+
+        Returns:
+            整形済みのツール出力
+        """
+        if not self.enabled:
+            return await loader()
+
+        key = self._key(access_token, path, params, headers)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                record_cache_lookup("graph", True)
+                print(f"[GraphCache] hit: {path} (hits={self.hits}, misses={self.misses})")
+                return entry.value
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                self.misses += 1
+                # 読み込みは呼び出し元とは別のタスクで実行する
+                # （最初の呼び出しがキャンセルされても、合流した呼び出しには結果を渡せるようにする）
+                inflight = asyncio.ensure_future(self._load(key, access_token, path, loader))
+                inflight.add_done_callback(_consume_exception)
+                self._inflight[key] = inflight
+                owner = True
+            else:
+                self.joined += 1
+                owner = False
+        record_cache_lookup("graph", not owner)
+        if owner:
+            print(f"[GraphCache] miss: {path} (hits={self.hits}, misses={self.misses})")
+        else:
+            # 先読みなどで同じ読み込みが実行中なので、Graph に重ねて問い合わせずに結果を待つ
+            print(f"[GraphCache] join in-flight: {path}")
+        # キャンセルされるのは待っている呼び出しだけで、共有の読み込みは止めない
+        return await asyncio.shield(inflight)
+
+    async def _load(
+        self, key: tuple, access_token: str, path: str, loader: Callable[[], Awaitable[str]]
+    ) -> str:
+        """loader を呼んで結果を保存する（例外はキャッシュせず、待っている呼び出しにそのまま渡す）"""
+        try:
+            value = await loader()
+        except BaseException:
+            with self._lock:
+                self._inflight.pop(key, None)
+            raise
+
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._entries[key] = _CacheEntry(
+                subject=token_subject(access_token),
+                path=path,
+                value=value,
+                expires_at=time.monotonic() + self.ttl_sec,
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, access_token: str, path_prefix: str) -> None:
+        """
+        書き込み系ツールの実行後に呼び、同じユーザーの該当リソースのキャッシュを捨てる
+
+        Args:
+            access_token: 書き込みに使ったアクセストークン
+            path_prefix: 変更したリソースのパス（このパスで始まるエントリを全て捨てる）
+        """
+        if not self.enabled:
+            return
+        subject = token_subject(access_token)
+        with self._lock:
+            stale = [
+                key for key, entry in self._entries.items()
+                if entry.subject == subject and entry.path.startswith(path_prefix)
+            ]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+        if stale:
+            print(f"[GraphCache] invalidated {len(stale)} entries: {path_prefix}")
+
+    def log_stats(self) -> None:
+        """ヒット率などのメトリクスをログに出す"""
+        if not self.enabled:
+            return
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        print(
+            f"[GraphCache] entries={len(self._entries)} hits={self.hits} misses={self.misses} "
+            f"hit_rate={hit_rate:.2f} joined={self.joined} invalidations={self.invalidations}"
+        )
+
+
+# プロセス全体で共有するキャッシュ
+graph_cache = GraphReadCache(
+    ttl_sec=GRAPH_CACHE_TTL_SEC,
+    max_entries=GRAPH_CACHE_MAX_ENTRIES,
+    enabled=GRAPH_CACHE_ENABLED,
+)
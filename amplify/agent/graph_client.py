@@ -0,0 +1,507 @@
+# =====================================
+# Microsoft Graph HTTP クライアント
+# =====================================
+#
+# 全ての Graph ツールで共有する、コネクションプール付きの httpx.AsyncClient。
+# 以前はツール呼び出しごとに httpx.Client() を作っていたため、
+# 毎回 graph.microsoft.com への TCP + TLS ハンドシェイクが発生していた。
+#
+# - クライアントはプロセス全体で 1 つ（イベントループごと）を使い回す
+# - keep-alive と HTTP/2（h2 がインストールされていれば）で接続を再利用する
+# - ユーザーごとに異なるアクセストークンはクライアントに持たせず、リクエストごとに付与する
+
+import asyncio
+import weakref
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable
+from urllib.parse import quote, urlencode
+
+import httpx
+
+from config import env_bool, env_float, env_int
+from graph_cache import token_subject
+from telemetry import graph_request_span
+from resilience import (
+    RETRYABLE_STATUS,
+    RETRY_MAX_ATTEMPTS,
+    THROTTLE_STATUS,
+    CircuitOpenError,
+    backoff_delay,
+    graph_backend,
+    parse_retry_after,
+)
+
+# Microsoft Graph API のベース URL
+GRAPH_BASE = "https://graph.microsoft.com/v1.0"
+
+# ---------------------------------
+# 接続プール・タイムアウト設定（環境変数で上書き可能）
+# ---------------------------------
+GRAPH_MAX_CONNECTIONS = env_int("GRAPH_MAX_CONNECTIONS", 100)
+GRAPH_MAX_KEEPALIVE_CONNECTIONS = env_int("GRAPH_MAX_KEEPALIVE_CONNECTIONS", 20)
+GRAPH_KEEPALIVE_EXPIRY_SEC = env_float("GRAPH_KEEPALIVE_EXPIRY_SEC", 60.0)
+GRAPH_TIMEOUT_SEC = env_float("GRAPH_TIMEOUT_SEC", 30.0)
+GRAPH_CONNECT_TIMEOUT_SEC = env_float("GRAPH_CONNECT_TIMEOUT_SEC", 5.0)
+GRAPH_HTTP2 = env_bool("GRAPH_HTTP2", True)
+
+# ---------------------------------
+# 冪等なので、タイムアウトなど送信後の失敗でもリトライしてよいメソッド
+_IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+# ---------------------------------
+# ページング設定（環境変数で上書き可能）
+# ---------------------------------
+# 1 ページあたりの取得件数（$top）。大きいほどラウンドトリップが減る
+GRAPH_PAGE_SIZE = env_int("GRAPH_PAGE_SIZE", 100)
+# モデルに返す最大件数・最大文字数（超えたら以降のページは取得しない）
+GRAPH_MAX_ITEMS = env_int("GRAPH_MAX_ITEMS", 200)
+GRAPH_MAX_CHARS = env_int("GRAPH_MAX_CHARS", 20000)
+
+# JSON バッチ（/$batch）1 回に含められるリクエスト数の上限（Graph の仕様）
+GRAPH_BATCH_LIMIT = 20
+
+# HTTP/2 は h2 パッケージ（httpx[http2]）がある場合のみ有効にする
+try:
+    import h2  # noqa: F401
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+# イベントループごとのクライアント
+# httpx.AsyncClient の接続はループに紐づくため、ループが変わったら別のクライアントを使う
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+# ベンチマーク用に差し替えるトランスポート（None なら実際のネットワークを使う）
+_transport: httpx.AsyncBaseTransport | None = None
+
+
+class GraphError(Exception):
+    """Graph API が 2xx 以外を返したときの例外"""
+
+    def __init__(self, response: httpx.Response):
+        self.status_code = response.status_code
+        self.text = response.text
+        super().__init__(f"{self.status_code} - {self.text}")
+
+
+def _create_client() -> httpx.AsyncClient:
+    """共有用の AsyncClient を作成する"""
+    http2 = GRAPH_HTTP2 and _HTTP2_AVAILABLE
+    client = httpx.AsyncClient(
+        base_url=GRAPH_BASE,
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=GRAPH_MAX_CONNECTIONS,
+            max_keepalive_connections=GRAPH_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=GRAPH_KEEPALIVE_EXPIRY_SEC,
+        ),
+        timeout=httpx.Timeout(GRAPH_TIMEOUT_SEC, connect=GRAPH_CONNECT_TIMEOUT_SEC),
+        # レスポンスを gzip で圧縮してもらい、転送量を減らす
+        headers={"Accept-Encoding": "gzip"},
+        transport=_transport,
+    )
+    print(
+        f"[Graph] HTTP クライアントを作成しました (http2={http2}, "
+        f"max_connections={GRAPH_MAX_CONNECTIONS})"
+    )
+    return client
+
+
+def set_graph_transport(transport: httpx.AsyncBaseTransport | None) -> None:
+    """
+    Graph への通信に使うトランスポートを差し替える（ベンチマーク用）
+
+    作成済みのクライアントは捨てるので、次のリクエストから新しいトランスポートが使われる
+    """
+    global _transport
+    _transport = transport
+    _clients.clear()
+
+
+def get_graph_client() -> httpx.AsyncClient:
+    """
+    現在のイベントループ用の共有クライアントを取得する（なければ作成）
+
+    Returns:
+        コネクションプール付きの httpx.AsyncClient
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = _create_client()
+        _clients[loop] = client
+    return client
+
+
+async def graph_request(
+    method: str,
+    path: str,
+    access_token: str,
+    *,
+    params: dict | None = None,
+    json: dict | None = None,
+    headers: dict | None = None,
+) -> httpx.Response:
+    """
+    Graph API にリクエストを送る
+
+    Args:
+        method: HTTP メソッド（GET / POST / PATCH など）
+        path: GRAPH_BASE からの相対パス（例: /me/events）、または @odata.nextLink などの絶対 URL
+        access_token: Microsoft Graph API のアクセストークン（リクエストごとに付与する）
+        params: クエリパラメータ
+        json: リクエストボディ（JSON）
+        headers: 追加のリクエストヘッダー
+
+    Returns:
+        httpx.Response
+    """
+    request_headers = {"Authorization": f"Bearer {access_token}"}
+    if headers:
+        request_headers.update(headers)
+
+    client = get_graph_client()
+    idempotent = method.upper() in _IDEMPOTENT_METHODS
+
+    def classify(res: httpx.Response | None, error: BaseException | None) -> tuple[bool, float | None]:
+        if error is not None:
+            # 接続前の失敗は常にリトライしてよいが、送信後の失敗（タイムアウトなど）は
+            # POST だと二重作成になりうるので、冪等なメソッドだけリトライする
+            if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+                return True, None
+            return idempotent and isinstance(error, httpx.TransportError), None
+        if res.status_code in (RETRYABLE_STATUS if idempotent else THROTTLE_STATUS):
+            return True, parse_retry_after(res.headers.get("Retry-After"))
+        return False, None
+
+    async def send() -> httpx.Response:
+        return await client.request(method, path, params=params, json=json, headers=request_headers)
+
+    # nextLink などの絶対 URL もスパンにはパスだけを載せる（クエリにはトークンや ID が含まれうる）
+    route = path.split("?", 1)[0].removeprefix(GRAPH_BASE)
+    with graph_request_span(method, route) as record:
+        try:
+            res = await graph_backend.call(
+                send, classify, tenant=_tenant_of(access_token), succeeded=lambda r: r.status_code < 400
+            )
+        except CircuitOpenError as e:
+            # ツール側は status_code でエラー処理しているので、503 のレスポンスとして返す
+            res = httpx.Response(503, text=str(e), request=httpx.Request(method, path))
+        record(res.status_code, len(res.content))
+        return res
+
+
+def _tenant_of(access_token: str) -> str:
+    """レート制限の単位にするテナント（JWT でなければユーザー単位になる）"""
+    return token_subject(access_token).split(":", 1)[0]
+
+
+async def close_graph_client() -> None:
+    """現在のイベントループ用のクライアントを閉じる（シャットダウン時やベンチマーク用）"""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def iter_graph_pages(
+    path: str,
+    access_token: str,
+    *,
+    params: dict | None = None,
+    headers: dict | None = None,
+) -> AsyncIterator[list[dict]]:
+    """
+    一覧系 API のページを @odata.nextLink をたどりながら 1 ページずつ返す
+
+    全ページをまとめてメモリに載せず、呼び出し側がページごとに整形・打ち切りできるようにする
+
+    Args:
+        path: GRAPH_BASE からの相対パス（例: /me/calendarView）
+        access_token: Microsoft Graph API のアクセストークン
+        params: 1 ページ目のクエリパラメータ（2 ページ目以降は nextLink に含まれる）
+        headers: 追加のリクエストヘッダー（Prefer など。全ページに付与する）
+
+    Yields:
+        各ページの value（アイテムのリスト）
+
+    Raises:
+        GraphError: 2xx 以外のレスポンスを受け取った場合
+    """
+    url: str | None = path
+    page_params = params
+    while url:
+        res = await graph_request("GET", url, access_token, params=page_params, headers=headers)
+        if res.status_code != 200:
+            raise GraphError(res)
+
+        data = res.json()
+        yield data.get("value", [])
+
+        url = data.get("@odata.nextLink")
+        page_params = None
+
+
+async def collect_formatted(
+    pages: AsyncIterator[list[dict]],
+    format_item: Callable[[dict], str],
+    *,
+    max_items: int = GRAPH_MAX_ITEMS,
+    max_chars: int = GRAPH_MAX_CHARS,
+) -> tuple[list[str], bool]:
+    """
+    ページを受け取った順に整形し、上限に達したら残りのページは取得せずに打ち切る
+
+    Args:
+        pages: iter_graph_pages() の戻り値
+        format_item: アイテム 1 件を 1 行の文字列に整形する関数
+        max_items: 最大件数
+        max_chars: 最大文字数（改行を含む）
+
+    Returns:
+        (整形済みの行のリスト, 打ち切ったかどうか)
+    """
+    lines: list[str] = []
+    total_chars = 0
+    async with aclosing(pages):
+        async for items in pages:
+            for item in items:
+                line = format_item(item)
+                if len(lines) >= max_items or total_chars + len(line) + 1 > max_chars:
+                    return lines, True
+                lines.append(line)
+                total_chars += len(line) + 1
+    return lines, False
+
+
+async def as_pages(items: list[dict]) -> AsyncIterator[list[dict]]:
+    """手元にあるアイテムのリストを 1 ページとして collect_formatted() に渡すためのラッパー"""
+    yield items
+
+
+def page_size(max_items: int = GRAPH_MAX_ITEMS) -> int:
+    """$top に指定するページサイズ（返す件数より大きいページは取らない）"""
+    return max(1, min(GRAPH_PAGE_SIZE, max_items))
+
+
+# =====================================
+# JSON バッチ（/$batch）
+# =====================================
+# 複数のリクエストを 1 回の HTTP 往復にまとめる
+# https://learn.microsoft.com/ja-jp/graph/json-batching
+
+@dataclass
+class BatchRequest:
+    """バッチに含める 1 件のリクエスト"""
+
+    id: str
+    method: str
+    # GRAPH_BASE からの相対パス（クエリ文字列を含めてよい）
+    url: str
+    body: dict | None = None
+    headers: dict | None = None
+    # 先に実行が終わっている必要があるリクエストの id
+    depends_on: list[str] = field(default_factory=list)
+
+
+@dataclass
+class BatchResponse:
+    """バッチ内の 1 件のレスポンス"""
+
+    id: str
+    status: int
+    body: dict
+    headers: dict = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status < 300
+
+    @property
+    def error_message(self) -> str:
+        """エラー時の表示用メッセージ"""
+        error = self.body.get("error", {}) if isinstance(self.body, dict) else {}
+        return f"{self.status} - {error.get('message') or error.get('code') or self.body}"
+
+
+def build_url(path: str, params: dict | None = None) -> str:
+    """バッチ用に、パスとクエリパラメータから相対 URL を組み立てる"""
+    if not params:
+        return path
+    return f"{path}?{urlencode(params, quote_via=quote, safe='$,/')}"
+
+
+def _chunk_batch_requests(requests: list[BatchRequest]) -> list[list[BatchRequest]]:
+    """
+    リクエストを GRAPH_BATCH_LIMIT 件ずつのバッチに分ける
+
+    dependsOn は同じバッチ内のリクエストしか参照できないため、
+    依存関係でつながったリクエストは同じバッチに入れ、依存先が先に来るように並べる
+    """
+    by_id = {req.id: req for req in requests}
+    for req in requests:
+        for dep in req.depends_on:
+            if dep not in by_id:
+                raise ValueError(f"バッチリクエスト {req.id} の依存先 {dep} が存在しません")
+
+    # 依存関係でつながったグループ（連結成分）を求める
+    parent = {req.id: req.id for req in requests}
+
+    def find(x: str) -> str:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for req in requests:
+        for dep in req.depends_on:
+            parent[find(req.id)] = find(dep)
+
+    groups: dict[str, list[BatchRequest]] = {}
+    for req in requests:
+        groups.setdefault(find(req.id), []).append(req)
+
+    # グループ内を依存先が先になるよう並べ替える（トポロジカルソート）
+    def ordered(group: list[BatchRequest]) -> list[BatchRequest]:
+        result: list[BatchRequest] = []
+        done: set[str] = set()
+        visiting: set[str] = set()
+
+        def visit(req: BatchRequest) -> None:
+            if req.id in done:
+                return
+            if req.id in visiting:
+                raise ValueError(f"バッチリクエスト {req.id} の依存関係が循環しています")
+            visiting.add(req.id)
+            for dep in req.depends_on:
+                visit(by_id[dep])
+            visiting.discard(req.id)
+            done.add(req.id)
+            result.append(req)
+
+        for req in group:
+            visit(req)
+        return result
+
+    # グループを壊さずに、上限件数まで詰めていく
+    chunks: list[list[BatchRequest]] = []
+    current: list[BatchRequest] = []
+    for group in groups.values():
+        if len(group) > GRAPH_BATCH_LIMIT:
+            raise ValueError(f"依存関係でつながったリクエストが {GRAPH_BATCH_LIMIT} 件を超えています")
+        if len(current) + len(group) > GRAPH_BATCH_LIMIT:
+            chunks.append(current)
+            current = []
+        current.extend(ordered(group))
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def graph_batch(access_token: str, requests: list[BatchRequest]) -> dict[str, BatchResponse]:
+    """
+    複数のリクエストを /$batch でまとめて送る
+
+    20 件を超える場合は自動で分割し、分割したバッチは並行して送る
+
+    Args:
+        access_token: Microsoft Graph API のアクセストークン
+        requests: 送るリクエストのリスト（id は一意にすること）
+
+    Returns:
+        id をキーにしたレスポンスの辞書（個々のリクエストの成否は BatchResponse.ok で確認する）
+
+    Raises:
+        GraphError: /$batch 自体が 2xx 以外を返した場合
+        ValueError: 依存関係が不正な場合
+    """
+    if len({req.id for req in requests}) != len(requests):
+        raise ValueError("バッチリクエストの id が重複しています")
+
+    async def send(chunk: list[BatchRequest]) -> list[BatchResponse]:
+        payload = {"requests": [_to_batch_item(req) for req in chunk]}
+        res = await graph_request("POST", "/$batch", access_token, json=payload)
+        if res.status_code != 200:
+            raise GraphError(res)
+        return [
+            BatchResponse(
+                id=item.get("id", ""),
+                status=item.get("status", 0),
+                body=item.get("body") or {},
+                headers=item.get("headers") or {},
+            )
+            for item in res.json().get("responses", [])
+        ]
+
+    results: dict[str, BatchResponse] = {}
+    pending = requests
+    attempt = 0
+    while pending:
+        attempt += 1
+        chunk_results = await asyncio.gather(*(send(chunk) for chunk in _chunk_batch_requests(pending)))
+        for responses in chunk_results:
+            for resp in responses:
+                results[resp.id] = resp
+
+        # バッチ全体は 200 でも、個々のリクエストがスロットリングされることがある
+        # スロットリングされたもの（と、それに依存して 424 になったもの）だけを送り直す
+        throttled = {req.id for req in pending if results.get(req.id) and results[req.id].status in THROTTLE_STATUS}
+        if not throttled or attempt >= RETRY_MAX_ATTEMPTS:
+            break
+        retry_ids = set(throttled)
+        for req in pending:
+            if results.get(req.id) and results[req.id].status == 424 and set(req.depends_on) & retry_ids:
+                retry_ids.add(req.id)
+        retry_after = max(
+            (parse_retry_after(results[rid].headers.get("Retry-After")) or 0.0 for rid in throttled),
+            default=0.0,
+        )
+        delay = backoff_delay(attempt, retry_after or None)
+        graph_backend.stats.throttled += len(throttled)
+        graph_backend.stats.retries += 1
+        print(f"[Resilience] graph: バッチ内の {len(retry_ids)} 件を {delay:.2f} 秒後に再送します")
+        await asyncio.sleep(delay)
+        # 依存先が再送対象外（成功済み）なら、その依存は外して送る
+        pending = [
+            BatchRequest(
+                id=req.id,
+                method=req.method,
+                url=req.url,
+                body=req.body,
+                headers=req.headers,
+                depends_on=[dep for dep in req.depends_on if dep in retry_ids],
+            )
+            for req in pending if req.id in retry_ids
+        ]
+    return results
+
+
+def _to_batch_item(req: BatchRequest) -> dict:
+    item: dict = {"id": req.id, "method": req.method, "url": req.url}
+    headers = dict(req.headers or {})
+    if req.body is not None:
+        item["body"] = req.body
+        headers.setdefault("Content-Type", "application/json")
+    if headers:
+        item["headers"] = headers
+    if req.depends_on:
+        item["dependsOn"] = list(req.depends_on)
+    return item
+
+
+async def iter_batch_pages(response: BatchResponse, access_token: str) -> AsyncIterator[list[dict]]:
+    """
+    バッチで取得した一覧のレスポンスから、@odata.nextLink の続きも含めてページを返す
+
+    Args:
+        response: 一覧系 API の BatchResponse（成功していること）
+        access_token: Microsoft Graph API のアクセストークン
+
+    Yields:
+        各ページの value（アイテムのリスト）
+    """
+    yield response.body.get("value", [])
+    next_link = response.body.get("@odata.nextLink")
+    if next_link:
+        async for page in iter_graph_pages(next_link, access_token):
+            yield page
@@ -0,0 +1,189 @@
+# =====================================
+# Graph デルタクエリによる差分同期
+# =====================================
+#
+# get_schedule / get_tasks を繰り返し呼ぶと、毎回期間全体をダウンロードし直していた。
+# デルタクエリ（calendarView/delta, todo/lists/{id}/tasks/delta）を使い、
+# セッションごとにローカルのスナップショットとデルタトークン（@odata.deltaLink）を持つことで、
+# 2 回目以降は変更分だけを取得してスナップショットから回答する。
+#
+# デルタトークンが失効した場合（410 Gone）はスナップショットを捨てて全件同期し直す。
+# https://learn.microsoft.com/ja-jp/graph/delta-query-overview
+
+import asyncio
+import contextlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from config import env_bool, env_int
+from graph_cache import token_subject
+from graph_client import GraphError, graph_request
+
+# デルタ同期を使うか（デフォルトは無効。有効にすると get_schedule / get_tasks がデルタクエリを使う）
+GRAPH_DELTA_SYNC = env_bool("GRAPH_DELTA_SYNC", False)
+# 1 セッションあたりに保持するスナップショット数（期間やリストごとに 1 つ）
+GRAPH_DELTA_MAX_SNAPSHOTS = env_int("GRAPH_DELTA_MAX_SNAPSHOTS", 16)
+# デルタクエリの 1 ページあたりの件数（$top の代わりに Prefer: odata.maxpagesize で指定する）
+GRAPH_DELTA_PAGE_SIZE = env_int("GRAPH_DELTA_PAGE_SIZE", 100)
+
+
+@dataclass
+class DeltaSnapshot:
+    """1 つのデルタクエリ（期間やリスト）のローカルスナップショット"""
+
+    items: dict[str, dict]
+    delta_link: str | None
+    synced_at: float
+
+
+class DeltaSyncStore:
+    """セッションごとのデルタスナップショットを保持する"""
+
+    def __init__(self, max_snapshots_per_session: int):
+        self.max_snapshots_per_session = max_snapshots_per_session
+        self.full_syncs = 0
+        self.delta_syncs = 0
+        self.resyncs = 0
+        self._sessions: dict[str, OrderedDict[tuple, DeltaSnapshot]] = {}
+        # 同じスナップショットの同期を直列化するロック（セッションID -> キー -> [ロック, 使っている数]）
+        # 使っている同期が無くなったら捨てるので、期間やリストの数だけ増え続けない
+        self._sync_locks: dict[str, dict[tuple, list]] = {}
+        self._lock = threading.Lock()
+
+    async def sync(
+        self,
+        session_id: str,
+        access_token: str,
+        delta_path: str,
+        params: dict | None = None,
+        headers: dict | None = None,
+    ) -> list[dict]:
+        """
+        スナップショットを最新化して、現在のアイテム一覧を返す
+
+        初回は全件を取得し、2 回目以降は前回の @odata.deltaLink から変更分だけを取得する
+
+        Args:
+            session_id: AgentCore のセッションID
+            access_token: Microsoft Graph API のアクセストークン
+            delta_path: デルタクエリのパス（例: /me/calendarView/delta）
+            params: 初回同期時のクエリパラメータ（期間など。スナップショットのキーの一部）
+            headers: 追加のリクエストヘッダー（Prefer のタイムゾーンなど）
+
+        Returns:
+            スナップショット内のアイテムのリスト（順序は不定なので呼び出し側で並べ替える）
+
+        Raises:
+            GraphError: 2xx 以外のレスポンスを受け取った場合（410 は内部で全件同期し直す）
+        """
+        key = (token_subject(access_token), delta_path, tuple(sorted((params or {}).items())))
+        request_headers = {**(headers or {})}
+        prefer = request_headers.get("Prefer")
+        page_pref = f"odata.maxpagesize={GRAPH_DELTA_PAGE_SIZE}"
+        request_headers["Prefer"] = f"{prefer}, {page_pref}" if prefer else page_pref
+
+        # 先読みとツールなどが同時に同期すると、古いデルタリンクで取得した結果が新しい結果を上書きするので、
+        # 同じスナップショットの同期は 1 つずつ実行する
+        async with self._sync_lock(session_id, key):
+            snapshot = self._get(session_id, key)
+            if snapshot is not None and snapshot.delta_link:
+                try:
+                    await self._apply(snapshot, snapshot.delta_link, None, access_token, request_headers)
+                    self.delta_syncs += 1
+                    return list(snapshot.items.values())
+                except GraphError as e:
+                    if e.status_code != 410:
+                        raise
+                    # デルタトークンが失効した（または再同期が必要）ので全件同期し直す
+                    print(f"[Delta] デルタトークンが失効したため全件同期します: {delta_path}")
+                    self.resyncs += 1
+
+            snapshot = DeltaSnapshot(items={}, delta_link=None, synced_at=0.0)
+            await self._apply(snapshot, delta_path, params, access_token, request_headers)
+            self.full_syncs += 1
+            self._put(session_id, key, snapshot)
+            return list(snapshot.items.values())
+
+    def drop_session(self, session_id: str) -> None:
+        """セッションのスナップショットを全て捨てる（セッションストアから追い出されたとき）"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._sync_locks.pop(session_id, None)
+
+    def log_stats(self) -> None:
+        print(
+            f"[Delta] sessions={len(self._sessions)} full_syncs={self.full_syncs} "
+            f"delta_syncs={self.delta_syncs} resyncs={self.resyncs}"
+        )
+
+    async def _apply(
+        self,
+        snapshot: DeltaSnapshot,
+        url: str,
+        params: dict | None,
+        access_token: str,
+        headers: dict,
+    ) -> None:
+        """@odata.nextLink をたどって変更を取得し、最後の @odata.deltaLink まで反映する"""
+        changes: list[dict] = []
+        next_url: str | None = url
+        while next_url:
+            res = await graph_request("GET", next_url, access_token, params=params, headers=headers)
+            if res.status_code != 200:
+                raise GraphError(res)
+            data = res.json()
+            changes.extend(data.get("value", []))
+            params = None
+            next_url = data.get("@odata.nextLink")
+            delta_link = data.get("@odata.deltaLink")
+
+        # 途中で失敗したときにスナップショットが中途半端にならないよう、全ページ取得後にまとめて反映する
+        for item in changes:
+            item_id = item.get("id")
+            if not item_id:
+                continue
+            if "@removed" in item:
+                snapshot.items.pop(item_id, None)
+            else:
+                snapshot.items[item_id] = {**snapshot.items.get(item_id, {}), **item}
+        snapshot.delta_link = delta_link
+        snapshot.synced_at = time.time()
+
+    @contextlib.asynccontextmanager
+    async def _sync_lock(self, session_id: str, key: tuple):
+        with self._lock:
+            slot = self._sync_locks.setdefault(session_id, {}).setdefault(key, [asyncio.Lock(), 0])
+            slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            with self._lock:
+                slot[1] -= 1
+                locks = self._sync_locks.get(session_id)
+                if slot[1] == 0 and locks is not None and locks.get(key) is slot:
+                    del locks[key]
+                    if not locks:
+                        del self._sync_locks[session_id]
+
+    def _get(self, session_id: str, key: tuple) -> DeltaSnapshot | None:
+        with self._lock:
+            snapshots = self._sessions.get(session_id)
+            if not snapshots or key not in snapshots:
+                return None
+            snapshots.move_to_end(key)
+            return snapshots[key]
+
+    def _put(self, session_id: str, key: tuple, snapshot: DeltaSnapshot) -> None:
+        with self._lock:
+            snapshots = self._sessions.setdefault(session_id, OrderedDict())
+            snapshots[key] = snapshot
+            snapshots.move_to_end(key)
+            while len(snapshots) > self.max_snapshots_per_session:
+                snapshots.popitem(last=False)
+
+
+# プロセス全体で共有するストア
+delta_store = DeltaSyncStore(GRAPH_DELTA_MAX_SNAPSHOTS)
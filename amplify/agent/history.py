@@ -0,0 +1,235 @@
+# =====================================
+# 会話履歴の圧縮（長寿命セッション向け）
+# =====================================
+#
+# セッションストアは同じ Agent をターンをまたいで使い回すため、agent.messages は増え続け、
+# stream_async のたびに全履歴（Confluence の storage HTML のような大きなツール結果も含む）を
+# Bedrock に送り直していた。入力トークンと最初のトークンまでの時間がターンごとに伸びていく。
+#
+# ここでは Strands の ConversationManager として以下を行う:
+#
+# - 直近 N ターンより古いツール結果・ツール入力の長い文字列を先頭だけ残して省略する
+# - 推定トークン数がセッションごとの予算を超えたら、古いターンから丸ごと捨てる
+#   （toolUse / toolResult の組が分かれないよう、ユーザーの発話の位置で切る）
+# - モデル呼び出しのたびに推定プロンプトサイズをログに出す
+#
+# Bedrock のプロンプトキャッシュ（app.py の AGENT_PROMPT_CACHE）を使う場合は、履歴の先頭を
+# なるべく書き換えない（stable_prefix）: 毎ターン古いターンを省略するとキャッシュ済みの部分が変わり、
+# 次のターンでキャッシュに当たらなくなる。そこで予算を超えるまでは履歴を追記するだけにし、
+# 超えたときにまとめて省略・削除して予算の AGENT_HISTORY_LOW_WATER の割合まで減らす。
+#
+# AGENT_HISTORY_MODE でモードを切り替えられる:
+#   budget    : 上記の省略 + トークン予算（デフォルト）
+#   summarize : 溢れたときに古いメッセージを要約する（Strands の SummarizingConversationManager）
+#   sliding   : メッセージ数のスライディングウィンドウ（Strands のデフォルト）
+#   none      : 何もしない
+
+import json
+import os
+from typing import Any
+
+from strands.agent.conversation_manager import (
+    ConversationManager,
+    NullConversationManager,
+    SlidingWindowConversationManager,
+    SummarizingConversationManager,
+)
+from strands.hooks import BeforeModelCallEvent, HookRegistry
+from strands.types.exceptions import ContextWindowOverflowException
+
+from config import env_float, env_int
+
+AGENT_HISTORY_MODE = os.environ.get("AGENT_HISTORY_MODE", "budget").strip().lower()
+# 1 セッションの履歴の推定トークン数の上限（システムプロンプトとツール定義は含まない）
+AGENT_HISTORY_TOKEN_BUDGET = env_int("AGENT_HISTORY_TOKEN_BUDGET", 24000)
+# ツール結果を省略せずに残す直近のターン数
+AGENT_HISTORY_KEEP_TURNS = env_int("AGENT_HISTORY_KEEP_TURNS", 2)
+# 古いターンのツール結果・ツール入力の文字列をこの文字数まで切り詰める
+AGENT_HISTORY_ELIDE_CHARS = env_int("AGENT_HISTORY_ELIDE_CHARS", 500)
+# stable_prefix のとき、予算を超えたら予算のこの割合まで減らす（次に超えるまでの余裕を作る）
+AGENT_HISTORY_LOW_WATER = env_float("AGENT_HISTORY_LOW_WATER", 0.6)
+
+
+def estimate_tokens(messages: list[dict]) -> int:
+    """
+    メッセージの推定トークン数
+
+    正確な値はモデルを呼ばないと分からないので、文字数から概算する。
+    ASCII は 4 文字で 1 トークン、日本語などそれ以外は 1 文字 1 トークンとみなす（多めに見積もる）
+    """
+    text = json.dumps(messages, ensure_ascii=False, default=str)
+    # ASCII 以外を捨てて数える（1 文字ずつ比べるより速い）
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return ascii_chars // 4 + (len(text) - ascii_chars)
+
+
+def _is_turn_start(message: dict) -> bool:
+    """ユーザーの発話で始まるメッセージか（toolResult だけのユーザーメッセージはターンの途中）"""
+    if message.get("role") != "user":
+        return False
+    return not any("toolResult" in block for block in message.get("content", []))
+
+
+def _elide_text(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}\n…（以前のターンの出力のため省略しました: 元は {len(text)} 文字）"
+
+
+def _elide_value(value: Any, max_chars: int) -> Any:
+    """ツール入力（dict / list / str）の中の長い文字列を切り詰める"""
+    if isinstance(value, str):
+        return _elide_text(value, max_chars)
+    if isinstance(value, dict):
+        return {k: _elide_value(v, max_chars) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_elide_value(v, max_chars) for v in value]
+    return value
+
+
+class CompactingConversationManager(ConversationManager):
+    """
+    古いツール結果の省略とトークン予算による履歴の圧縮
+
+    Args:
+        token_budget: 履歴の推定トークン数の上限
+        keep_recent_turns: ツール結果を省略せずに残す直近のターン数
+        elide_chars: 古いターンのツール結果・ツール入力を切り詰める文字数
+        stable_prefix: 予算を超えるまで履歴を書き換えない（プロンプトキャッシュ向け）
+        low_water: stable_prefix のとき、圧縮後の目標（予算に対する割合）
+    """
+
+    def __init__(
+        self,
+        token_budget: int,
+        keep_recent_turns: int,
+        elide_chars: int,
+        stable_prefix: bool = False,
+        low_water: float = 1.0,
+    ):
+        super().__init__()
+        self.token_budget = token_budget
+        self.keep_recent_turns = max(0, keep_recent_turns)
+        self.elide_chars = elide_chars
+        self.stable_prefix = stable_prefix
+        self.low_water = min(max(low_water, 0.0), 1.0)
+        self.elided_blocks = 0
+        self.last_prompt_tokens = 0
+
+    def register_hooks(self, registry: HookRegistry, **kwargs: Any) -> None:
+        super().register_hooks(registry, **kwargs)
+        registry.add_callback(BeforeModelCallEvent, self._log_prompt_size)
+
+    def _log_prompt_size(self, event: BeforeModelCallEvent) -> None:
+        messages = event.agent.messages
+        self.last_prompt_tokens = estimate_tokens(messages)
+        print(
+            f"[History] model call: messages={len(messages)} est_tokens={self.last_prompt_tokens} "
+            f"budget={self.token_budget} removed={self.removed_message_count} elided={self.elided_blocks}"
+        )
+
+    def apply_management(self, agent: Any, **kwargs: Any) -> None:
+        """ターンの終わりに呼ばれ、次のターンで送る履歴を小さくしておく"""
+        messages = agent.messages
+        before = estimate_tokens(messages)
+        budget = self.token_budget
+        if self.stable_prefix:
+            # 予算内なら追記のみ（前のターンまでの部分はキャッシュに当たる）
+            if budget <= 0 or before <= budget:
+                return
+            budget = int(budget * self.low_water)
+        self._elide_old_turns(messages, self.keep_recent_turns)
+        self._trim_to_budget(messages, budget)
+        after = estimate_tokens(messages)
+        if after != before:
+            print(f"[History] compacted: est_tokens {before} -> {after} (messages={len(messages)})")
+
+    def reduce_context(self, agent: Any, e: Exception | None = None, **kwargs: Any) -> None:
+        """
+        コンテキストウィンドウを超えたときに呼ばれる
+
+        直近のターン以外のツール結果を全て省略し、それでも足りなければ最新のターン以外を捨てる
+        """
+        messages = agent.messages
+        before = len(messages)
+        elided_before = self.elided_blocks
+        self._elide_old_turns(messages, 1)
+        dropped = self._drop_oldest_turn(messages)
+        if not dropped and self.elided_blocks == elided_before:
+            if e is not None:
+                raise ContextWindowOverflowException("会話履歴をこれ以上削減できません") from e
+            return
+        print(f"[History] reduced context: messages {before} -> {len(messages)}")
+
+    def _turn_starts(self, messages: list[dict]) -> list[int]:
+        return [i for i, message in enumerate(messages) if _is_turn_start(message)]
+
+    def _elide_old_turns(self, messages: list[dict], keep_turns: int) -> None:
+        """直近 keep_turns ターンより前のメッセージの、長いツール結果・ツール入力を切り詰める"""
+        starts = self._turn_starts(messages)
+        if len(starts) <= keep_turns:
+            return
+        boundary = starts[-keep_turns] if keep_turns else len(messages)
+        for message in messages[:boundary]:
+            for block in message.get("content", []):
+                if "toolResult" in block:
+                    for item in block["toolResult"].get("content", []):
+                        if "text" in item and len(item["text"]) > self.elide_chars:
+                            item["text"] = _elide_text(item["text"], self.elide_chars)
+                            self.elided_blocks += 1
+                        elif "json" in item:
+                            text = json.dumps(item.pop("json"), ensure_ascii=False, default=str)
+                            item["text"] = _elide_text(text, self.elide_chars)
+                            self.elided_blocks += 1
+                elif "toolUse" in block:
+                    tool_input = block["toolUse"].get("input")
+                    elided = _elide_value(tool_input, self.elide_chars)
+                    if elided != tool_input:
+                        block["toolUse"]["input"] = elided
+                        self.elided_blocks += 1
+
+    def _trim_to_budget(self, messages: list[dict], budget: int) -> None:
+        """推定トークン数が予算に収まるまで、古いターンから捨てる（最新のターンは残す）"""
+        if budget <= 0:
+            return
+        while estimate_tokens(messages) > budget:
+            if not self._drop_oldest_turn(messages):
+                break
+
+    def _drop_oldest_turn(self, messages: list[dict]) -> bool:
+        """
+        最も古いターンを捨てる
+
+        Returns:
+            捨てられたかどうか（ターンが 1 つしか無ければ捨てない）
+        """
+        starts = [i for i in self._turn_starts(messages) if i > 0]
+        if not starts:
+            return False
+        del messages[: starts[0]]
+        self.removed_message_count += starts[0]
+        return True
+
+
+def create_conversation_manager(stable_prefix: bool = False) -> ConversationManager:
+    """
+    AGENT_HISTORY_MODE に応じた ConversationManager を作る（Agent ごとに 1 つ）
+
+    Args:
+        stable_prefix: プロンプトキャッシュを使うか（budget モードで、予算を超えるまで履歴を書き換えない）
+    """
+    if AGENT_HISTORY_MODE == "summarize":
+        return SummarizingConversationManager()
+    if AGENT_HISTORY_MODE == "sliding":
+        return SlidingWindowConversationManager()
+    if AGENT_HISTORY_MODE == "none":
+        return NullConversationManager()
+    if AGENT_HISTORY_MODE != "budget":
+        print(f"[Config] AGENT_HISTORY_MODE={AGENT_HISTORY_MODE!r} は不明なため、budget を使用します")
+    return CompactingConversationManager(
+        token_budget=AGENT_HISTORY_TOKEN_BUDGET,
+        keep_recent_turns=AGENT_HISTORY_KEEP_TURNS,
+        elide_chars=AGENT_HISTORY_ELIDE_CHARS,
+        stable_prefix=stable_prefix,
+        low_water=AGENT_HISTORY_LOW_WATER,
+    )
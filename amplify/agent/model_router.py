@@ -0,0 +1,126 @@
+# =====================================
+# 高速モデルと高性能モデルの振り分け（ターンごと）
+# =====================================
+#
+# 以前はすべてのリクエストを Sonnet で処理していたため、「今日の予定は？」のような
+# ツール 1 回で済む単純な依頼でも大きなモデルのレイテンシがかかっていた。
+# ここではユーザーの入力をキーワードと長さで分類し（モデルは呼ばない）、
+# 単純な依頼は高速モデル（Haiku）、複数手順の計画や Confluence のページ作成・編集は高性能モデル（Sonnet）に送る。
+#
+# 振り分けは Strands の ModelRouter（Agent(model=...) に渡すプラグイン）で行う:
+# - Agent と会話履歴（agent.messages）はそのままで、モデル呼び出しに使うモデルだけをターンごとに選ぶ
+#   （どちらも Claude なので、同じ履歴をそのまま送れる）
+# - 分類の結果は invocation_state の ROUTE_KEY で RouteStrategy に渡す
+# - 選んだモデルの呼び出しが失敗した場合（スロットリングのリトライを使い切ったときなど）は、もう一方に切り替える
+#
+# プロンプトキャッシュはモデルごとなので、切り替えたターンではキャッシュへの書き込みが発生する。
+# 高性能モデルで作業中のセッションの短い返事（「はい」「お願いします」）は高性能モデルのままにする。
+
+import re
+from dataclasses import dataclass
+from typing import Any
+
+from strands.models.routing import RoutingCandidate, RoutingContext
+
+from config import env_bool, env_int
+from telemetry import record_model_route
+
+# ターンごとにモデルを振り分けるか（無効なら常に高性能モデル）
+AGENT_MODEL_ROUTING = env_bool("AGENT_MODEL_ROUTING", True)
+# この文字数を超える入力は高性能モデルに送る
+AGENT_ROUTER_FAST_MAX_CHARS = env_int("AGENT_ROUTER_FAST_MAX_CHARS", 120)
+
+FAST = "fast"
+STRONG = "strong"
+# stream_async の invocation_state で、このターンのルート（FAST / STRONG）を渡すキー
+ROUTE_KEY = "amplify:model_route"
+
+# Confluence のページ作成・編集（「〜のページを作って」「議事録を Confluence に書いて」など）
+_AUTHORING = re.compile(
+    r"(confluence|ページ|ドキュメント|議事録|手順書|wiki).*(作成|作って|書いて|書き|更新|編集|追記|修正|下書き)"
+    r"|(作成|作って|書いて|更新|編集|追記|下書き).*(confluence|ページ|ドキュメント|議事録|手順書|wiki)"
+    r"|\b(write|draft|create|update|edit)\b.*\b(page|doc|document|confluence|wiki)\b",
+    re.IGNORECASE,
+)
+# 計画・調整・比較など、複数の情報を組み合わせて判断する依頼
+_PLANNING = re.compile(
+    r"計画|プラン|段取り|優先順位|優先度|調整|空き時間|空いている時間|提案|比較|分析|振り返|整理して|リスケ"
+    r"|\b(plan|prioriti[sz]e|reschedule|compare|analy[sz]e|free time|availability)\b",
+    re.IGNORECASE,
+)
+# 複数の手順を続けて頼む言い回し（「確認して、空いている時間に〜」「〜してから」「その後」）
+_MULTI_STEP = re.compile(r"[てで]、|てから|た後|たら、|その後|それから|ついでに|\band then\b|\bafter that\b", re.IGNORECASE)
+# 前のターンの続き（確認への返事など）
+_FOLLOW_UP = re.compile(
+    r"^(はい|うん|ええ|お願い|おねがい|それで|その内容|進めて|続けて|ok|okay|yes|sure|go ahead|please)",
+    re.IGNORECASE,
+)
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+    """振り分けの結果（route: FAST / STRONG、reason: ログ用の理由）"""
+
+    route: str
+    reason: str
+
+
+def classify_prompt(prompt: str, previous_route: str | None = None) -> RouteDecision:
+    """
+    ユーザーの入力から、このターンで使うモデルを決める
+
+    Args:
+        prompt: ユーザーの入力（日時コンテキストなどを付ける前のもの）
+        previous_route: 同じセッションの前のターンのルート
+
+    Returns:
+        RouteDecision
+    """
+    if not AGENT_MODEL_ROUTING:
+        return RouteDecision(STRONG, "routing_disabled")
+    text = (prompt or "").strip()
+    if _AUTHORING.search(text):
+        return RouteDecision(STRONG, "confluence_authoring")
+    if _PLANNING.search(text):
+        return RouteDecision(STRONG, "planning")
+    if _MULTI_STEP.search(text):
+        return RouteDecision(STRONG, "multi_step")
+    if previous_route == STRONG and _FOLLOW_UP.search(text):
+        return RouteDecision(STRONG, "follow_up")
+    if len(text) > AGENT_ROUTER_FAST_MAX_CHARS:
+        return RouteDecision(STRONG, "long_prompt")
+    return RouteDecision(FAST, "simple")
+
+
+class RouteStrategy:
+    """
+    ModelRouter の RoutingStrategy
+
+    最初の呼び出しでは invocation_state の ROUTE_KEY が指すモデルを選び、
+    失敗した後はまだ失敗していないもう一方のモデルに切り替える（どちらも失敗したらエラーにする）
+    """
+
+    async def select(self, context: RoutingContext, **kwargs: Any) -> RoutingCandidate | None:
+        by_name = {candidate.name: candidate for candidate in context.candidates}
+        wanted = by_name.get(context.invocation_state.get(ROUTE_KEY)) or context.candidates[0]
+        if not context.attempts:
+            record_model_route(wanted.name)
+            return wanted
+
+        # 最後に成功した後に失敗したモデルは除く
+        failed: set[int] = set()
+        for attempt in context.attempts:
+            if attempt.exception is None:
+                failed.clear()
+            else:
+                failed.add(id(attempt.candidate))
+        last = context.attempts[-1]
+        for candidate in [wanted, *context.candidates]:
+            if id(candidate) not in failed:
+                print(
+                    f"[Router] {last.candidate.name} の呼び出しに失敗したため {candidate.name} に切り替えます: "
+                    f"{type(last.exception).__name__}"
+                )
+                record_model_route(candidate.name)
+                return candidate
+        return None
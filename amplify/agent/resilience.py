@@ -0,0 +1,349 @@
+# =====================================
+# リトライ・スロットリング・サーキットブレーカー
+# =====================================
+#
+# Graph / Confluence の呼び出しで共通に使う耐障害レイヤー。
+# 以前は 429 / 503 を受け取るとそのままエラーを返していたため、
+# 負荷が高いとユーザーのリクエスト失敗や余計な LLM ターンにつながっていた。
+#
+# - リトライ: 指数バックオフ + ジッター。Retry-After ヘッダーがあればそれに従う
+# - レート制限: テナントごとのトークンバケットで、Graph のクォータを超えないように送信ペースを抑える
+# - サーキットブレーカー: テナントごとに、バックエンドが連続で失敗したら一定時間呼び出しを止めて即座に失敗させる
+# - メトリクス: リトライ数・スロットリング数などをカウントしてログに出す
+
+import asyncio
+import random
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, TypeVar
+
+from config import env_float, env_int
+
+T = TypeVar("T")
+
+# リトライ対象のステータスコード（スロットリングと一時的なサーバーエラー）
+RETRYABLE_STATUS = frozenset({429, 502, 503, 504})
+# 上のうちスロットリングとして数えるもの
+# （リクエストが処理されていないことが保証されるので、POST など冪等でない呼び出しはこれだけをリトライする。
+#   502 / 504 はゲートウェイの先で処理済みのことがあり、リトライすると予定やタスクが二重に作成されうる）
+THROTTLE_STATUS = frozenset({429, 503})
+
+RETRY_MAX_ATTEMPTS = env_int("RETRY_MAX_ATTEMPTS", 4)
+RETRY_BASE_DELAY_SEC = env_float("RETRY_BASE_DELAY_SEC", 0.5)
+RETRY_MAX_DELAY_SEC = env_float("RETRY_MAX_DELAY_SEC", 30.0)
+
+CIRCUIT_FAILURE_THRESHOLD = env_int("CIRCUIT_FAILURE_THRESHOLD", 5)
+CIRCUIT_RESET_SEC = env_float("CIRCUIT_RESET_SEC", 30.0)
+
+# テナントあたりの送信レート（Graph のクォータより少し低めに設定する）
+GRAPH_RATE_PER_SEC = env_float("GRAPH_RATE_PER_SEC", 20.0)
+GRAPH_RATE_BURST = env_int("GRAPH_RATE_BURST", 40)
+# トークンバケットとサーキットを保持するテナント数の上限（超えたら最も長く使われていないものから捨てる）
+RESILIENCE_MAX_TENANTS = env_int("RESILIENCE_MAX_TENANTS", 1024)
+
+
+class CircuitOpenError(Exception):
+    """サーキットが開いている（バックエンドが停止中とみなしている）ときの例外"""
+
+    def __init__(self, backend: str, retry_in: float):
+        self.backend = backend
+        self.retry_in = retry_in
+        super().__init__(f"{backend} は一時的に利用できません（約 {retry_in:.0f} 秒後に再試行してください）")
+
+
+@dataclass
+class ResilienceStats:
+    """バックエンドごとのカウンター（ログ出力用）"""
+
+    calls: int = 0
+    retries: int = 0
+    throttled: int = 0
+    failures: int = 0
+    circuit_open: int = 0
+    rate_limited_wait_sec: float = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "failures": self.failures,
+            "circuit_open": self.circuit_open,
+            "rate_limited_wait_sec": round(self.rate_limited_wait_sec, 3),
+        }
+
+
+# ---------------------------------
+# トークンバケット
+# ---------------------------------
+
+class TokenBucket:
+    """一定レートでトークンが溜まるバケット。トークンが無ければ溜まるまで待つ"""
+
+    def __init__(self, rate_per_sec: float, burst: int):
+        self.rate_per_sec = rate_per_sec
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> float:
+        """
+        トークンを 1 つ取得する（無ければ待つ）
+
+        Returns:
+            待った秒数
+        """
+        if self.rate_per_sec <= 0:
+            return 0.0
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_sec)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate_per_sec
+                waited += delay
+                await asyncio.sleep(delay)
+
+    def drain(self, seconds: float) -> None:
+        """Retry-After を受け取ったとき、その秒数が経つまで次のトークンが溜まらないようにする"""
+        if self.rate_per_sec <= 0:
+            return
+        self._tokens = min(self._tokens, 1 - seconds * self.rate_per_sec)
+        self._updated = time.monotonic()
+
+
+# ---------------------------------
+# サーキットブレーカー
+# ---------------------------------
+
+class CircuitBreaker:
+    """
+    連続失敗で開き、一定時間後に 1 回だけ試す（half-open）サーキットブレーカー
+
+    - closed: 通常どおり呼び出す
+    - open: 呼び出さずに CircuitOpenError
+    - half-open: reset_sec 経過後、1 回だけ試す。成功すれば closed、失敗すれば再び open
+    """
+
+    def __init__(self, backend: str, failure_threshold: int, reset_sec: float):
+        self.backend = backend
+        self.failure_threshold = failure_threshold
+        self.reset_sec = reset_sec
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+
+    def before_call(self) -> bool:
+        """
+        呼び出し前に確認する。開いていれば CircuitOpenError を投げる
+
+        Returns:
+            この呼び出しが half-open の試行かどうか（True なら呼び出し側は最後に end_probe を呼ぶ）
+        """
+        if self._opened_at is None:
+            return False
+        elapsed = time.monotonic() - self._opened_at
+        if elapsed < self.reset_sec or self._probing:
+            raise CircuitOpenError(self.backend, max(0.0, self.reset_sec - elapsed))
+        # half-open: この呼び出しだけ通す
+        self._probing = True
+        return True
+
+    def end_probe(self) -> None:
+        """
+        half-open の試行を終える
+
+        record_success / record_failure を呼ばずに終わった場合（キャンセル、クライアント側のエラー、
+        スロットリングなど）でも、次の呼び出しが再び試行できるようにする（サーキットは開いたまま）
+        """
+        self._probing = False
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            print(f"[Resilience] {self.backend}: サーキットを閉じました")
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> bool:
+        """
+        失敗を記録する
+
+        Returns:
+            この失敗でサーキットが開いたかどうか
+        """
+        self._failures += 1
+        self._probing = False
+        if self._failures >= self.failure_threshold:
+            was_closed = self._opened_at is None
+            self._opened_at = time.monotonic()
+            if was_closed:
+                print(f"[Resilience] {self.backend}: {self._failures} 回連続で失敗したためサーキットを開きました")
+            return was_closed
+        return False
+
+
+# ---------------------------------
+# リトライ
+# ---------------------------------
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Retry-After ヘッダーを秒数に変換する（秒数と HTTP 日付の両方に対応）
+
+    Returns:
+        待つべき秒数（ヘッダーが無い・解釈できない場合は None）
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: float | None = None) -> float:
+    """
+    attempt 回目（1 始まり）の失敗後に待つ秒数
+
+    Retry-After があればそれを優先し、無ければ指数バックオフ + フルジッター
+    """
+    if retry_after is not None:
+        return min(retry_after, RETRY_MAX_DELAY_SEC)
+    cap = min(RETRY_MAX_DELAY_SEC, RETRY_BASE_DELAY_SEC * (2 ** (attempt - 1)))
+    return random.uniform(0, cap)
+
+
+@dataclass
+class Backend:
+    """
+    1 つのバックエンド（graph / confluence）に対する耐障害ポリシー
+
+    テナントごとにトークンバケットとサーキットブレーカーを持つ
+    （1 つのテナントがスロットリングや障害を受けても、他のテナントの呼び出しは止めない）
+    """
+
+    name: str
+    rate_per_sec: float = 0.0
+    burst: int = 1
+    max_tenants: int = RESILIENCE_MAX_TENANTS
+    stats: ResilienceStats = field(default_factory=ResilienceStats)
+
+    def __post_init__(self):
+        self._tenants: OrderedDict[str, tuple[TokenBucket, CircuitBreaker]] = OrderedDict()
+
+    def _tenant_state(self, tenant: str) -> tuple[TokenBucket, CircuitBreaker]:
+        state = self._tenants.get(tenant)
+        if state is None:
+            label = f"{self.name}[{tenant}]" if tenant else self.name
+            state = (
+                TokenBucket(self.rate_per_sec, self.burst),
+                CircuitBreaker(label, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SEC),
+            )
+            self._tenants[tenant] = state
+            while len(self._tenants) > self.max_tenants:
+                self._tenants.popitem(last=False)
+        else:
+            self._tenants.move_to_end(tenant)
+        return state
+
+    def bucket(self, tenant: str) -> TokenBucket:
+        return self._tenant_state(tenant)[0]
+
+    def circuit(self, tenant: str = "") -> CircuitBreaker:
+        return self._tenant_state(tenant)[1]
+
+    async def call(
+        self,
+        func: Callable[[], Awaitable[T]],
+        classify: Callable[[T | None, BaseException | None], tuple[bool, float | None]],
+        tenant: str = "",
+        succeeded: Callable[[T], bool] | None = None,
+    ) -> T:
+        """
+        func をリトライ・レート制限・サーキットブレーカー付きで呼ぶ
+
+        サーキットには、リトライを使い切ったサーバー側のエラーだけを失敗として数える。
+        スロットリング（Retry-After 付き）で使い切った場合と、クライアント側のエラー（4xx やリトライ対象外の例外）は
+        連続失敗の回数を変えない。成功として数えるのは succeeded が True を返した結果だけ
+
+        Args:
+            func: 実際の呼び出し（引数なしの async 関数）
+            classify: 結果（または例外）を受け取り、(リトライすべきか, Retry-After 秒) を返す関数
+            tenant: レート制限とサーキットの単位（Graph ならテナント ID）
+            succeeded: リトライ対象外の結果が成功かどうか（省略時は例外でなければ成功）
+
+        Returns:
+            func の戻り値（リトライしても失敗した場合は最後の結果）
+
+        Raises:
+            CircuitOpenError: サーキットが開いている場合
+            func が投げた例外（リトライ対象外、またはリトライ回数を使い切った場合）
+        """
+        self.stats.calls += 1
+        bucket, circuit = self._tenant_state(tenant)
+        probing = circuit.before_call()
+        try:
+            attempt = 0
+            while True:
+                attempt += 1
+                self.stats.rate_limited_wait_sec += await bucket.acquire()
+
+                result, error = None, None
+                try:
+                    result = await func()
+                except CircuitOpenError:
+                    raise
+                except Exception as e:
+                    error = e
+
+                retryable, retry_after = classify(result, error)
+                if not retryable:
+                    # 成功だけを記録する（4xx などのクライアント側のエラーは、バックエンドの障害とは数えない）
+                    if error is None and (succeeded is None or succeeded(result)):
+                        circuit.record_success()
+                    if error is not None:
+                        raise error
+                    return result
+
+                if retry_after is not None:
+                    self.stats.throttled += 1
+                    bucket.drain(retry_after)
+
+                if attempt >= RETRY_MAX_ATTEMPTS:
+                    self.stats.failures += 1
+                    # スロットリングはテナントのクォータの問題なので、サーキットは開かない
+                    if retry_after is None and circuit.record_failure():
+                        self.stats.circuit_open += 1
+                    if error is not None:
+                        raise error
+                    return result
+
+                delay = backoff_delay(attempt, retry_after)
+                self.stats.retries += 1
+                print(f"[Resilience] {self.name}: リトライします ({attempt}/{RETRY_MAX_ATTEMPTS - 1}, {delay:.2f} 秒後)")
+                await asyncio.sleep(delay)
+        finally:
+            # キャンセルなどで成功・失敗を記録せずに終わっても、試行中のままにしない
+            if probing:
+                circuit.end_probe()
+
+    def log_stats(self) -> None:
+        print(f"[Resilience] {self.name}: {self.stats.as_dict()}")
+
+
+# プロセス全体で共有するポリシー
+# Confluence は Cloud 側の制限がユーザー単位で不明瞭なので、レート制限はかけずにリトライとサーキットのみ
+graph_backend = Backend("graph", rate_per_sec=GRAPH_RATE_PER_SEC, burst=GRAPH_RATE_BURST)
+confluence_backend = Backend("confluence")
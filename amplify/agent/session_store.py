@@ -0,0 +1,482 @@
+# =====================================
+# セッションストア
+# =====================================
+#
+# セッションごとの Agent（会話履歴を含む）を microVM 内で保持する。
+# 以前は dict に無期限で溜めていたため、長寿命の microVM ではセッション数に比例して
+# メモリが増え続けていた。ここでは以下のポリシーで上限を設ける:
+#
+# - LRU: 最大セッション数を超えたら最も長く使われていないセッションから追い出す
+# - アイドル TTL: 一定時間アクセスのないセッションを追い出す
+# - メッセージ総量: 全セッションの agent.messages の合計バイト数に上限を設ける
+#
+# 追い出したセッションはローカルディスクに退避（spill）でき、
+# 同じセッションIDで再度呼ばれたときに会話履歴を復元できる。
+# 退避はイベントループを止めないよう専用のスレッドで順に実行し、退避先は有効期間と合計バイト数で制限する
+# （/tmp はメモリ上のことがあり、戻ってこないセッションのファイルが溜まり続けないようにする）。
+
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from strands.types.session import decode_bytes_values, encode_bytes_values
+
+from config import env_int
+
+
+@dataclass
+class _Entry:
+    """ストア内の 1 セッション分の情報"""
+
+    agent: Any
+    last_access: float
+    size_bytes: int = 0
+    # ストリーミング実行中のリクエスト数（実行中は追い出さない）
+    active: int = 0
+
+
+@dataclass
+class SessionStoreStats:
+    """追い出し・復元のメトリクス（ログ出力用）"""
+
+    hits: int = 0
+    misses: int = 0
+    evicted_lru: int = 0
+    evicted_ttl: int = 0
+    evicted_bytes: int = 0
+    spilled: int = 0
+    restored: int = 0
+    spill_errors: int = 0
+    spill_swept: int = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted_lru": self.evicted_lru,
+            "evicted_ttl": self.evicted_ttl,
+            "evicted_bytes": self.evicted_bytes,
+            "spilled": self.spilled,
+            "restored": self.restored,
+            "spill_errors": self.spill_errors,
+            "spill_swept": self.spill_swept,
+        }
+
+
+@dataclass
+class SpilledSession:
+    """退避から復元したセッション（Agent(messages=..., state=...) に渡す）"""
+
+    messages: list
+    state: dict
+
+
+# 追い出し時に呼ばれるフック: (session_id, agent, reason) -> None
+EvictHook = Callable[[str, Any, str], None]
+
+
+def estimate_messages_bytes(messages: list) -> int:
+    """
+    会話履歴のおおよそのサイズ（JSON にした時のバイト数）を求める
+
+    厳密なメモリ使用量ではないが、履歴の増え方を比較するには十分
+    """
+    try:
+        return len(json.dumps(messages, ensure_ascii=False, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return 0
+
+
+class SessionStore:
+    """
+    LRU + アイドル TTL でセッションの Agent を保持するストア
+
+    使い方:
+        async with store.creating(session_id):
+            agent = store.acquire(session_id)      # 既存セッション（なければ None）
+            if agent is None:
+                # 退避済みの履歴と state（なければ None）。ディスクを読むのでスレッドで呼ぶ
+                spilled = await asyncio.to_thread(store.load_spilled, session_id)
+                agent = Agent(..., messages=spilled.messages, state=spilled.state)
+                agent = store.add(session_id, agent)   # 先に登録されていたら、登録済みの Agent が返る
+        try:
+            ...  # agent.stream_async(...)
+        finally:
+            store.release(session_id)          # サイズ再計算と追い出し
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = 100,
+        idle_ttl_sec: int = 900,
+        max_total_bytes: int = 64 * 1024 * 1024,
+        spill_dir: str | None = None,
+        spill_ttl_sec: int = 8 * 60 * 60,
+        spill_max_bytes: int = 128 * 1024 * 1024,
+    ):
+        """
+        Args:
+            max_sessions: 保持する最大セッション数
+            idle_ttl_sec: 最終アクセスからこの秒数を過ぎたセッションは追い出す
+            max_total_bytes: 全セッションの会話履歴の合計バイト数の上限
+            spill_dir: 追い出したセッションの退避先ディレクトリ（None なら退避しない）
+            spill_ttl_sec: 退避ファイルの有効期間（AgentCore のセッション最大寿命に合わせて 8 時間）
+            spill_max_bytes: 退避先ディレクトリの合計バイト数の上限（超えたら古いファイルから削除する）
+        """
+        self.max_sessions = max_sessions
+        self.idle_ttl_sec = idle_ttl_sec
+        self.max_total_bytes = max_total_bytes
+        self.spill_dir = spill_dir
+        self.spill_ttl_sec = spill_ttl_sec
+        self.spill_max_bytes = spill_max_bytes
+
+        self.stats = SessionStoreStats()
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._evict_hooks: list[EvictHook] = []
+        # 追い出しフック（退避の JSON 変換とディスク書き込み）と退避ファイルの削除を実行するスレッド
+        # ワーカーは 1 つなので投入順に実行され、同じセッションの退避と読み込みが入れ違わない
+        self._io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-io")
+        # Agent の作成を直列化するロック（セッションID -> [ロック, 待っている数]）
+        self._creating: dict[str, list] = {}
+
+        if spill_dir:
+            self.add_evict_hook(self._spill)
+            # 前回のプロセスが残した期限切れのファイルを片付ける
+            self._io_executor.submit(self._sweep_spill_dir)
+
+    @classmethod
+    def from_env(cls) -> "SessionStore":
+        """
+        環境変数から設定を読み込んでストアを作成する
+
+        環境変数:
+            AGENT_SESSION_MAX_COUNT: 最大セッション数（デフォルト: 100）
+            AGENT_SESSION_IDLE_TTL_SEC: アイドル TTL 秒（デフォルト: 900）
+            AGENT_SESSION_MAX_TOTAL_BYTES: 会話履歴の合計バイト数上限（デフォルト: 64MB）
+            AGENT_SESSION_SPILL_DIR: 退避先ディレクトリ（デフォルト: /tmp/agent-sessions、空文字で無効）
+            AGENT_SESSION_SPILL_TTL_SEC: 退避ファイルの有効期間（デフォルト: 28800）
+            AGENT_SESSION_SPILL_MAX_BYTES: 退避先ディレクトリの合計バイト数上限（デフォルト: 128MB）
+        """
+        spill_dir = os.environ.get("AGENT_SESSION_SPILL_DIR", "/tmp/agent-sessions")
+        return cls(
+            max_sessions=env_int("AGENT_SESSION_MAX_COUNT", 100),
+            idle_ttl_sec=env_int("AGENT_SESSION_IDLE_TTL_SEC", 900),
+            max_total_bytes=env_int("AGENT_SESSION_MAX_TOTAL_BYTES", 64 * 1024 * 1024),
+            spill_dir=spill_dir or None,
+            spill_ttl_sec=env_int("AGENT_SESSION_SPILL_TTL_SEC", 8 * 60 * 60),
+            spill_max_bytes=env_int("AGENT_SESSION_SPILL_MAX_BYTES", 128 * 1024 * 1024),
+        )
+
+    # ---------------------------------
+    # 公開 API
+    # ---------------------------------
+
+    def add_evict_hook(self, hook: EvictHook) -> None:
+        """追い出し時に呼ばれるフックを登録する"""
+        self._evict_hooks.append(hook)
+
+    @contextlib.asynccontextmanager
+    async def creating(self, session_id: str):
+        """
+        同じセッションの acquire から add までを 1 つずつ実行する
+
+        最初のリクエストが同時に届いても、退避の読み込みと Agent の作成は 1 回だけ行い、
+        後のリクエストは acquire で先に作られた Agent を受け取る
+        """
+        with self._lock:
+            slot = self._creating.setdefault(session_id, [asyncio.Lock(), 0])
+            slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            with self._lock:
+                slot[1] -= 1
+                if slot[1] == 0:
+                    self._creating.pop(session_id, None)
+
+    def acquire(self, session_id: str):
+        """
+        セッションの Agent を取り出して「実行中」にする
+
+        Returns:
+            Agent（キャッシュになければ None）
+        """
+        with self._lock:
+            evicted = self._evict_expired_locked()
+            entry = self._entries.get(session_id)
+            if entry is None:
+                self.stats.misses += 1
+                agent = None
+            else:
+                self.stats.hits += 1
+                entry.active += 1
+                entry.last_access = time.monotonic()
+                self._entries.move_to_end(session_id)
+                agent = entry.agent
+        self._run_evict_hooks(evicted)
+        return agent
+
+    def add(self, session_id: str, agent):
+        """
+        新しく作成した Agent を「実行中」として登録する
+
+        同じセッションの最初のリクエストが同時に届き、先に登録されていた場合は置き換えない
+        （実行中の Agent を追い出し対象にしないよう、登録済みの方を「実行中」にして返す）
+
+        Returns:
+            以降の実行に使う Agent（通常は渡した agent、先に登録されていればその Agent）
+        """
+        with self._lock:
+            existing = self._entries.get(session_id)
+            if existing is not None:
+                self.stats.hits += 1
+                existing.active += 1
+                existing.last_access = time.monotonic()
+                self._entries.move_to_end(session_id)
+                return existing.agent
+            entry = _Entry(agent=agent, last_access=time.monotonic(), active=1)
+            entry.size_bytes = estimate_messages_bytes(agent.messages)
+            self._total_bytes += entry.size_bytes
+            self._entries[session_id] = entry
+        # メモリ上に生きている履歴が正になるので、古い退避ファイルは捨てる
+        if self.spill_dir:
+            self._io_executor.submit(self._remove_spill_file, session_id)
+        return agent
+
+    def release(self, session_id: str) -> None:
+        """実行終了時に呼ぶ。履歴サイズを再計算し、上限を超えていれば追い出す"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                entry.active = max(0, entry.active - 1)
+                entry.last_access = time.monotonic()
+                new_size = estimate_messages_bytes(entry.agent.messages)
+                self._total_bytes += new_size - entry.size_bytes
+                entry.size_bytes = new_size
+            evicted = self._evict_expired_locked() + self._evict_over_limit_locked()
+        self._run_evict_hooks(evicted)
+
+    def load_spilled(self, session_id: str) -> SpilledSession | None:
+        """
+        退避済みの会話履歴と agent.state を読み込む（読み込んだファイルは削除する）
+
+        ディスクを読み、実行中の退避も待つので、イベントループからは asyncio.to_thread で呼ぶ
+
+        Returns:
+            SpilledSession（退避されていなければ None）
+        """
+        if not self.spill_dir:
+            return None
+        # 直前に追い出された同じセッションの退避が書き終わるのを待つ（待たないと履歴が失われる）
+        self.flush()
+        path = self._spill_path(session_id)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"[Session] 退避ファイルの読み込みに失敗しました: {e}")
+            self.stats.spill_errors += 1
+            self._remove_spill_file(session_id)
+            return None
+
+        self._remove_spill_file(session_id)
+        # 期限切れ、または別セッション（ハッシュ衝突）の履歴は使わない
+        if data.get("session_id") != session_id:
+            return None
+        if time.time() - data.get("saved_at", 0) > self.spill_ttl_sec:
+            return None
+
+        self.stats.restored += 1
+        # bytes（画像・ドキュメントのブロックなど）は base64 で保存している
+        return SpilledSession(
+            messages=decode_bytes_values(data.get("messages") or []),
+            state=decode_bytes_values(data.get("state") or {}),
+        )
+
+    def flush(self) -> None:
+        """投入済みの追い出しフックと退避ファイルの削除が終わるまで待つ"""
+        self._io_executor.submit(lambda: None).result()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def log_stats(self) -> None:
+        """現在の状態とメトリクスをログに出す"""
+        print(
+            f"[Session] store: sessions={len(self._entries)} "
+            f"bytes={self._total_bytes} stats={self.stats.as_dict()}"
+        )
+
+    # ---------------------------------
+    # 追い出し
+    # ---------------------------------
+
+    def _evict_expired_locked(self) -> list[tuple[str, Any, str]]:
+        """アイドル TTL を過ぎたセッションを追い出す（ロック取得済みで呼ぶ）"""
+        if self.idle_ttl_sec <= 0:
+            return []
+        deadline = time.monotonic() - self.idle_ttl_sec
+        expired = [
+            sid for sid, entry in self._entries.items()
+            if entry.active == 0 and entry.last_access < deadline
+        ]
+        evicted = []
+        for sid in expired:
+            evicted.append(self._pop_locked(sid, "ttl"))
+            self.stats.evicted_ttl += 1
+        return evicted
+
+    def _evict_over_limit_locked(self) -> list[tuple[str, Any, str]]:
+        """セッション数・合計バイト数の上限を超えた分を LRU 順に追い出す（ロック取得済みで呼ぶ）"""
+        evicted = []
+        # OrderedDict の先頭が最も長く使われていないセッション
+        for sid in list(self._entries.keys()):
+            over_count = len(self._entries) > self.max_sessions
+            over_bytes = self.max_total_bytes > 0 and self._total_bytes > self.max_total_bytes
+            if not (over_count or over_bytes):
+                break
+            if self._entries[sid].active:
+                continue
+            if over_count:
+                evicted.append(self._pop_locked(sid, "lru"))
+                self.stats.evicted_lru += 1
+            else:
+                evicted.append(self._pop_locked(sid, "bytes"))
+                self.stats.evicted_bytes += 1
+        return evicted
+
+    def _pop_locked(self, session_id: str, reason: str) -> tuple[str, Any, str]:
+        entry = self._entries.pop(session_id)
+        self._total_bytes -= entry.size_bytes
+        return session_id, entry.agent, reason
+
+    def _run_evict_hooks(self, evicted: list[tuple[str, Any, str]]) -> None:
+        """追い出したセッションについてフックを呼ぶ（JSON 変換とディスク I/O があるので専用のスレッドで実行）"""
+        if evicted:
+            self._io_executor.submit(self._call_evict_hooks, evicted)
+
+    def _call_evict_hooks(self, evicted: list[tuple[str, Any, str]]) -> None:
+        for session_id, agent, reason in evicted:
+            print(f"[Session] Evicted session: {session_id} (reason: {reason})")
+            for hook in self._evict_hooks:
+                try:
+                    hook(session_id, agent, reason)
+                except Exception as e:
+                    print(f"[Session] 追い出しフックでエラー: {e}")
+
+    # ---------------------------------
+    # ディスク退避
+    # ---------------------------------
+
+    def _spill_path(self, session_id: str) -> str:
+        # セッションIDをそのままファイル名に使わない（パストラバーサル対策）
+        digest = hashlib.sha256(session_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.spill_dir, f"{digest}.json")
+
+    def _spill(self, session_id: str, agent, reason: str) -> None:
+        """
+        追い出したセッションの会話履歴と agent.state をディスクに書き出す
+
+        bytes は Strands のセッション保存と同じ形式（base64）にする。それ以外の JSON にできない値が
+        あれば、文字列に変えた不完全な履歴は保存せず、エラーとして記録する（復元すると別の会話になるため）
+        """
+        if not agent.messages:
+            return
+        try:
+            data = json.dumps(
+                {
+                    "session_id": session_id,
+                    "saved_at": time.time(),
+                    "messages": encode_bytes_values(agent.messages),
+                    "state": encode_bytes_values(agent.state.get()),
+                },
+                ensure_ascii=False,
+            )
+        except (TypeError, ValueError) as e:
+            print(f"[Session] ERROR: JSON にできない内容が含まれるため、セッション {session_id} を退避しませんでした: {e}")
+            self.stats.spill_errors += 1
+            return
+
+        path = self._spill_path(session_id)
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            # 書きかけのファイルを読まないように rename で置き換える
+            os.replace(tmp_path, path)
+            self.stats.spilled += 1
+        except OSError as e:
+            print(f"[Session] 退避に失敗しました: {e}")
+            self.stats.spill_errors += 1
+        self._sweep_spill_dir()
+
+    def _sweep_spill_dir(self) -> None:
+        """
+        有効期間を過ぎた退避ファイルを削除し、合計バイト数が上限を超えていれば古い順に削除する
+
+        戻ってこないセッションのファイルは load_spilled では消えないので、退避のたびにここで片付ける
+        """
+        try:
+            names = os.listdir(self.spill_dir)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            print(f"[Session] 退避先ディレクトリを読めませんでした: {e}")
+            return
+        deadline = time.time() - self.spill_ttl_sec
+        files = []
+        for name in names:
+            path = os.path.join(self.spill_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        # 古い順に並べ、期限切れか、上限を超えている間は削除する
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        swept = 0
+        for mtime, size, path in files:
+            if mtime >= deadline and (self.spill_max_bytes <= 0 or total <= self.spill_max_bytes):
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"[Session] 退避ファイルの削除に失敗しました: {e}")
+                continue
+            total -= size
+            swept += 1
+        if swept:
+            self.stats.spill_swept += swept
+            print(f"[Session] 退避ファイルを {swept} 件削除しました（期限切れ、または合計 {self.spill_max_bytes} バイトの上限超過）")
+
+    def _remove_spill_file(self, session_id: str) -> None:
+        if not self.spill_dir:
+            return
+        try:
+            os.remove(self._spill_path(session_id))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"[Session] 退避ファイルの削除に失敗しました: {e}")
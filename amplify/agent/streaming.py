@@ -0,0 +1,193 @@
+# =====================================
+# ストリーミングイベント変換
+# =====================================
+#
+# Strands Agent は様々なイベントを発行するが、フロントエンドで必要なのは:
+# - text: AI の応答テキスト（差分）
+# - tool_use: ツール使用開始の通知
+# - tool_result: ツールの完了通知（名前・ステータス・結果の文字数のみ。中身は送らない）
+# - usage: リクエスト全体のトークン使用量
+# - complete: 応答の完了
+#
+# convert_event は全てのイベントに対して呼ばれるホットパスなので、
+# 例外処理や入れ子の .get を避け、イベントの種類ごとに最短で判定する。
+# StreamConverter は細かいテキスト差分を文字数・時間で区切ってまとめ、SSE のメッセージ数を減らす。
+
+import time
+
+from config import env_bool, env_int
+
+# テキスト差分をまとめる文字数（0 ならまとめずに 1 差分ずつ送る）
+AGENT_SSE_COALESCE_CHARS = env_int("AGENT_SSE_COALESCE_CHARS", 0)
+# まとめているテキストを最大何ミリ秒で送るか
+AGENT_SSE_COALESCE_MS = env_int("AGENT_SSE_COALESCE_MS", 50)
+# tool_result / usage / complete イベントを送るか
+AGENT_SSE_EXTRA_EVENTS = env_bool("AGENT_SSE_EXTRA_EVENTS", True)
+
+_NO_EVENTS: tuple = ()
+_USAGE_KEYS = ("inputTokens", "outputTokens", "totalTokens", "cacheReadInputTokens", "cacheWriteInputTokens")
+
+
+def convert_event(event) -> dict | None:
+    """
+    Strands のイベントをフロントエンド向け JSON 形式に変換（text / tool_use のみ）
+
+    Args:
+        event: Strands からのイベント（dict 形式）
+
+    Returns:
+        フロント向け JSON または None（無視するイベント）
+    """
+    # モデルのストリームイベントは {"event": {...}} の形。それ以外（data / message など）は無視する
+    inner_event = event.get("event") if isinstance(event, dict) else None
+    if not inner_event:
+        return None
+
+    # テキスト差分: contentBlockDelta.delta.text
+    content_block_delta = inner_event.get("contentBlockDelta")
+    if content_block_delta is not None:
+        text = content_block_delta.get("delta", {}).get("text")
+        return {"type": "text", "data": text} if text else None
+
+    # ツール使用開始: contentBlockStart.start.toolUse
+    content_block_start = inner_event.get("contentBlockStart")
+    if content_block_start is not None:
+        tool_use = content_block_start.get("start", {}).get("toolUse")
+        if tool_use:
+            return {"type": "tool_use", "tool_name": tool_use.get("name", "unknown")}
+    return None
+
+
+class StreamConverter:
+    """
+    1 リクエスト分のイベントストリームを SSE イベントに変換する
+
+    使い方:
+        converter = StreamConverter()
+        async for event in agent.stream_async(prompt):
+            for sse in converter.feed(event):
+                yield sse
+        for sse in converter.finish():
+            yield sse
+    """
+
+    def __init__(
+        self,
+        coalesce_chars: int = AGENT_SSE_COALESCE_CHARS,
+        coalesce_ms: int = AGENT_SSE_COALESCE_MS,
+        extra_events: bool = AGENT_SSE_EXTRA_EVENTS,
+    ):
+        self.coalesce_chars = coalesce_chars
+        self.coalesce_sec = coalesce_ms / 1000
+        self.extra_events = extra_events
+        self.model_calls = 0
+        self.tool_calls = 0
+        self.usage = dict.fromkeys(_USAGE_KEYS, 0)
+        self.stop_reason: str | None = None
+        self._pending: list[str] = []
+        self._pending_chars = 0
+        self._pending_since = 0.0
+        self._tool_names: dict[str, str] = {}
+
+    def feed(self, event) -> tuple | list:
+        """イベントを 1 つ受け取り、送るべき SSE イベント（0 個以上）を返す"""
+        inner_event = event.get("event") if isinstance(event, dict) else None
+        if inner_event:
+            content_block_delta = inner_event.get("contentBlockDelta")
+            if content_block_delta is not None:
+                text = content_block_delta.get("delta", {}).get("text")
+                if not text:
+                    return _NO_EVENTS
+                if self.coalesce_chars <= 0:
+                    return ({"type": "text", "data": text},)
+                return self._buffer_text(text)
+
+            content_block_start = inner_event.get("contentBlockStart")
+            if content_block_start is not None:
+                tool_use = content_block_start.get("start", {}).get("toolUse")
+                if not tool_use:
+                    return self._flush_if_due()
+                self.tool_calls += 1
+                name = tool_use.get("name", "unknown")
+                self._tool_names[tool_use.get("toolUseId", "")] = name
+                return self._flush() + [{"type": "tool_use", "tool_name": name}]
+
+            # テキストのブロックが終わったら、まとめているテキストをすぐに送る
+            if "contentBlockStop" in inner_event or "messageStop" in inner_event:
+                return self._flush()
+
+            metadata = inner_event.get("metadata")
+            if metadata is not None:
+                self.model_calls += 1
+                usage = metadata.get("usage") or {}
+                for key in _USAGE_KEYS:
+                    self.usage[key] += usage.get(key, 0)
+            return self._flush_if_due()
+
+        if not self.extra_events or not isinstance(event, dict):
+            return _NO_EVENTS
+
+        message = event.get("message")
+        if message is not None:
+            if message.get("role") != "user":
+                return _NO_EVENTS
+            results = [
+                self._tool_result_event(block["toolResult"])
+                for block in message.get("content", [])
+                if "toolResult" in block
+            ]
+            return self._flush() + results if results else _NO_EVENTS
+
+        if "result" in event:
+            self.stop_reason = str(getattr(event["result"], "stop_reason", "") or "")
+            return self._flush()
+        return _NO_EVENTS
+
+    def finish(self, extra_usage: dict | None = None) -> list:
+        """
+        ストリームの終わりに呼び、残りのテキストと usage / complete を返す（2 回目以降は何も返さない）
+
+        Args:
+            extra_usage: usage イベントに追加する値（リクエストのレイテンシの内訳など）
+        """
+        events = self._flush()
+        if self.extra_events and self.stop_reason is not None:
+            events.append({"type": "usage", "model_calls": self.model_calls, **self.usage, **(extra_usage or {})})
+            events.append({"type": "complete", "stop_reason": self.stop_reason})
+            self.extra_events = False
+        return events
+
+    # ---- テキストのまとめ送り ----
+
+    def _buffer_text(self, text: str) -> tuple | list:
+        now = time.monotonic()
+        if not self._pending:
+            self._pending_since = now
+        self._pending.append(text)
+        self._pending_chars += len(text)
+        if self._pending_chars >= self.coalesce_chars or now - self._pending_since >= self.coalesce_sec:
+            return self._flush()
+        return _NO_EVENTS
+
+    def _flush_if_due(self) -> tuple | list:
+        if self._pending and time.monotonic() - self._pending_since >= self.coalesce_sec:
+            return self._flush()
+        return _NO_EVENTS
+
+    def _flush(self) -> list:
+        if not self._pending:
+            return []
+        text = "".join(self._pending)
+        self._pending.clear()
+        self._pending_chars = 0
+        return [{"type": "text", "data": text}]
+
+    def _tool_result_event(self, tool_result: dict) -> dict:
+        chars = sum(len(item.get("text", "")) for item in tool_result.get("content", []))
+        tool_use_id = tool_result.get("toolUseId", "")
+        return {
+            "type": "tool_result",
+            "tool_name": self._tool_names.get(tool_use_id, "unknown"),
+            "status": tool_result.get("status", ""),
+            "chars": chars,
+        }
@@ -0,0 +1,271 @@
+# =====================================
+# リクエストごとのレイテンシ・トークン計測（OpenTelemetry）
+# =====================================
+#
+# Dockerfile は opentelemetry-instrument で起動しているので、ここでは OpenTelemetry API から
+# トレーサーとメーターを取得するだけで、エクスポート先（ローカルの collector など）は
+# OTEL_EXPORTER_OTLP_ENDPOINT などの標準の環境変数で決まる（SDK が無ければ何もしない）。
+#
+# Strands 自身もモデル呼び出し・ツール呼び出しのスパンを出しているので、ここでは足りない部分を補う:
+# - スパン: Agent の生成（agent.create）、Graph の HTTP 呼び出し（graph.request。ツールのスパンの子になる）
+# - メトリクス: リクエスト全体・最初のテキストまで・モデル呼び出し・ツール呼び出し・Graph 呼び出しの時間、
+#   Graph のレスポンスサイズ、キャッシュのヒット/ミス、トークン数
+# - リクエストごとの集計（TurnTelemetry）: 最後の usage SSE イベントと [Turn] ログに載せる
+# - モデルの振り分け（model_router.py）: 使ったモデル（route）をリクエスト・モデル呼び出しのメトリクスの属性にする
+#
+# ツールの中の Graph 呼び出しやキャッシュからは、contextvars で現在のリクエストとツールを参照する
+# （Strands はツールをタスクで実行するが、タスクは作成時のコンテキストを引き継ぐ）。
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from opentelemetry import metrics, trace
+from strands.hooks import (
+    AfterModelCallEvent,
+    AfterToolCallEvent,
+    BeforeModelCallEvent,
+    BeforeToolCallEvent,
+    HookProvider,
+    HookRegistry,
+)
+
+from config import env_bool
+
+# 計測を有効にするか（無効でも usage イベントのトークン数は送る）
+AGENT_TELEMETRY = env_bool("AGENT_TELEMETRY", True)
+
+_tracer = trace.get_tracer("amplify.agent")
+_meter = metrics.get_meter("amplify.agent")
+
+_request_duration = _meter.create_histogram(
+    "agent.request.duration", unit="ms", description="invoke_agent 1 回の所要時間"
+)
+_first_text_duration = _meter.create_histogram(
+    "agent.time_to_first_text", unit="ms", description="最初のテキストを送るまでの時間"
+)
+_agent_create_duration = _meter.create_histogram(
+    "agent.create.duration", unit="ms", description="Agent の生成にかかった時間"
+)
+_model_call_duration = _meter.create_histogram(
+    "agent.model_call.duration", unit="ms", description="モデル呼び出し 1 回の所要時間"
+)
+_tool_call_duration = _meter.create_histogram(
+    "agent.tool_call.duration", unit="ms", description="ツール呼び出し 1 回の所要時間"
+)
+_graph_request_duration = _meter.create_histogram(
+    "graph.request.duration", unit="ms", description="Graph API 呼び出し 1 回の所要時間（リトライ込み）"
+)
+_graph_response_size = _meter.create_histogram(
+    "graph.response.size", unit="By", description="Graph API のレスポンスボディのサイズ"
+)
+_cache_lookups = _meter.create_counter(
+    "agent.cache.lookups", description="キャッシュの参照回数（cache / result 属性で分類）"
+)
+_tokens = _meter.create_counter(
+    "agent.tokens", unit="{token}", description="モデルのトークン使用量（type 属性で分類）"
+)
+
+# 使用量イベントのキー -> メトリクスの type 属性
+_TOKEN_TYPES = {
+    "inputTokens": "input",
+    "outputTokens": "output",
+    "cacheReadInputTokens": "cache_read",
+    "cacheWriteInputTokens": "cache_write",
+}
+
+
+@dataclass
+class TurnTelemetry:
+    """1 リクエスト分の計測値（usage イベントと [Turn] ログ用）"""
+
+    started: float = field(default_factory=time.perf_counter)
+    agent_create_ms: float | None = None
+    first_text_ms: float | None = None
+    model_ms: float = 0.0
+    tool_ms: float = 0.0
+    graph_requests: int = 0
+    graph_ms: float = 0.0
+    graph_bytes: int = 0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    # 使ったモデル（fast / strong。途中で切り替えた場合は fast>strong）
+    route: str | None = None
+
+    @property
+    def current_model(self) -> str:
+        """現在使っているモデル（メトリクスの model 属性）"""
+        return self.route.rsplit(">", 1)[-1] if self.route else ""
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def mark_first_text(self) -> None:
+        if self.first_text_ms is None:
+            self.first_text_ms = self.elapsed_ms()
+
+    def summary(self) -> dict:
+        """usage イベントに付ける値（ミリ秒は整数に丸める）"""
+        return {
+            "total_ms": round(self.elapsed_ms()),
+            "first_text_ms": None if self.first_text_ms is None else round(self.first_text_ms),
+            "agent_create_ms": None if self.agent_create_ms is None else round(self.agent_create_ms),
+            "model_ms": round(self.model_ms),
+            "tool_ms": round(self.tool_ms),
+            "graph_requests": self.graph_requests,
+            "graph_ms": round(self.graph_ms),
+            "graph_bytes": self.graph_bytes,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "route": self.route,
+        }
+
+
+# 現在のリクエストの計測値と、実行中のツール名
+_current_turn: ContextVar[TurnTelemetry | None] = ContextVar("current_turn", default=None)
+_current_tool: ContextVar[str | None] = ContextVar("current_tool", default=None)
+
+
+def start_turn() -> TurnTelemetry:
+    """リクエストの開始時に呼び、以降のツール・キャッシュの計測をこのリクエストに集計する"""
+    turn = TurnTelemetry()
+    _current_turn.set(turn)
+    return turn
+
+
+def finish_turn(turn: TurnTelemetry, usage: dict) -> None:
+    """リクエストの終了時に呼び、リクエスト単位のメトリクスを記録する"""
+    _current_turn.set(None)
+    if not AGENT_TELEMETRY:
+        return
+    attributes = {"route": turn.route or ""}
+    _request_duration.record(turn.elapsed_ms(), attributes)
+    if turn.first_text_ms is not None:
+        _first_text_duration.record(turn.first_text_ms, attributes)
+    for key, token_type in _TOKEN_TYPES.items():
+        if usage.get(key):
+            _tokens.add(usage[key], {"type": token_type, "model": turn.current_model})
+
+
+@contextmanager
+def agent_create_span(turn: TurnTelemetry, restored: bool):
+    """Agent の生成を計測する"""
+    started = time.perf_counter()
+    with _tracer.start_as_current_span("agent.create", attributes={"agent.restored": restored}):
+        yield
+    turn.agent_create_ms = (time.perf_counter() - started) * 1000
+    if AGENT_TELEMETRY:
+        _agent_create_duration.record(turn.agent_create_ms, {"restored": restored})
+
+
+@contextmanager
+def graph_request_span(method: str, path: str):
+    """
+    Graph の HTTP 呼び出しを計測する（ツールの中ならそのツールのスパンの子になる）
+
+    Args:
+        method: HTTP メソッド
+        path: クエリを除いたパス（例: /me/events）
+
+    使い方:
+        with graph_request_span("GET", "/me/events") as record:
+            res = await ...
+            record(res.status_code, len(res.content))
+    """
+    tool = _current_tool.get()
+    # パスは ID を含むのでスパンの属性にだけ載せ、メトリクスの属性には使わない
+    attributes = {"http.request.method": method, "url.path": path, "tool.name": tool or ""}
+    result = {"status": 0, "size": 0}
+
+    def record(status: int, size: int) -> None:
+        result["status"] = status
+        result["size"] = size
+
+    started = time.perf_counter()
+    with _tracer.start_as_current_span("graph.request", kind=trace.SpanKind.CLIENT, attributes=attributes) as span:
+        try:
+            yield record
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            span.set_attribute("http.response.status_code", result["status"])
+            span.set_attribute("http.response.body.size", result["size"])
+            turn = _current_turn.get()
+            if turn is not None:
+                turn.graph_requests += 1
+                turn.graph_ms += elapsed_ms
+                turn.graph_bytes += result["size"]
+            if AGENT_TELEMETRY:
+                metric_attributes = {"method": method, "status": result["status"], "tool": tool or ""}
+                _graph_request_duration.record(elapsed_ms, metric_attributes)
+                _graph_response_size.record(result["size"], metric_attributes)
+
+
+def record_model_route(route: str) -> None:
+    """このリクエストで使うモデルを記録する（切り替えた場合は経路として残す）"""
+    turn = _current_turn.get()
+    if turn is not None:
+        turn.route = route if turn.route is None else f"{turn.route}>{route}"
+    span = trace.get_current_span()
+    if span.is_recording():
+        span.add_event("model.route", {"route": route})
+
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    """キャッシュのヒット/ミスを記録する（cache: graph / confluence など）"""
+    turn = _current_turn.get()
+    if turn is not None:
+        if hit:
+            turn.cache_hits += 1
+        else:
+            turn.cache_misses += 1
+    if AGENT_TELEMETRY:
+        _cache_lookups.add(1, {"cache": cache, "result": "hit" if hit else "miss"})
+    span = trace.get_current_span()
+    if span.is_recording():
+        span.add_event("cache.lookup", {"cache": cache, "hit": hit})
+
+
+class TelemetryHooks(HookProvider):
+    """モデル呼び出しとツール呼び出しの時間を計測する Strands のフック"""
+
+    def __init__(self):
+        self._model_started: float | None = None
+
+    def register_hooks(self, registry: HookRegistry, **kwargs) -> None:
+        registry.add_callback(BeforeModelCallEvent, self._before_model_call)
+        registry.add_callback(AfterModelCallEvent, self._after_model_call)
+        registry.add_callback(BeforeToolCallEvent, self._before_tool_call)
+        registry.add_callback(AfterToolCallEvent, self._after_tool_call)
+
+    def _before_model_call(self, event: BeforeModelCallEvent) -> None:
+        self._model_started = time.perf_counter()
+
+    def _after_model_call(self, event: AfterModelCallEvent) -> None:
+        if self._model_started is None:
+            return
+        elapsed_ms = (time.perf_counter() - self._model_started) * 1000
+        self._model_started = None
+        turn = _current_turn.get()
+        if turn is not None:
+            turn.model_ms += elapsed_ms
+        if AGENT_TELEMETRY:
+            status = "error" if event.exception is not None else "ok"
+            model = turn.current_model if turn is not None else ""
+            _model_call_duration.record(elapsed_ms, {"status": status, "model": model})
+
+    def _before_tool_call(self, event: BeforeToolCallEvent) -> None:
+        # ツールはそれぞれのタスクで実行されるので、この値はそのツールの中からだけ見える
+        _current_tool.set(event.tool_use.get("name"))
+
+    def _after_tool_call(self, event: AfterToolCallEvent) -> None:
+        _current_tool.set(None)
+        if event.duration is None:
+            return
+        elapsed_ms = event.duration * 1000
+        turn = _current_turn.get()
+        if turn is not None:
+            turn.tool_ms += elapsed_ms
+        if AGENT_TELEMETRY:
+            attributes = {"tool": event.tool_use.get("name", ""), "status": event.result.get("status", "")}
+            _tool_call_duration.record(elapsed_ms, attributes)
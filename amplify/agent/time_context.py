@@ -0,0 +1,75 @@
+# =====================================
+# ターンごとの日時コンテキスト
+# =====================================
+#
+# 以前はシステムプロンプトで「必ず get_current_datetime を呼ぶ」ように指示していたため、
+# 新しいセッションでは実際の処理の前にツール呼び出しのためのモデル往復が 1 回余分に発生していた。
+# payload には clientNowIso / userTimeZone が既に含まれているので、
+# 現在日時・曜日・タイムゾーン（と今週の範囲）を各ターンのメッセージの先頭に入れておき、
+# モデルがツールを呼ばなくても相対表現（今日・明日・今週）を解決できるようにする。
+
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from config import env_bool
+
+# 各ターンに日時コンテキストを入れるか（無効にすると従来どおり get_current_datetime を呼ばせる）
+AGENT_TIME_CONTEXT = env_bool("AGENT_TIME_CONTEXT", True)
+# クライアントの時計がこれ以上ずれていたらサーバーの時計を使う
+CLIENT_CLOCK_TOLERANCE = timedelta(minutes=5)
+
+WEEKDAY_JP = ["月曜日", "火曜日", "水曜日", "木曜日", "金曜日", "土曜日", "日曜日"]
+
+
+def resolve_now(user_timezone: str, client_now_iso: str = "", server_now: datetime | None = None) -> datetime:
+    """
+    ユーザーのタイムゾーンでの現在日時を求める
+
+    clientNowIso（フロントエンドはオフセットなしのローカル時刻を送る）を優先し、
+    解釈できない場合やサーバーの時計と大きくずれている場合はサーバーの時計を使う
+    """
+    try:
+        tz = ZoneInfo(user_timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        print(f"[TimeContext] 不明なタイムゾーンのため UTC を使用します: {user_timezone}")
+        tz = ZoneInfo("UTC")
+    now = (server_now or datetime.now(tz)).astimezone(tz)
+    if not client_now_iso:
+        return now
+    try:
+        client_now = datetime.fromisoformat(client_now_iso.replace("Z", "+00:00"))
+    except ValueError:
+        return now
+    client_now = client_now.replace(tzinfo=tz) if client_now.tzinfo is None else client_now.astimezone(tz)
+    if abs(client_now - now) > CLIENT_CLOCK_TOLERANCE:
+        print(f"[TimeContext] クライアントの時計がずれているためサーバーの時計を使用します: {client_now_iso}")
+        return now
+    return client_now
+
+
+def build_time_context(user_timezone: str, client_now_iso: str = "", server_now: datetime | None = None) -> str:
+    """
+    モデルに渡す日時コンテキストのテキスト
+
+    例:
+        現在日時: 2026-01-15T10:00:00+09:00（木曜日）
+        タイムゾーン: Asia/Tokyo
+        明日: 2026-01-16（金曜日）
+        今週: 2026-01-12（月曜日）〜 2026-01-18（日曜日）
+    """
+    now = resolve_now(user_timezone, client_now_iso, server_now).replace(microsecond=0)
+    tomorrow = now + timedelta(days=1)
+    monday = now - timedelta(days=now.weekday())
+    sunday = monday + timedelta(days=6)
+    return "\n".join([
+        f"現在日時: {now.isoformat()}（{WEEKDAY_JP[now.weekday()]}）",
+        f"タイムゾーン: {user_timezone}",
+        f"明日: {tomorrow.date().isoformat()}（{WEEKDAY_JP[tomorrow.weekday()]}）",
+        f"今週: {monday.date().isoformat()}（月曜日）〜 {sunday.date().isoformat()}（日曜日）",
+    ])
+
+
+def with_time_context(prompt: str, user_timezone: str, client_now_iso: str = "") -> list[dict]:
+    """ユーザーの入力の前に日時コンテキストを付けた content blocks を返す（stream_async にそのまま渡せる）"""
+    context = build_time_context(user_timezone, client_now_iso)
+    return [{"text": f"<context>\n{context}\n</context>"}, {"text": prompt}]
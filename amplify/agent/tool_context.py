@@ -0,0 +1,64 @@
+# =====================================
+# ツールに渡すリクエストごとの値（アクセストークン・タイムゾーン・セッション）
+# =====================================
+#
+# 以前は invoke_agent のたびに create_graph_tools / create_todo_tools で @tool の closure を作り直し、
+# 再利用するセッションでも agent.tools = all_tools でツールを登録し直していた
+# （トークンが変わっているかもしれないため）。ツールの仕様（引数のスキーマ）の生成もそのたびに発生する。
+#
+# ツールはモジュールのトップレベルで 1 度だけ定義し、トークンなどは invoke_agent が
+# contextvars に設定した値をツールの中から読む。
+# - トークンはツールの引数にもプロンプトにも入らない（以前の closure と同じく HTTP ヘッダーにだけ付ける）
+# - Strands はツールをタスクで実行するが、タスクは作成時のコンテキストを引き継ぐので、
+#   同時に実行中の別のセッションの値が見えることはない（先読みのタスクも同じ）
+
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class ToolContext:
+    """
+    ツールから参照するリクエストの値
+
+    Attributes:
+        access_token: Microsoft Graph API のアクセストークン
+        user_timezone: ユーザーのタイムゾーン（例: Asia/Tokyo）
+        session_id: AgentCore のセッションID（デルタ同期のスナップショットの単位）
+    """
+
+    access_token: str
+    user_timezone: str
+    session_id: str | None = None
+
+    def __repr__(self) -> str:
+        # ログや例外のメッセージにトークンが出ないようにする
+        return f"ToolContext(user_timezone={self.user_timezone!r}, session_id={self.session_id!r})"
+
+
+_current_context: ContextVar[ToolContext | None] = ContextVar("tool_context", default=None)
+
+
+def set_tool_context(access_token: str, user_timezone: str, session_id: str | None = None) -> ToolContext:
+    """リクエストの開始時に呼び、以降に実行するツールがこの値を使うようにする"""
+    context = ToolContext(access_token, user_timezone, session_id)
+    _current_context.set(context)
+    return context
+
+
+def clear_tool_context() -> None:
+    """リクエストの終了時に呼ぶ"""
+    _current_context.set(None)
+
+
+def tool_context() -> ToolContext:
+    """
+    実行中のリクエストの値を返す（ツールの中から呼ぶ）
+
+    Raises:
+        RuntimeError: invoke_agent の外で呼ばれた場合（Strands がツールのエラーとしてモデルに返す）
+    """
+    context = _current_context.get()
+    if context is None:
+        raise RuntimeError("リクエストのコンテキストがありません（invoke_agent の外でツールが呼ばれました）")
+    return context
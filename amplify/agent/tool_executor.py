@@ -0,0 +1,162 @@
+# =====================================
+# ツールの並列実行（セッションごとの同時実行数の上限 + 同一リソースの順序保証）
+# =====================================
+#
+# モデルが 1 ターンで複数のツールを要求したとき（get_schedule を 2 期間 + get_task_lists など）、
+# 独立した Graph / Confluence 呼び出しは並列に実行して待ち時間を重ねる。
+# ただし以下は守る:
+#
+# - 同時実行数: 1 セッション（Agent）あたりの上限を設け、Graph のスロットリングを招かないようにする
+# - 順序: 同じリソース（同じ To Do リスト、同じ Confluence ページなど）を変更するツールは、
+#   モデルが要求した順に 1 つずつ実行する。同じリソースを読むツールも、先に要求された変更の完了を待つ
+#
+# Strands の ConcurrentToolExecutor を拡張し、各ツールの実行前に待ち合わせを入れる。
+
+import asyncio
+from typing import Callable
+
+from strands.tools.executors import ConcurrentToolExecutor
+
+from config import env_int
+
+# 1 セッションあたりのツールの同時実行数
+AGENT_TOOL_CONCURRENCY = env_int("AGENT_TOOL_CONCURRENCY", 4)
+
+# ツール名 -> 入力から、そのツールが触るリソースのキーを求める関数
+_ResourceKeys = Callable[[dict], list[str]]
+
+# 変更系のツール（同じリソースに対しては要求順に 1 つずつ実行する）
+MUTATING_TOOLS: dict[str, _ResourceKeys] = {
+    "create_meeting": lambda i: ["calendar"],
+    "create_task": lambda i: [f"todo:{i.get('list_id')}"],
+    "create_tasks": lambda i: [f"todo:{i.get('list_id')}"],
+    "update_task": lambda i: [f"todo:{i.get('list_id')}"],
+    "complete_task": lambda i: [f"todo:{i.get('list_id')}"],
+    "create_confluence_page": lambda i: [f"confluence-space:{i.get('space_key') or ''}"],
+    "update_confluence_page": lambda i: [f"confluence-page:{i.get('page_id')}"],
+}
+
+# 読み取り系のツール（先に要求された同じリソースへの変更が終わってから実行する）
+READ_TOOLS: dict[str, _ResourceKeys] = {
+    "get_schedule": lambda i: ["calendar"],
+    "find_free_slots": lambda i: ["calendar"],
+    "get_tasks": lambda i: [f"todo:{i.get('list_id')}"],
+    "get_tasks_for_lists": lambda i: [f"todo:{list_id}" for list_id in i.get("list_ids") or []],
+    "get_confluence_page": lambda i: [f"confluence-page:{i.get('page_id')}"],
+}
+
+
+def plan_tool_order(tool_uses: list[dict]) -> list[list[int]]:
+    """
+    各ツールが完了を待つべき、先行するツールの番号を求める
+
+    - 変更系: 同じリソースに触る、先に要求された全てのツールを待つ
+    - 読み取り系: 同じリソースを変更する、先に要求されたツールだけを待つ（読み取り同士は並列）
+    - どちらでもないツール（get_task_lists など）は何も待たない
+
+    Returns:
+        tool_uses と同じ長さのリスト。i 番目は i 番目のツールが待つツールの番号のリスト
+    """
+    last_write: dict[str, int] = {}
+    reads_since_write: dict[str, list[int]] = {}
+    waits: list[list[int]] = []
+    for i, tool_use in enumerate(tool_uses):
+        name = tool_use.get("name", "")
+        tool_input = tool_use.get("input") or {}
+        if not isinstance(tool_input, dict):
+            tool_input = {}
+        deps: set[int] = set()
+        if name in MUTATING_TOOLS:
+            for key in MUTATING_TOOLS[name](tool_input):
+                if key in last_write:
+                    deps.add(last_write[key])
+                deps.update(reads_since_write.pop(key, []))
+                last_write[key] = i
+        elif name in READ_TOOLS:
+            for key in READ_TOOLS[name](tool_input):
+                if key in last_write:
+                    deps.add(last_write[key])
+                reads_since_write.setdefault(key, []).append(i)
+        waits.append(sorted(deps))
+    return waits
+
+
+class BoundedConcurrentToolExecutor(ConcurrentToolExecutor):
+    """同時実行数の上限と、同じリソースへの変更の順序を守る ConcurrentToolExecutor"""
+
+    def __init__(self, max_concurrency: int = AGENT_TOOL_CONCURRENCY):
+        super().__init__()
+        self.max_concurrency = max(1, max_concurrency)
+        self._semaphore: asyncio.Semaphore | None = None
+        # toolUseId -> (待つべきイベント, 完了時にセットするイベント)
+        self._order: dict[str, tuple[list[asyncio.Event], asyncio.Event]] = {}
+
+    async def _execute(
+        self,
+        agent,
+        tool_uses,
+        tool_results,
+        cycle_trace,
+        cycle_span,
+        invocation_state,
+        structured_output_context=None,
+    ):
+        if self._semaphore is None:
+            # イベントループ上で作る（Agent はセッションごとなので、この上限はセッション単位になる）
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        done = [asyncio.Event() for _ in tool_uses]
+        for i, (tool_use, deps) in enumerate(zip(tool_uses, plan_tool_order(tool_uses))):
+            self._order[tool_use["toolUseId"]] = ([done[d] for d in deps], done[i])
+        if len(tool_uses) > 1:
+            print(f"[Tools] {len(tool_uses)} 個のツールを並列実行します (上限: {self.max_concurrency})")
+        try:
+            async for event in super()._execute(
+                agent, tool_uses, tool_results, cycle_trace, cycle_span, invocation_state, structured_output_context
+            ):
+                yield event
+        finally:
+            for tool_use in tool_uses:
+                self._order.pop(tool_use["toolUseId"], None)
+
+    async def _task(
+        self,
+        agent,
+        tool_use,
+        tool_results,
+        cycle_trace,
+        cycle_span,
+        invocation_state,
+        task_id,
+        task_queue,
+        task_event,
+        stop_event,
+        structured_output_context,
+    ) -> None:
+        waits, done = self._order.get(tool_use["toolUseId"], ([], None))
+        try:
+            for event in waits:
+                await event.wait()
+            async with self._semaphore:
+                await super()._task(
+                    agent,
+                    tool_use,
+                    tool_results,
+                    cycle_trace,
+                    cycle_span,
+                    invocation_state,
+                    task_id,
+                    task_queue,
+                    task_event,
+                    stop_event,
+                    structured_output_context,
+                )
+        finally:
+            if done is not None:
+                done.set()
+
+
+def create_tool_executor() -> BoundedConcurrentToolExecutor:
+    """Agent ごとのツール実行器を作る"""
+    return BoundedConcurrentToolExecutor(AGENT_TOOL_CONCURRENCY)
+